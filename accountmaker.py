@@ -14,6 +14,10 @@ from datetime import datetime
 from config import config
 from shared_state import user_states, user_data, pending_orders, order_counter
 import shared_state
+from callback_router import router
+from paging import cursor_from, nav_buttons, page_items
+from outbound import scheduler_for, fan_out, edit_fan_out
+from write_behind import writer_for
 logger = logging.getLogger(__name__)
 
 # اطلاعات محصول
@@ -31,17 +35,18 @@ class AccountMakerHandlers:
 
     def register_handlers(self):
         # ثبت callback handlers به صورت داینامیک
-        self.bot.callback_query_handler(func=lambda c: c.data == "account_maker")(self.show_account_types)
-        self.bot.callback_query_handler(func=lambda c: c.data == 'chatgpt_go_start_purchase')(self.start_purchase_flow)
-        self.bot.callback_query_handler(func=lambda c: c.data == "my_custom_orders")(self.show_my_orders)
+        router.add_exact("account_maker", self.show_account_types)
+        router.add_exact('chatgpt_go_start_purchase', self.start_purchase_flow)
+        router.add_exact("my_custom_orders", self.show_my_orders)
 
         # Admin handlers
-        self.bot.callback_query_handler(func=lambda c: c.data == "admin_account_maker")(self.admin_menu)
-        self.bot.callback_query_handler(func=lambda c: c.data == "admin_acc_pending_orders")(self.admin_pending_orders)
-        self.bot.callback_query_handler(func=lambda c: c.data.startswith("admin_acc_order_"))(self.admin_show_order)
-        self.bot.callback_query_handler(func=lambda c: c.data.startswith("admin_acc_approve_"))(self.admin_approve_order)
-        self.bot.callback_query_handler(func=lambda c: c.data.startswith("admin_acc_reject_"))(self.admin_reject_order)
-        self.bot.callback_query_handler(func=lambda c: c.data.startswith("admin_acc_send_"))(self.admin_deliver_order)
+        router.add_exact("admin_account_maker", self.admin_menu)
+        router.add_exact("admin_acc_pending_orders", self.admin_pending_orders)
+        router.add_prefix("admin_acc_pg_", self.admin_pending_orders)
+        router.add_prefix("admin_acc_order_", self.admin_show_order)
+        router.add_prefix("admin_acc_approve_", self.admin_approve_order)
+        router.add_prefix("admin_acc_reject_", self.admin_reject_order)
+        router.add_prefix("admin_acc_send_", self.admin_deliver_order)
 
     # ===== User flows =====
     def show_account_types(self, call):
@@ -118,7 +123,7 @@ class AccountMakerHandlers:
 
     # ===== Admin flows =====
     def admin_menu(self, call):
-        from bot_webhook import is_admin  # import محلی تا حلقه شکسته نشود
+        from shared_state import is_admin  # import محلی تا حلقه شکسته نشود
         if not is_admin(call.from_user.id):
             self.bot.answer_callback_query(call.id, "❌ دسترسی غیرمجاز!", show_alert=True)
             return
@@ -128,10 +133,11 @@ class AccountMakerHandlers:
         self.bot.edit_message_text("🛡️ **مدیریت اکانت سفارشی**", call.message.chat.id, call.message.message_id, reply_markup=markup)
 
     def admin_pending_orders(self, call):
-        from bot_webhook import is_admin
+        from shared_state import is_admin
         if not is_admin(call.from_user.id):
             return
-        orders = {oid:o for oid,o in pending_orders.items() if o['status'] in ['waiting_admin_approval','preparing']}
+        orders = [(o['created_at'], oid, (oid, o)) for oid, o in list(pending_orders.items())
+                  if o['status'] in ['waiting_admin_approval','preparing']]
         if not orders:
             markup = types.InlineKeyboardMarkup()
             markup.add(types.InlineKeyboardButton("🔙 بازگشت", callback_data="admin_account_maker"))
@@ -139,13 +145,16 @@ class AccountMakerHandlers:
             return
         text = f"📋 **سفارشات در انتظار: {len(orders)} عدد**\n\n"
         markup = types.InlineKeyboardMarkup(row_width=1)
-        for oid, o in list(orders.items())[:20]:
+        # admin_acc_pending_orders (صفحه اول) یا admin_acc_pg_{مکان‌نما}
+        page = page_items(orders, cursor_from(call, "admin_acc_pg_"))
+        for oid, o in page.rows:
             markup.add(types.InlineKeyboardButton(f"{oid} - {o.get('email','NA')[:20]}", callback_data=f"admin_acc_order_{oid}"))
+        markup.row(*nav_buttons(page, "admin_acc_pg_"))
         markup.add(types.InlineKeyboardButton("🔙 بازگشت", callback_data="admin_account_maker"))
         self.bot.edit_message_text(text, call.message.chat.id, call.message.message_id, reply_markup=markup)
 
     def admin_show_order(self, call):
-        from bot_webhook import is_admin
+        from shared_state import is_admin
         if not is_admin(call.from_user.id):
             return
         oid = call.data.replace("admin_acc_order_", "")
@@ -176,7 +185,7 @@ class AccountMakerHandlers:
         self.bot.edit_message_text(text, call.message.chat.id, call.message.message_id, reply_markup=markup)
 
     def admin_approve_order(self, call):
-        from bot_webhook import is_admin
+        from shared_state import is_admin
         if not is_admin(call.from_user.id):
             self.bot.answer_callback_query(call.id, "❌ دسترسی غیرمجاز!", show_alert=True)
             return
@@ -191,15 +200,15 @@ class AccountMakerHandlers:
         o['status'] = 'preparing'
         o['approved_by'] = call.from_user.id
         o['approved_at'] = time.time()
-        # اطلاع به مشتری
-        try:
-            self.bot.send_message(o['user_id'], f"✅ سفارش {oid} توسط ادمین تایید شد. در حال آماده‌سازی اکانت...")
-        except Exception as e:
-            logger.error(f"خطا در ارسال پیام به کاربر: {e}")
+        writer_for(self.db).audit('custom_order_approved', actor_id=call.from_user.id, target_id=o['user_id'],
+                                  details={'order_id': oid})
+        # اطلاع به مشتری (از طریق صف خروجی؛ خطا در همانجا لاگ می‌شود)
+        scheduler_for(self.bot).send_message(o['user_id'], f"✅ سفارش {oid} توسط ادمین تایید شد. در حال آماده‌سازی اکانت...")
+        update_admin_notifications(self.bot, oid, f"✅ تایید شده توسط ادمین {call.from_user.id}")
         self.bot.answer_callback_query(call.id, "✅ سفارش تایید شد!", show_alert=True)
 
     def admin_reject_order(self, call):
-        from bot_webhook import is_admin
+        from shared_state import is_admin
         if not is_admin(call.from_user.id):
             self.bot.answer_callback_query(call.id, "❌ دسترسی غیرمجاز!", show_alert=True)
             return
@@ -211,14 +220,14 @@ class AccountMakerHandlers:
         o['status'] = 'rejected'
         o['rejected_by'] = call.from_user.id
         o['rejected_at'] = time.time()
-        try:
-            self.bot.send_message(o['user_id'], f"❌ سفارش {oid} رد شد. لطفاً با ایمیل جدید دوباره تلاش کنید.")
-        except Exception as e:
-            logger.error(f"خطا در ارسال پیام به کاربر: {e}")
+        writer_for(self.db).audit('custom_order_rejected', actor_id=call.from_user.id, target_id=o['user_id'],
+                                  details={'order_id': oid})
+        scheduler_for(self.bot).send_message(o['user_id'], f"❌ سفارش {oid} رد شد. لطفاً با ایمیل جدید دوباره تلاش کنید.")
+        update_admin_notifications(self.bot, oid, f"❌ رد شده توسط ادمین {call.from_user.id}")
         self.bot.answer_callback_query(call.id, "❌ سفارش رد شد!", show_alert=True)
 
     def admin_deliver_order(self, call):
-        from bot_webhook import is_admin
+        from shared_state import is_admin
         if not is_admin(call.from_user.id):
             return
         oid = call.data.replace("admin_acc_send_", "")
@@ -238,6 +247,13 @@ class AccountMakerHandlers:
             pass
 
 # ===== مدیریت stateها (فانکشنی که bot_webhook فراخوانی می‌کند) =====
+# stateهای متعلق به این ماژول (در bot.py در state_router ثبت می‌شوند)
+ACCOUNT_MAKER_STATES = (
+    'chatgpt_go_waiting_email',
+    'chatgpt_go_waiting_password',
+    'admin_sending_account_info',
+)
+
 def handle_account_maker_states(bot, db, message, user_id, state, user_data_local) -> bool:
     """
     این تابع باید توسط bot_webhook فراخوانی شود.
@@ -305,13 +321,18 @@ def handle_account_maker_states(bot, db, message, user_id, state, user_data_loca
         pending_orders[admin_order]['account_info'] = account_info
         pending_orders[admin_order]['status'] = 'delivered'
         pending_orders[admin_order]['delivered_at'] = time.time()
-        # ارسال پیام به مشتری
-        try:
-            bot.send_message(pending_orders[admin_order]['user_id'],
-                             f"🎉 اکانت شما آماده است!\n\n{account_info}")
-            bot.send_message(message.chat.id, f"✅ اطلاعات به کاربر ارسال شد (سفارش {admin_order})")
-        except Exception as e:
-            bot.send_message(message.chat.id, f"❌ خطا در ارسال به کاربر: {e}")
+        # ارسال پیام به مشتری؛ نتیجه بعد از ارسال به ادمین گزارش می‌شود
+        outbound = scheduler_for(bot)
+        admin_chat_id = message.chat.id
+
+        def report(future, order_id=admin_order):
+            if future.exception() is None:
+                outbound.send_message(admin_chat_id, f"✅ اطلاعات به کاربر ارسال شد (سفارش {order_id})")
+            else:
+                outbound.send_message(admin_chat_id, f"❌ خطا در ارسال به کاربر: {future.exception()}")
+
+        outbound.send_message(pending_orders[admin_order]['user_id'],
+                              f"🎉 اکانت شما آماده است!\n\n{account_info}").add_done_callback(report)
         user_states.pop(user_id, None)
         user_data.pop(user_id, None)
         return True
@@ -347,14 +368,22 @@ def send_admin_approval_request(bot, order_id: str):
     markup.row(types.InlineKeyboardButton("✅ تایید", callback_data=f"admin_acc_approve_{order_id}"),
                types.InlineKeyboardButton("❌ رد", callback_data=f"admin_acc_reject_{order_id}"))
 
-    success = 0
-    for admin_id in config.admin_list:
-        try:
-            bot.send_message(admin_id, text, reply_markup=markup)
-            success += 1
-            logger.info(f"پیام به ادمین {admin_id} ارسال شد")
-        except Exception as e:
-            logger.error(f"خطا در ارسال پیام به ادمین {admin_id}: {e}")
-
-    if success == 0:
-        logger.error("هیچ ادمینی پیام را دریافت نکرد — بررسی کن config.ADMIN_IDS یا RAILWAY_PUBLIC_DOMAIN.")
+    # ارسال همزمان به همه ادمین‌ها؛ کاربر منتظر ادمین‌ها نمی‌ماند
+    result = fan_out(bot, config.admin_list, text, reply_markup=markup)
+    shared_state.admin_notifications.add(f"order:{order_id}", result)
+
+    def on_sent(done):
+        for admin_id, error in done.failed.items():
+            logger.error(f"خطا در ارسال پیام به ادمین {admin_id}: {error}")
+        if not done.sent:
+            logger.error("هیچ ادمینی پیام را دریافت نکرد — بررسی کن config.ADMIN_IDS یا RAILWAY_PUBLIC_DOMAIN.")
+        else:
+            logger.info(f"سفارش {order_id} به {len(done.sent)} ادمین ارسال شد")
+
+    result.add_done_callback(on_sent)
+
+
+def update_admin_notifications(bot, order_id: str, status_line: str):
+    """ویرایش پیام‌های سفارش نزد همه ادمین‌ها (دکمه‌ها حذف می‌شوند)"""
+    for result in shared_state.admin_notifications.pop(f"order:{order_id}"):
+        edit_fan_out(bot, result, f"🔔 سفارش ChatGPT GO\n\n🆔 شماره سفارش: {order_id}\n\n{status_line}")
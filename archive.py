@@ -0,0 +1,227 @@
+# archive.py
+"""
+بایگانی ردیف‌های قدیمی در فایل جدا (hot/cold)
+✅ تغییر مهم: zibal_transactions، crypto_transactions، support_messages و orders برای همیشه در shop.db
+می‌ماندند و هر query بدون ایندکس و هر backup با رشد تاریخچه کندتر می‌شد. حالا ردیف‌های تمام‌شده قدیمی‌تر
+از max_age_days روز به فایل بایگانی (کنار دیتابیس، {نام}_archive.db) منتقل می‌شوند.
+
+- انتقال دو مرحله‌ای برای هر batch: (1) کپی به archive (قفل نوشتن فقط روی فایل بایگانی)،
+  (2) حذف از main فقط برای idهایی که در archive هستند (تراکنش کوتاه). crash بین دو مرحله فقط ردیف
+  تکراری موقت می‌سازد که اجرای بعدی پاک می‌کند؛ ردیفی از دست نمی‌رود.
+- آمارها (stats.py) کل تاریخچه‌اند: حذف داخل stats.frozen انجام می‌شود و check/rebuild هر دو فایل را می‌شمارد.
+- با Database.attach_archive هر اتصال pool فایل بایگانی را attach می‌کند و viewهای موقت {table}_all
+  (UNION ALL هر دو فایل) را می‌سازد؛ صفحه‌های «کل تاریخچه» با history_table(db, table) از آن‌ها می‌خوانند
+  و keyset روی هر دو فایل با ایندکس (MERGE) اجرا می‌شود.
+- فضای آزادشده: اگر auto_vacuum=INCREMENTAL باشد بعد از هر اجرا به تدریج پس داده می‌شود؛
+  python archive.py vacuum <db> یکبار (آفلاین، ربات خاموش) این حالت را فعال می‌کند.
+
+python archive.py run <db> <days>: اجرای یکباره بایگانی
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = 'archive'
+
+
+class ArchivedTable(NamedTuple):
+    name: str
+    epoch: bool    # created_at عدد unix است (orders)، نه متن CURRENT_TIMESTAMP
+    settled: str   # فقط ردیف‌هایی که دیگر تغییر نمی‌کنند منتقل می‌شوند
+
+
+ARCHIVED_TABLES: List[ArchivedTable] = [
+    ArchivedTable('zibal_transactions', False, "status IN ('success', 'failed', 'canceled')"),
+    ArchivedTable('crypto_transactions', False, "payment_status IN ('finished', 'failed', 'expired', 'refunded')"),
+    # پیام خوانده‌نشده کاربر در شمارش unread است و باید قابل به‌روزرسانی بماند
+    ArchivedTable('support_messages', False, "(is_from_admin = 1 OR is_read = 1)"),
+    ArchivedTable('orders', True, "status != 'pending'"),
+]
+
+ARCHIVED_NAMES = frozenset(t.name for t in ARCHIVED_TABLES)
+
+
+def default_path(db_path: str) -> str:
+    root, ext = os.path.splitext(db_path)
+    return f"{root}_archive{ext or '.db'}"
+
+
+def history_table(db, table: str) -> str:
+    """نام جدول برای خواندن کل تاریخچه: view هر دو فایل اگر بایگانی attach شده باشد"""
+    return f"{table}_all" if getattr(db, 'archive_path', None) and table in ARCHIVED_NAMES else table
+
+
+def _columns(conn, schema: str, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+
+def _ensure_schema(conn):
+    """جداول و ایندکس‌های بایگانی از روی main (و ستون‌هایی که بعداً به main اضافه شده‌اند)"""
+    for spec in ARCHIVED_TABLES:
+        row = conn.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?",
+                           (spec.name,)).fetchone()
+        if row is None:
+            continue
+        archived = _columns(conn, SCHEMA, spec.name)
+        if not archived:
+            conn.execute(re.sub(r'^CREATE TABLE\s+("?\w+"?)', f'CREATE TABLE IF NOT EXISTS {SCHEMA}.{spec.name}',
+                                row[0], count=1))
+            for (index_sql,) in conn.execute("SELECT sql FROM main.sqlite_master WHERE type = 'index' "
+                                             "AND tbl_name = ? AND sql IS NOT NULL", (spec.name,)).fetchall():
+                conn.execute(re.sub(r'^CREATE (UNIQUE )?INDEX\s+(IF NOT EXISTS\s+)?(\w+)',
+                                    rf'CREATE \1INDEX IF NOT EXISTS {SCHEMA}.\3', index_sql, count=1))
+        else:
+            for info in conn.execute(f"PRAGMA main.table_info({spec.name})").fetchall():
+                if info[1] not in archived:
+                    conn.execute(f"ALTER TABLE {SCHEMA}.{spec.name} ADD COLUMN {info[1]} {info[2]}")
+
+
+def attach(conn, path: str):
+    """attach فایل بایگانی و ساخت viewهای موقت {table}_all روی یک اتصال (Database.attach_archive)"""
+    conn.execute(f"ATTACH DATABASE ? AS {SCHEMA}", (path,))
+    if conn.execute("PRAGMA main.journal_mode").fetchone()[0] == 'wal':
+        conn.execute(f"PRAGMA {SCHEMA}.journal_mode = WAL")
+    _ensure_schema(conn)
+    for spec in ARCHIVED_TABLES:
+        columns = ', '.join(_columns(conn, 'main', spec.name))
+        if not columns:
+            continue
+        conn.execute(f"DROP VIEW IF EXISTS temp.{spec.name}_all")
+        conn.execute(f"CREATE TEMP VIEW {spec.name}_all AS "
+                     f"SELECT {columns} FROM main.{spec.name} UNION ALL SELECT {columns} FROM {SCHEMA}.{spec.name}")
+    conn.commit()
+
+
+def _cutoff(spec: ArchivedTable, max_age_days: float):
+    if spec.epoch:
+        return int(time.time() - max_age_days * 86400)
+    # هم‌قالب CURRENT_TIMESTAMP (UTC)
+    return (datetime.now(timezone.utc) - timedelta(days=max_age_days)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def archive_batch(db, spec: ArchivedTable, cutoff, batch_size: int = 500) -> int:
+    """انتقال یک batch؛ Returns تعداد ردیف‌های حذف‌شده از main"""
+    from stats import frozen
+
+    # 1) کپی (فقط فایل بایگانی قفل نوشتن می‌گیرد)
+    with db.get_connection() as conn:
+        # ترتیب مهم نیست؛ بدون ORDER BY هر ایندکسی که شرط را پوشش دهد بدون مرتب‌سازی کافی است
+        ids = [row[0] for row in conn.execute(
+            f"SELECT id FROM main.{spec.name} WHERE created_at < ? AND {spec.settled} LIMIT ?",
+            (cutoff, batch_size))]
+        if not ids:
+            return 0
+        columns = ', '.join(_columns(conn, 'main', spec.name))
+        marks = ', '.join('?' * len(ids))
+        conn.execute(f"INSERT OR REPLACE INTO {SCHEMA}.{spec.name} ({columns}) "
+                     f"SELECT {columns} FROM main.{spec.name} WHERE id IN ({marks})", ids)
+
+    # 2) حذف از main (تراکنش کوتاه؛ شمارنده‌ها و payment_daily دست نمی‌خورند)
+    with db.get_connection() as conn:
+        with frozen(conn):
+            cursor = conn.execute(f"DELETE FROM main.{spec.name} WHERE id IN "
+                                  f"(SELECT id FROM {SCHEMA}.{spec.name} WHERE id IN ({marks}))", ids)
+    return cursor.rowcount
+
+
+def run_archive(db, max_age_days: float, batch_size: int = 500, pause: float = 0.05) -> Dict[str, int]:
+    """
+    بایگانی همه جداول تا وقتی ردیف قدیمی باقی نمانده؛ بین batchها pause ثانیه مکث تا نویسنده‌ها جلو بیفتند.
+    Returns {table: تعداد منتقل‌شده}
+    """
+    if not getattr(db, 'archive_path', None):
+        raise RuntimeError("بایگانی attach نشده است (Database.attach_archive)")
+    moved = {}
+    for spec in ARCHIVED_TABLES:
+        cutoff = _cutoff(spec, max_age_days)
+        total = 0
+        while True:
+            count = archive_batch(db, spec, cutoff, batch_size)
+            total += count
+            if count < batch_size:
+                break
+            time.sleep(pause)
+        if total:
+            moved[spec.name] = total
+    if moved:
+        logger.info(f"📦 بایگانی: {moved}")
+        _release_space(db)
+    return moved
+
+
+def _release_space(db, pages: int = 500):
+    """پس دادن صفحه‌های آزاد main به تدریج (فقط با auto_vacuum=INCREMENTAL)"""
+    with db.get_connection() as conn:
+        if conn.execute("PRAGMA main.auto_vacuum").fetchone()[0] != 2:
+            return
+    while True:
+        with db.get_connection() as conn:
+            if not conn.execute("PRAGMA main.freelist_count").fetchone()[0]:
+                return
+            conn.execute(f"PRAGMA main.incremental_vacuum({pages})").fetchall()
+
+
+def start_archiver(db, max_age_days: float, batch_size: int = 500, interval: float = 3600) -> threading.Thread:
+    """attach فایل بایگانی و (با max_age_days > 0) اجرای دوره‌ای بعد از اتمام migrationهای پس‌زمینه"""
+    from migrations import is_current
+
+    path = default_path(db.path)
+    if db.path == ':memory:' or (max_age_days <= 0 and not os.path.exists(path)):
+        return None
+    db.attach_archive(path)
+    if max_age_days <= 0:
+        return None
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                # ایندکس‌های created_at (migration پس‌زمینه) باید ساخته شده باشند
+                if is_current(db):
+                    run_archive(db, max_age_days, batch_size)
+            except Exception as e:
+                logger.error(f"خطا در بایگانی: {e}")
+
+    thread = threading.Thread(target=run, name='archiver', daemon=True)
+    thread.start()
+    return thread
+
+
+def _vacuum(path: str):
+    import sqlite3
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    conn.close()
+    print(f"✅ {path}: auto_vacuum=INCREMENTAL")
+
+
+def _run(path: str, days: float) -> int:
+    from database import Database
+
+    db = Database(path, pool_size=1)
+    db.attach_archive(default_path(path))
+    moved = run_archive(db, days)
+    for table, count in moved.items():
+        print(f"📦 {table}: {count} ردیف")
+    print(f"{sum(moved.values())} ردیف به {default_path(path)} منتقل شد")
+    db.close()
+    return 0
+
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) > 3 and sys.argv[1] == 'run':
+        sys.exit(_run(sys.argv[2], float(sys.argv[3])))
+    if len(sys.argv) > 2 and sys.argv[1] == 'vacuum':
+        _vacuum(sys.argv[2])
+        sys.exit(0)
+    print("usage: python archive.py run <db> <days> | python archive.py vacuum <db>")
+    sys.exit(2)
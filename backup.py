@@ -0,0 +1,261 @@
+# backup.py
+"""
+پشتیبان‌گیری آنلاین از دیتابیس بدون متوقف کردن ربات
+✅ تغییر مهم: برای shop.db هیچ پشتیبانی وجود نداشت و کپی فایل در حالی که threadهای Flask در آن می‌نویسند
+نسخه خراب می‌ساخت. حالا پشتیبان با backup API خود SQLite (Connection.backup) در گام‌های کوچک
+(pages صفحه در هر گام، sleep ثانیه مکث بین گام‌ها) گرفته می‌شود؛ قفل خواندن فقط در طول یک گام نگه داشته
+می‌شود و نویسنده‌ها حداکثر چند میلی‌ثانیه منتظر می‌مانند.
+
+- نوشتن اتصال دیگر وسط کار، backup را از اول شروع می‌کند و با ترافیک مداوم هیچ‌وقت تمام نمی‌شود.
+  بعد از max_restarts بار کل کپی در یک گام (یک snapshot خواندن) انجام می‌شود: در WAL (پروفایل‌های
+  throughput/durable) نویسنده‌ها بلاک نمی‌شوند؛ در rollback journal در طول کپی منتظر می‌مانند (busy_timeout).
+- هر پشتیبان با PRAGMA quick_check بررسی می‌شود و کنار آن فایل {نام}.sha256 (قالب sha256sum) نوشته می‌شود؛
+  فقط keep پشتیبان آخر هر فایل نگه داشته می‌شود.
+- اگر بایگانی (archive.py) attach شده باشد، فایل بایگانی هم با همان برچسب زمانی پشتیبان گرفته می‌شود؛
+  اول main و بعد بایگانی تا ردیفی که وسط کار منتقل می‌شود در هیچ‌کدام جا نیفتد (حداکثر تکراری می‌شود).
+
+python backup.py run <db> <dir>: یک پشتیبان همین حالا
+python backup.py verify <backup>: بررسی checksum و quick_check
+python backup.py restore <backup> <db> [--force]: بازگردانی (ربات خاموش)؛ بعد از آن ربات عادی اجرا می‌شود
+"""
+
+import glob
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+STAMP_FORMAT = '%Y%m%d-%H%M%S'
+
+
+class BackupRestarted(Exception):
+    """منبع در طول backup بارها تغییر کرد"""
+
+
+def _stem(db_path: str) -> str:
+    return os.path.splitext(os.path.basename(db_path))[0]
+
+
+def backup_name(db_path: str, stamp: str) -> str:
+    return f"{_stem(db_path)}-{stamp}.db"
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _copy(source: sqlite3.Connection, dest: sqlite3.Connection, pages: int, sleep: float, max_restarts: int):
+    restarts = 0
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal restarts, last_remaining
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > max_restarts:
+                raise BackupRestarted(f"{restarts} بار از اول شروع شد")
+        last_remaining = remaining
+
+    source.backup(dest, pages=pages, progress=progress, sleep=sleep)
+    return restarts
+
+
+def backup_file(source_path: str, dest_path: str, pages: int = 256, sleep: float = 0.01,
+                max_restarts: int = 3, timeout: float = 10.0) -> str:
+    """
+    کپی آنلاین source_path در dest_path (اول در .partial، بعد جابجایی اتمی)؛ Returns sha256 فایل
+    اتصال جدای خود را باز می‌کند تا اتصالی از pool در طول کپی گرفته نشود
+    """
+    partial = dest_path + '.partial'
+    if os.path.exists(partial):
+        os.remove(partial)
+    source = sqlite3.connect(source_path, timeout=timeout)
+    dest = sqlite3.connect(partial)
+    try:
+        try:
+            _copy(source, dest, pages, sleep, max_restarts)
+        except BackupRestarted as e:
+            if source.execute("PRAGMA journal_mode").fetchone()[0] == 'wal':
+                logger.info(f"💾 {source_path}: {e}؛ کپی در یک snapshot")
+            else:
+                logger.warning(f"💾 {source_path}: {e}؛ کپی در یک snapshot (نوشتن‌ها تا پایان کپی منتظر می‌مانند)")
+            source.backup(dest)
+        # نسخه پشتیبان فایل مستقل است (بدون -wal)
+        dest.execute("PRAGMA journal_mode = DELETE")
+        result = dest.execute("PRAGMA quick_check").fetchone()[0]
+        if result != 'ok':
+            raise sqlite3.DatabaseError(f"quick_check نسخه پشتیبان: {result}")
+    except BaseException:
+        dest.close()
+        os.remove(partial)
+        raise
+    finally:
+        source.close()
+    dest.close()
+
+    checksum = file_sha256(partial)
+    os.replace(partial, dest_path)
+    with open(dest_path + '.sha256', 'w') as f:
+        f.write(f"{checksum}  {os.path.basename(dest_path)}\n")
+    return checksum
+
+
+def list_backups(directory: str, db_path: str) -> List[str]:
+    """پشتیبان‌های یک فایل، قدیمی‌ترین اول (برچسب زمانی در نام قابل مرتب‌سازی است)"""
+    stem = _stem(db_path)
+    pattern = os.path.join(glob.escape(directory), f"{glob.escape(stem)}-*.db")
+    return sorted(path for path in glob.glob(pattern)
+                  if os.path.basename(path)[len(stem) + 1:-3].replace('-', '').isdigit())
+
+
+def prune(directory: str, db_path: str, keep: int) -> List[str]:
+    """حذف پشتیبان‌های قدیمی‌تر از keep تای آخر؛ Returns مسیرهای حذف‌شده"""
+    removed = list_backups(directory, db_path)[:-keep] if keep > 0 else []
+    for path in removed:
+        for leftover in (path, path + '.sha256'):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    return removed
+
+
+def run_backup(db, directory: str, keep: int = 7, pages: int = 256, sleep: float = 0.01,
+               max_restarts: int = 3) -> List[str]:
+    """پشتیبان main (و بایگانی attach‌شده) با یک برچسب زمانی؛ Returns مسیر فایل‌های ساخته‌شده"""
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime(STAMP_FORMAT)
+    sources = [db.path] + ([db.archive_path] if getattr(db, 'archive_path', None) else [])
+    created = []
+    for source in sources:
+        start = time.perf_counter()
+        dest = os.path.join(directory, backup_name(source, stamp))
+        checksum = backup_file(source, dest, pages=pages, sleep=sleep, max_restarts=max_restarts)
+        created.append(dest)
+        logger.info(f"💾 پشتیبان {dest} ({os.path.getsize(dest) // 1024} KB, "
+                    f"{(time.perf_counter() - start) * 1000:.0f} ms, sha256 {checksum[:12]})")
+        prune(directory, source, keep)
+    return created
+
+
+def start_backups(db, directory: str, interval: float = 21600, keep: int = 7, pages: int = 256,
+                  sleep: float = 0.01) -> Optional[threading.Thread]:
+    """پشتیبان‌گیری دوره‌ای در thread جدا (interval <= 0 یعنی غیرفعال)"""
+    if interval <= 0 or db.path == ':memory:':
+        return None
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                run_backup(db, directory, keep=keep, pages=pages, sleep=sleep)
+            except Exception as e:
+                logger.error(f"خطا در پشتیبان‌گیری: {e}")
+
+    thread = threading.Thread(target=run, name='db-backup', daemon=True)
+    thread.start()
+    return thread
+
+
+# ===== بررسی و بازگردانی =====
+
+def verify(backup_path: str) -> Optional[str]:
+    """Returns None اگر پشتیبان سالم باشد، وگرنه متن خطا"""
+    try:
+        with open(backup_path + '.sha256') as f:
+            expected = f.read().split()[0]
+    except (OSError, IndexError):
+        return "فایل sha256 پیدا نشد"
+    if file_sha256(backup_path) != expected:
+        return "checksum همخوانی ندارد"
+    conn = sqlite3.connect(f"file:{backup_path}?mode=ro", uri=True)
+    try:
+        result = conn.execute("PRAGMA quick_check").fetchone()[0]
+    finally:
+        conn.close()
+    return None if result == 'ok' else f"quick_check: {result}"
+
+
+def _archive_backup(backup_path: str) -> Optional[str]:
+    """پشتیبان بایگانی همان برچسب زمانی ({stem}_archive-{stamp}.db)"""
+    directory, name = os.path.split(backup_path)
+    stamp_length = len(datetime.now().strftime(STAMP_FORMAT))
+    stem, stamp = name[:-(stamp_length + 4)], name[-(stamp_length + 3):-3]
+    path = os.path.join(directory, f"{stem}_archive-{stamp}.db")
+    return path if os.path.exists(path) else None
+
+
+def _install(backup_path: str, target: str, stamp: str):
+    """کپی در کنار target و جابجایی اتمی؛ فایل قبلی و -wal/-shm آن کنار گذاشته می‌شوند"""
+    partial = target + '.restoring'
+    shutil.copyfile(backup_path, partial)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(target + suffix):
+            os.replace(target + suffix, f"{target}.before-restore-{stamp}{suffix}")
+    os.replace(partial, target)
+
+
+def restore(backup_path: str, target: str, force: bool = False) -> List[str]:
+    """
+    بازگردانی پشتیبان در target (و بایگانی همان برچسب در فایل بایگانی target)؛ ربات باید خاموش باشد.
+    Returns مسیر فایل‌های جایگزین‌شده
+    """
+    from archive import default_path
+
+    archive_backup = _archive_backup(backup_path)
+    plan = [(backup_path, target)] + ([(archive_backup, default_path(target))] if archive_backup else [])
+    for source, dest in plan:
+        error = verify(source)
+        if error:
+            raise ValueError(f"{source}: {error}")
+        if os.path.exists(dest) and not force:
+            raise FileExistsError(f"{dest} وجود دارد (--force برای جایگزینی)")
+
+    stamp = datetime.now(timezone.utc).strftime(STAMP_FORMAT)
+    for source, dest in plan:
+        _install(source, dest, stamp)
+    return [dest for _, dest in plan]
+
+
+def _run(path: str, directory: str) -> int:
+    from archive import default_path
+    from database import Database
+
+    db = Database(path, pool_size=1)
+    if os.path.exists(default_path(path)):
+        db.attach_archive(default_path(path))
+    for created in run_backup(db, directory, keep=0):
+        print(f"💾 {created}")
+    db.close()
+    return 0
+
+
+if __name__ == '__main__':
+    import sys
+    args = [arg for arg in sys.argv[1:] if arg != '--force']
+    if len(args) == 3 and args[0] == 'run':
+        sys.exit(_run(args[1], args[2]))
+    if len(args) == 2 and args[0] == 'verify':
+        error = verify(args[1])
+        print(f"❌ {error}" if error else "✅ سالم")
+        sys.exit(1 if error else 0)
+    if len(args) == 3 and args[0] == 'restore':
+        try:
+            restored = restore(args[1], args[2], force='--force' in sys.argv)
+        except (ValueError, FileExistsError) as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        for path in restored:
+            print(f"✅ {path}")
+        sys.exit(0)
+    print("usage: python backup.py run <db> <dir> | verify <backup> | restore <backup> <db> [--force]")
+    sys.exit(2)
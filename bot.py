@@ -4,22 +4,39 @@
 ✅ تغییر مهم: حذف polling و ست کردن webhook اتومات با RAILWAY_PUBLIC_DOMAIN یا RENDER_EXTERNAL_URL
 """
 
+import hmac
 import logging
 import os
+import signal
+import sys
 import time
 from flask import Flask, request
 import telebot
-from telebot import types
 
 from config import config
-from database import Database
-from accountmaker import AccountMakerHandlers, handle_account_maker_states
-from help import HelpHandlers, handle_help_states
-from payment_zibal import PaymentZibalHandlers, handle_payment_zibal_states
-from payment_digital import PaymentDigitalHandlers, handle_payment_digital_states
-from payment_admin import PaymentAdminHandlers, handle_payment_admin_states
+from database import Database, PRAGMA_PROFILES
+from migrations import start_background as start_background_migrations
+from accountmaker import AccountMakerHandlers, handle_account_maker_states, ACCOUNT_MAKER_STATES
+from help import HelpHandlers, handle_help_states, HELP_STATES, HELP_STATE_PREFIXES
+from payment_zibal import PaymentZibalHandlers, handle_payment_zibal_states, PAYMENT_ZIBAL_STATES
+from payment_digital import PaymentDigitalHandlers, handle_payment_digital_states, PAYMENT_DIGITAL_STATE_PREFIXES
+from payment_admin import PaymentAdminHandlers, handle_payment_admin_states, PAYMENT_ADMIN_STATES
+from broadcast import BroadcastHandlers, BroadcastDB
+from inventory import InventoryHandlers, start_reservation_sweeper
+from archive import start_archiver
+from backup import start_backups
+from update_queue import UpdateQueue
+from telegram_session import configure_session
+from outbound import scheduler_for
+from write_behind import writer_for
+from webhook_reply import ReplyCapture, install as install_webhook_reply, replyable
+from update_dedup import UpdateDeduplicator, extract_update_id
+from callback_router import router
+from paging import cursor_from, nav_buttons
+from keyboard_cache import main_menu, products_keyboard, WALLET_MENU, ADMIN_MENU, BACK_TO_MAIN
+from state_router import state_router
 
-from shared_state import user_states, user_data
+from shared_state import user_data, is_admin, get_state, clear_state
 
 # logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -28,10 +45,37 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 
 bot = telebot.TeleBot(config.bot_token.get_secret_value(), parse_mode='Markdown', threaded=False)
-telebot.apihelper.CONNECT_TIMEOUT = 30
-telebot.apihelper.READ_TIMEOUT = 60
+# همه فراخوانی‌های Bot API از یک session با connection pool و keep-alive استفاده می‌کنند
+configure_session(pool_size=max(config.telegram_pool_size, config.webhook_workers),
+                  proxy_url=config.proxy_url, connect_timeout=30, read_timeout=60)
 
-db = Database(config.database_path)
+# handlerهای تک‌فراخوانی (edit/answer/delete) پاسخ خود را در بدنه webhook برمی‌گردانند
+if config.webhook_reply_wait > 0:
+    install_webhook_reply()
+
+db = Database(config.database_path, pool_size=config.db_pool_size, pool_timeout=config.db_pool_timeout,
+              pragma_profile=config.db_pragma_profile, user_cache_size=config.user_cache_size)
+if PRAGMA_PROFILES[config.db_pragma_profile].get('journal_mode') == 'WAL':
+    db.start_checkpointer(interval=config.db_checkpoint_interval,
+                          max_wal_bytes=config.db_wal_max_mb * 1024 * 1024)
+
+# نوشتن‌های غیرحیاتی با commit گروهی — ماژول‌ها با writer_for(db) به آن دسترسی دارند
+writer = writer_for(db, interval_ms=config.write_behind_interval_ms, max_rows=config.write_behind_max_rows,
+                    durable=config.write_behind_durable)
+
+# صف پیام‌های خروجی (محدودیت flood تلگرام) — ماژول‌ها با scheduler_for(bot) به آن دسترسی دارند
+outbound = scheduler_for(bot, global_rate=config.outbound_global_rate,
+                         per_chat_rate=config.outbound_per_chat_rate,
+                         workers=config.outbound_workers, max_retries=config.outbound_max_retries)
+
+# صف updateها — webhook فقط update را در صف می‌گذارد و workerها پردازش می‌کنند
+update_queue = UpdateQueue(bot, workers=config.webhook_workers, max_size=config.webhook_queue_size,
+                           overflow=config.webhook_overflow)
+update_queue.start()
+
+# update_idهای پردازش‌شده — تکراری‌های تلگرام (retry) دوباره پردازش نمی‌شوند
+update_dedup = UpdateDeduplicator(db, writer=writer, window_seconds=config.update_dedup_window,
+                                  max_size=config.update_dedup_max_size)
 
 # register handlers
 account_maker_handlers = AccountMakerHandlers(bot, db)
@@ -49,99 +93,108 @@ payment_digital_handlers.register_handlers()
 payment_admin_handlers = PaymentAdminHandlers(bot, db)
 payment_admin_handlers.register_handlers()
 
+broadcast_handlers = BroadcastHandlers(bot, db)
+broadcast_handlers.register_handlers()
+
+inventory_handlers = InventoryHandlers(bot, db, reservation_ttl=config.reservation_ttl)
+inventory_handlers.register_handlers()
+
+# همه callbackها از طریق router (dict + trie) پخش می‌شوند
+router.install(bot)
+
+# ثبت stateهای هر ماژول — state تکراری همین‌جا خطا می‌دهد
+state_router.register(handle_account_maker_states, ACCOUNT_MAKER_STATES)
+state_router.register(handle_help_states, HELP_STATES, prefixes=HELP_STATE_PREFIXES)
+state_router.register(handle_payment_zibal_states, PAYMENT_ZIBAL_STATES)
+state_router.register(handle_payment_digital_states, prefixes=PAYMENT_DIGITAL_STATE_PREFIXES)
+state_router.register(handle_payment_admin_states, PAYMENT_ADMIN_STATES)
+
 # افزودن ادمین‌ها به دیتابیس
 for admin_id in config.admin_list:
     db.get_or_create_user(admin_id, None, is_admin=True)
 
-# helper functions
-def is_admin(user_id: int) -> bool:
-    return user_id in config.admin_list
+# migrationهای سنگین (ساخت ایندکس‌ها و ...) بعد از بالا آمدن webhook در پس‌زمینه اجرا می‌شوند
+start_background_migrations(db, delay=config.migration_delay)
+
+# رزروهای منقضی خرید به موجودی برمی‌گردند
+start_reservation_sweeper(db, interval=config.reservation_sweep_interval)
 
-def set_state(user_id: int, state: str):
-    user_states[user_id] = state
+# ردیف‌های قدیمی به فایل بایگانی منتقل می‌شوند؛ صفحه‌های تاریخچه هر دو فایل را می‌خوانند
+start_archiver(db, max_age_days=config.archive_after_days, batch_size=config.archive_batch_size,
+               interval=config.archive_interval)
 
-def get_state(user_id: int):
-    return user_states.get(user_id)
+# پشتیبان آنلاین دوره‌ای (گام‌های کوچک backup API؛ ربات متوقف نمی‌شود)
+start_backups(db, config.backup_dir, interval=config.backup_interval, keep=config.backup_keep,
+              pages=config.backup_step_pages, sleep=config.backup_step_sleep)
 
-def clear_state(user_id: int):
-    user_states.pop(user_id, None)
-    user_data.pop(user_id, None)
+# پیام‌های همگانی نیمه‌تمام (قبل از restart) از آخرین checkpoint ادامه پیدا می‌کنند
+broadcast_handlers.engine.resume_pending()
 
 # ===== handlers عمومی =====
 @bot.message_handler(commands=['start'])
 def cmd_start(message):
     clear_state(message.from_user.id)
     db.get_or_create_user(message.from_user.id, message.from_user.username)
-    markup = types.InlineKeyboardMarkup(row_width=1)
-    markup.add(
-        types.InlineKeyboardButton("🛒 لیست محصولات", callback_data="products_list"),
-        types.InlineKeyboardButton("🎯 خرید اکانت سفارشی", callback_data="account_maker"),
-        types.InlineKeyboardButton("💳 کیف پول", callback_data="wallet"),
-        types.InlineKeyboardButton("📦 سفارش‌های من", callback_data="my_orders"),
-        types.InlineKeyboardButton("💬 پشتیبانی", callback_data="help_support")
-    )
-    if is_admin(message.from_user.id):
-        markup.add(types.InlineKeyboardButton("🔧 پنل ادمین", callback_data="admin_menu"))
+    # کاربری که ربات را آنبلاک کرده دوباره در پیام‌های همگانی قرار می‌گیرد
+    with db.get_connection() as conn:
+        BroadcastDB.unblock(conn, message.from_user.id)
+    markup = main_menu(is_admin(message.from_user.id))
     bot.send_message(message.chat.id, f"🌟 سلام {message.from_user.first_name} عزیز!\nبه فروشگاه خوش آمدید.", reply_markup=markup)
 
-@bot.callback_query_handler(func=lambda call: call.data == "back_to_main")
+@router.on("back_to_main")
 def back_to_main(call):
     clear_state(call.from_user.id)
-    markup = types.InlineKeyboardMarkup(row_width=1)
-    markup.add(
-        types.InlineKeyboardButton("🛒 لیست محصولات", callback_data="products_list"),
-        types.InlineKeyboardButton("🎯 خرید اکانت سفارشی", callback_data="account_maker"),
-        types.InlineKeyboardButton("💳 کیف پول", callback_data="wallet"),
-        types.InlineKeyboardButton("📦 سفارش‌های من", callback_data="my_orders"),
-        types.InlineKeyboardButton("💬 پشتیبانی", callback_data="help_support")
-    )
-    if is_admin(call.from_user.id):
-        markup.add(types.InlineKeyboardButton("🔧 پنل ادمین", callback_data="admin_menu"))
+    markup = main_menu(is_admin(call.from_user.id))
     try:
         bot.edit_message_text("🏠 منوی اصلی:", call.message.chat.id, call.message.message_id, reply_markup=markup)
     except Exception:
         bot.send_message(call.message.chat.id, "🏠 منوی اصلی:", reply_markup=markup)
 
 # ... callbacks ساده برای products_list, wallet, my_orders, admin_menu
-@bot.callback_query_handler(func=lambda call: call.data == "products_list")
+# (@replyable: تنها edit آن‌ها در پاسخ webhook می‌رود؛ back_to_main بالا روی خطای edit پیام جدید می‌فرستد)
+@router.on("products_list")
+@replyable
 def show_products(call):
-    products = db.get_active_products()
-    markup = types.InlineKeyboardMarkup(row_width=1)
-    for product in products:
-        markup.add(types.InlineKeyboardButton(f"✅ {product['site_name']} - {product['stock_count']} عدد", callback_data=f"product_{product['id']}"))
-    markup.add(types.InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_main"))
-    bot.edit_message_text("🛒 لیست محصولات:", call.message.chat.id, call.message.message_id, reply_markup=markup)
-
-@bot.callback_query_handler(func=lambda call: call.data == "wallet")
+    # تا وقتی کاتالوگ تغییر نکرده، همان snapshot و کیبورد آماده استفاده می‌شود (بدون query محصولات)
+    catalog = db.get_catalog()
+    markup = products_keyboard.get(catalog)
+    text = "🛒 لیست محصولات:" if catalog.products else "🛒 فعلاً محصولی موجود نیست."
+    bot.edit_message_text(text, call.message.chat.id, call.message.message_id, reply_markup=markup)
+
+@router.on("wallet")
+@replyable
 def show_wallet(call):
     user = db.get_or_create_user(call.from_user.id, call.from_user.username)
     balance = user.get('balance', 0)
     text = f"💳 کیف پول شما: {balance:,} تومان"
-    markup = types.InlineKeyboardMarkup(row_width=1)
-    markup.add(types.InlineKeyboardButton("💳 پرداخت مستقیم", callback_data="payment_zibal"),
-               types.InlineKeyboardButton("💎 پرداخت با ارز دیجیتال", callback_data="payment_digital"),
-               types.InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_main"))
-    bot.edit_message_text(text, call.message.chat.id, call.message.message_id, reply_markup=markup)
+    bot.edit_message_text(text, call.message.chat.id, call.message.message_id, reply_markup=WALLET_MENU)
 
-@bot.callback_query_handler(func=lambda call: call.data == "my_orders")
+@router.on("my_orders")
+@router.on_prefix("my_orders_pg_")
+@replyable
 def show_orders(call):
-    orders = db.get_user_orders(call.from_user.id)
-    if not orders:
-        bot.edit_message_text("📦 هنوز سفارشی ندارید.", call.message.chat.id, call.message.message_id, reply_markup=types.InlineKeyboardMarkup().add(types.InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_main")))
+    page = db.get_user_orders(call.from_user.id, cursor_from(call, "my_orders_pg_"))
+    if not page.rows:
+        bot.edit_message_text("📦 هنوز سفارشی ندارید.", call.message.chat.id, call.message.message_id, reply_markup=BACK_TO_MAIN)
         return
     text = "📦 سفارش‌های شما:\n\n"
-    for o in orders[:10]:
+    for o in page.rows:
         text += f"#{o['id']} - {o['site_name']} - {o['status']}\n"
-    bot.edit_message_text(text, call.message.chat.id, call.message.message_id, reply_markup=types.InlineKeyboardMarkup().add(types.InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_main")))
+    nav = nav_buttons(page, "my_orders_pg_")
+    markup = BACK_TO_MAIN
+    if nav:
+        markup = telebot.types.InlineKeyboardMarkup()
+        markup.row(*nav)
+        markup.add(telebot.types.InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_main"))
+    bot.edit_message_text(text, call.message.chat.id, call.message.message_id, reply_markup=markup)
 
-@bot.callback_query_handler(func=lambda call: call.data == "admin_menu")
+@router.on("admin_menu")
+@replyable
 def admin_menu(call):
     if not is_admin(call.from_user.id):
         bot.answer_callback_query(call.id, "❌ دسترسی غیرمجاز", show_alert=True)
         return
-    markup = types.InlineKeyboardMarkup()
-    markup.add(types.InlineKeyboardButton("🛡️ مدیریت اکانت سفارشی", callback_data="admin_account_maker"))
-    bot.edit_message_text("🔧 پنل ادمین", call.message.chat.id, call.message.message_id, reply_markup=markup)
+    bot.edit_message_text("🔧 پنل ادمین", call.message.chat.id, call.message.message_id, reply_markup=ADMIN_MENU)
 
 # ===== message handler برای stateها =====
 @bot.message_handler(func=lambda message: True)
@@ -150,31 +203,46 @@ def handle_messages(message):
     state = get_state(user_id)
     if not state:
         return
-    # هر ماژول اگر state مربوطه را پردازش کرد True برگرداند
-    if handle_account_maker_states(bot, db, message, user_id, state, user_data):
-        return
-    if handle_help_states(bot, db, message, user_id, state, user_data):
-        return
-    if handle_payment_zibal_states(bot, db, message, user_id, state, user_data):
-        return
-    if handle_payment_digital_states(bot, db, message, user_id, state, user_data):
-        return
-    if handle_payment_admin_states(bot, db, message, user_id, state, user_data):
-        return
-    # اگر هیچکدام پردازش نکردند، پیام را نادیده بگیر
+    # پیام مستقیم به handler مالک state می‌رسد؛ state ناشناخته نادیده گرفته می‌شود
+    state_router.dispatch(bot, db, message, user_id, state, user_data)
 
 # ===== webhook routes =====
 @app.route('/', methods=['GET', 'HEAD'])
 def index():
     return 'OK', 200
 
+@app.route('/stats', methods=['GET'])
+def stats():
+    # جزئیات داخلی (صف، pool، cache) روی دامنه عمومی webhook؛ فقط با توکن
+    token = config.stats_token.get_secret_value() if config.stats_token else ''
+    if not token or not hmac.compare_digest(request.headers.get('X-Stats-Token', ''), token):
+        return 'Not Found', 404
+    return {'update_queue': update_queue.stats(), 'update_dedup': update_dedup.stats(),
+            'outbound': outbound.stats(), 'db_pool': db.pool.stats(), 'user_cache': db.users.stats(),
+            'catalog': db.catalog.stats(),
+            'write_behind': writer.stats(),
+            'db_wal': {'bytes': db.wal_size(), 'checkpoints': db.checkpoints, 'busy': db.checkpoint_busy}}, 200
+
 @app.route('/webhook', methods=['POST'])
 def webhook():
     try:
         if request.headers.get('content-type') == 'application/json':
             json_string = request.get_data().decode('utf-8')
+            update_id = extract_update_id(json_string)
+            if update_id is not None and not update_dedup.check_and_mark(update_id):
+                # تکراری (retry تلگرام) — بدون پردازش تایید می‌شود
+                return '', 200
             update = telebot.types.Update.de_json(json_string)
-            bot.process_new_updates([update])
+            reply = ReplyCapture() if config.webhook_reply_wait > 0 else None
+            if not update_queue.submit(update, reply=reply):
+                # صف پر است؛ تلگرام بعداً دوباره ارسال می‌کند
+                update_dedup.forget(update_id)
+                return 'Busy', 503
+            if reply is not None:
+                # اگر handler دقیقاً یک فراخوانی قابل انتقال داشت، همان در پاسخ برمی‌گردد
+                body = reply.wait_for_reply(config.webhook_reply_wait)
+                if body is not None:
+                    return body, 200
             return '', 200
         else:
             logger.warning("Invalid content type")
@@ -207,5 +275,7 @@ if __name__ == '__main__':
             logger.warning("No public domain found. Set RAILWAY_PUBLIC_DOMAIN or RENDER_EXTERNAL_URL.")
     except Exception as e:
         logger.error("Error while starting bot", exc_info=True)
+    # SIGTERM (restart در Railway/Render) مثل خروج عادی: atexit صف write-behind را flush می‌کند
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     port = int(os.environ.get('PORT', 8000))
     app.run(host='0.0.0.0', port=port, debug=False, threaded=True)
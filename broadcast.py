@@ -0,0 +1,376 @@
+# broadcast.py
+"""
+ارسال پیام همگانی به همه کاربران
+✅ تغییر مهم: گیرنده‌ها به صورت تکه‌تکه (keyset روی users.id) از دیتابیس خوانده می‌شوند و از طریق
+صف خروجی (outbound، اولویت bulk) فرستاده می‌شوند تا پاسخ به کاربران عقب نماند.
+✅ پیشرفت بعد از هر تکه ذخیره می‌شود؛ بعد از restart کار از همان‌جا ادامه پیدا می‌کند.
+✅ چت‌هایی که ربات را بلاک کرده‌اند یا حذف شده‌اند در blocked_chats ثبت و دفعات بعد رد می‌شوند.
+✅ /broadcast_waitlist <پیام>: فقط به کاربرانی که در حالت تعمیر (update.py) پیام داده‌اند
+(maintenance_waitlist)؛ هر کاربری که پیام را گرفته (یا ربات را بلاک کرده) در همان تراکنش checkpoint
+تکه‌اش از لیست انتظار حذف می‌شود؛ کسی که وسط ارسال به لیست اضافه شده و پیام نگرفته می‌ماند.
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, Any, List, Optional
+
+from telebot import types
+from telebot.apihelper import ApiTelegramException
+
+from callback_router import router
+from outbound import fan_out
+from write_behind import writer_for
+
+logger = logging.getLogger(__name__)
+
+# گیرنده‌ها (ستون broadcasts.audience): (کلید keyset، chat_id) به ترتیب کلید
+AUDIENCES = {
+    'users': """
+        SELECT u.id, u.telegram_id FROM users u
+        WHERE u.id > ?
+          AND NOT EXISTS (SELECT 1 FROM blocked_chats b WHERE b.chat_id = u.telegram_id)
+        ORDER BY u.id
+        LIMIT ?
+    """,
+    'waitlist': """
+        SELECT w.user_id, w.user_id FROM maintenance_waitlist w
+        WHERE w.user_id > ?
+          AND NOT EXISTS (SELECT 1 FROM blocked_chats b WHERE b.chat_id = w.user_id)
+        ORDER BY w.user_id
+        LIMIT ?
+    """,
+}
+
+# ===== DATABASE METHODS =====
+
+class BroadcastDB:
+    """متدهای دیتابیس برای پیام همگانی"""
+
+    @staticmethod
+    def init_tables(conn):
+        """ایجاد جداول مورد نیاز"""
+
+        # کارهای ارسال همگانی و نقطه ادامه (last_user_id)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS broadcasts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                text TEXT NOT NULL,
+                created_by INTEGER,
+                status TEXT DEFAULT 'running',
+                last_user_id INTEGER DEFAULT 0,
+                total INTEGER DEFAULT 0,
+                sent INTEGER DEFAULT 0,
+                failed INTEGER DEFAULT 0,
+                blocked INTEGER DEFAULT 0,
+                started_at REAL,
+                updated_at REAL,
+                finished_at REAL
+            )
+        """)
+
+        # چت‌هایی که دیگر قابل ارسال نیستند (بلاک/حذف اکانت)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS blocked_chats (
+                chat_id INTEGER PRIMARY KEY,
+                reason TEXT,
+                blocked_at REAL
+            )
+        """)
+
+    @staticmethod
+    def count_recipients(conn, audience: str = 'users') -> int:
+        if audience == 'waitlist':
+            cursor = conn.execute("""
+                SELECT COUNT(*) FROM maintenance_waitlist w
+                WHERE NOT EXISTS (SELECT 1 FROM blocked_chats b WHERE b.chat_id = w.user_id)
+            """)
+        else:
+            cursor = conn.execute("""
+                SELECT COUNT(*) FROM users u
+                WHERE NOT EXISTS (SELECT 1 FROM blocked_chats b WHERE b.chat_id = u.telegram_id)
+            """)
+        return cursor.fetchone()[0]
+
+    @staticmethod
+    def create(conn, text: str, admin_id: int, total: int, audience: str = 'users') -> int:
+        now = time.time()
+        cursor = conn.execute("""
+            INSERT INTO broadcasts (text, created_by, status, total, started_at, updated_at, audience)
+            VALUES (?, ?, 'running', ?, ?, ?, ?)
+        """, (text, admin_id, total, now, now, audience))
+        return cursor.lastrowid
+
+    @staticmethod
+    def get(conn, broadcast_id: int) -> Optional[Dict[str, Any]]:
+        cursor = conn.execute("SELECT * FROM broadcasts WHERE id = ?", (broadcast_id,))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        columns = [d[0] for d in cursor.description]
+        return dict(zip(columns, row))
+
+    @staticmethod
+    def get_running_ids(conn) -> List[int]:
+        cursor = conn.execute("SELECT id FROM broadcasts WHERE status = 'running' ORDER BY id")
+        return [row[0] for row in cursor.fetchall()]
+
+    @staticmethod
+    def next_chunk(conn, after_user_id: int, limit: int, audience: str = 'users') -> List[tuple]:
+        """(کلید، chat_id) بعد از نقطه ادامه؛ بدون OFFSET"""
+        cursor = conn.execute(AUDIENCES[audience], (after_user_id, limit))
+        return [tuple(row) for row in cursor.fetchall()]
+
+    @staticmethod
+    def clear_waitlist(conn, user_ids: List[int]):
+        """کاربرانی که پیام پایان تعمیر را گرفته‌اند از لیست انتظار حذف می‌شوند"""
+        if user_ids:
+            conn.execute(f"DELETE FROM maintenance_waitlist WHERE user_id IN ({', '.join('?' * len(user_ids))})",
+                         list(user_ids))
+
+    @staticmethod
+    def checkpoint(conn, broadcast_id: int, last_user_id: int, sent: int, failed: int, blocked: int):
+        conn.execute("""
+            UPDATE broadcasts
+            SET last_user_id = ?, sent = sent + ?, failed = failed + ?, blocked = blocked + ?, updated_at = ?
+            WHERE id = ?
+        """, (last_user_id, sent, failed, blocked, time.time(), broadcast_id))
+
+    @staticmethod
+    def set_status(conn, broadcast_id: int, status: str):
+        finished_at = time.time() if status in ('done', 'cancelled') else None
+        conn.execute("""
+            UPDATE broadcasts SET status = ?, updated_at = ?, finished_at = COALESCE(?, finished_at)
+            WHERE id = ?
+        """, (status, time.time(), finished_at, broadcast_id))
+
+    @staticmethod
+    def mark_blocked(conn, chats: Dict[int, str]):
+        now = time.time()
+        conn.executemany("""
+            INSERT OR REPLACE INTO blocked_chats (chat_id, reason, blocked_at) VALUES (?, ?, ?)
+        """, [(chat_id, reason, now) for chat_id, reason in chats.items()])
+
+    @staticmethod
+    def unblock(conn, chat_id: int) -> bool:
+        """
+        کاربری که دوباره /start زده قابل ارسال است. Returns True اگر بلاک بود
+        (روی هر /start صدا زده می‌شود؛ فقط وقتی ردیف هست تراکنش نوشتن باز می‌شود)
+        """
+        if conn.execute("SELECT 1 FROM blocked_chats WHERE chat_id = ?", (chat_id,)).fetchone() is None:
+            return False
+        conn.execute("DELETE FROM blocked_chats WHERE chat_id = ?", (chat_id,))
+        return True
+
+
+def blocked_reason(error: Exception) -> Optional[str]:
+    """اگر خطا یعنی چت دیگر قابل ارسال نیست، دلیل را برمی‌گرداند"""
+    if not isinstance(error, ApiTelegramException):
+        return None
+    description = (error.description or '').lower()
+    if error.error_code == 403:
+        return description or 'forbidden'
+    if error.error_code == 400 and 'chat not found' in description:
+        return description
+    return None
+
+
+# ===== ENGINE =====
+
+class BroadcastEngine:
+    """اجرای کارهای همگانی در thread جداگانه؛ هر تکه بعد از ارسال checkpoint می‌شود"""
+
+    def __init__(self, bot, db, chunk_size: int = 200, chunk_timeout: float = 300):
+        self.bot = bot
+        self.db = db
+        self.chunk_size = chunk_size
+        self.chunk_timeout = chunk_timeout
+        self._threads: Dict[int, threading.Thread] = {}
+        self._lock = threading.Lock()
+
+    def start(self, broadcast_id: int):
+        with self._lock:
+            thread = self._threads.get(broadcast_id)
+            if thread is not None and thread.is_alive():
+                return
+            thread = threading.Thread(target=self._run, args=(broadcast_id,),
+                                      name=f"broadcast-{broadcast_id}", daemon=True)
+            self._threads[broadcast_id] = thread
+            thread.start()
+
+    def resume_pending(self):
+        """ادامه کارهای نیمه‌تمام بعد از restart"""
+        with self.db.get_connection() as conn:
+            running = BroadcastDB.get_running_ids(conn)
+        for broadcast_id in running:
+            logger.info(f"▶️ ادامه پیام همگانی {broadcast_id} از آخرین checkpoint")
+            self.start(broadcast_id)
+
+    def _run(self, broadcast_id: int):
+        try:
+            while True:
+                with self.db.get_connection() as conn:
+                    job = BroadcastDB.get(conn, broadcast_id)
+                    if not job or job['status'] != 'running':
+                        return
+                    chunk = BroadcastDB.next_chunk(conn, job['last_user_id'], self.chunk_size, job['audience'])
+                if not chunk:
+                    with self.db.get_connection() as conn:
+                        BroadcastDB.set_status(conn, broadcast_id, 'done')
+                    logger.info(f"✅ پیام همگانی {broadcast_id} تمام شد")
+                    return
+
+                # تکه فعلی در صورت restart وسط ارسال دوباره فرستاده می‌شود (حداکثر یک تکه تکراری)
+                result = fan_out(self.bot, [chat_id for _, chat_id in chunk], job['text']).wait(self.chunk_timeout)
+                sent = result.sent  # یک بار؛ ارسال دیرتر از مهلت هم بعداً اینجا ظاهر می‌شود
+                blocked = {}
+                failed = 0
+                for chat_id, error in result.failed.items():
+                    reason = blocked_reason(error)
+                    if reason:
+                        blocked[chat_id] = reason
+                    else:
+                        failed += 1
+                # ارسال‌هایی که در مهلت تمام نشدند خطا حساب می‌شوند
+                failed += len(chunk) - len(sent) - len(result.failed)
+
+                with self.db.get_connection() as conn:
+                    if blocked:
+                        BroadcastDB.mark_blocked(conn, blocked)
+                    if job['audience'] == 'waitlist':
+                        # خطاهای موقت در لیست می‌مانند تا پیام بعدی
+                        reached = set(sent) | set(blocked)
+                        BroadcastDB.clear_waitlist(conn, [key for key, chat_id in chunk if chat_id in reached])
+                    BroadcastDB.checkpoint(conn, broadcast_id, chunk[-1][0], len(sent), failed, len(blocked))
+        except Exception as e:
+            logger.error(f"خطا در پیام همگانی {broadcast_id}: {e}", exc_info=True)
+            with self.db.get_connection() as conn:
+                BroadcastDB.set_status(conn, broadcast_id, 'paused')
+
+    def progress(self, broadcast_id: int) -> Optional[Dict[str, Any]]:
+        """وضعیت + سرعت (پیام در ثانیه) و زمان تخمینی باقی‌مانده"""
+        with self.db.get_connection() as conn:
+            job = BroadcastDB.get(conn, broadcast_id)
+        if not job:
+            return None
+        done = job['sent'] + job['failed'] + job['blocked']
+        end = job['finished_at'] or time.time()
+        elapsed = max(end - job['started_at'], 0.001)
+        rate = done / elapsed
+        remaining = max(job['total'] - done, 0)
+        job.update({
+            'done': done,
+            'rate': rate,
+            'eta_seconds': remaining / rate if rate and job['status'] == 'running' else None,
+        })
+        return job
+
+
+# ===== HANDLERS =====
+
+class BroadcastHandlers:
+    """دستور /broadcast و دکمه‌های وضعیت برای ادمین"""
+
+    def __init__(self, bot, db):
+        self.bot = bot
+        self.db = db
+        self.engine = BroadcastEngine(bot, db)
+
+    def register_handlers(self):
+        """ثبت handlers"""
+        self.bot.message_handler(commands=['broadcast', 'broadcast_waitlist'])(self.cmd_broadcast)
+        router.add_prefix("broadcast_status_", self.show_status)
+        router.add_prefix("broadcast_cancel_", self.cancel)
+        router.add_prefix("broadcast_resume_", self.resume)
+
+    def cmd_broadcast(self, message):
+        """دستور /broadcast <متن پیام> (همه کاربران) یا /broadcast_waitlist <متن پیام> (لیست انتظار تعمیر)"""
+        from shared_state import is_admin
+
+        if not is_admin(message.from_user.id):
+            return
+
+        parts = message.text.split(maxsplit=1)
+        command = parts[0][1:].split('@')[0]
+        if len(parts) < 2:
+            self.bot.send_message(message.chat.id, f"❌ فرمت صحیح:\n`/{command} <پیام>`")
+            return
+        audience = 'waitlist' if command == 'broadcast_waitlist' else 'users'
+
+        with self.db.get_connection() as conn:
+            total = BroadcastDB.count_recipients(conn, audience)
+            broadcast_id = BroadcastDB.create(conn, parts[1], message.from_user.id, total, audience)
+        self.engine.start(broadcast_id)
+        writer_for(self.db).audit('broadcast_started', actor_id=message.from_user.id,
+                                  details={'broadcast_id': broadcast_id, 'recipients': total,
+                                           'audience': audience})
+
+        self.bot.send_message(
+            message.chat.id,
+            f"📣 پیام همگانی #{broadcast_id} برای {total:,} کاربر شروع شد.",
+            reply_markup=self._status_markup(broadcast_id, 'running')
+        )
+
+    def show_status(self, call):
+        from shared_state import is_admin
+
+        if not is_admin(call.from_user.id):
+            return
+        broadcast_id = int(call.data.replace("broadcast_status_", ""))
+        job = self.engine.progress(broadcast_id)
+        if not job:
+            self.bot.answer_callback_query(call.id, "❌ یافت نشد!", show_alert=True)
+            return
+
+        status_names = {'running': '🟢 در حال ارسال', 'paused': '⏸ متوقف', 'done': '✅ تمام شده',
+                        'cancelled': '❌ لغو شده'}
+        eta = f"{int(job['eta_seconds'] // 60)} دقیقه و {int(job['eta_seconds'] % 60)} ثانیه" \
+            if job['eta_seconds'] is not None else "-"
+        text = (
+            f"📣 **پیام همگانی #{broadcast_id}**\n\n"
+            f"📊 وضعیت: {status_names.get(job['status'], job['status'])}\n"
+            f"📨 ارسال شده: {job['sent']:,} از {job['total']:,}\n"
+            f"🚫 بلاک/حذف شده: {job['blocked']:,}\n"
+            f"⚠️ خطا: {job['failed']:,}\n"
+            f"⚡ سرعت: {job['rate']:.1f} پیام در ثانیه\n"
+            f"⏳ زمان باقی‌مانده: {eta}"
+        )
+        try:
+            self.bot.edit_message_text(text, call.message.chat.id, call.message.message_id,
+                                       reply_markup=self._status_markup(broadcast_id, job['status']))
+        except Exception:
+            pass  # متن تغییری نکرده
+        self.bot.answer_callback_query(call.id)
+
+    def cancel(self, call):
+        self._set_status(call, "broadcast_cancel_", 'cancelled')
+
+    def resume(self, call):
+        broadcast_id = self._set_status(call, "broadcast_resume_", 'running')
+        if broadcast_id:
+            self.engine.start(broadcast_id)
+
+    def _set_status(self, call, prefix: str, status: str) -> Optional[int]:
+        from shared_state import is_admin
+
+        if not is_admin(call.from_user.id):
+            return None
+        broadcast_id = int(call.data.replace(prefix, ""))
+        with self.db.get_connection() as conn:
+            BroadcastDB.set_status(conn, broadcast_id, status)
+        writer_for(self.db).audit(f'broadcast_{status}', actor_id=call.from_user.id,
+                                  details={'broadcast_id': broadcast_id})
+        call.data = f"broadcast_status_{broadcast_id}"
+        self.show_status(call)
+        return broadcast_id
+
+    @staticmethod
+    def _status_markup(broadcast_id: int, status: str):
+        markup = types.InlineKeyboardMarkup(row_width=2)
+        buttons = [types.InlineKeyboardButton("🔄 بروزرسانی", callback_data=f"broadcast_status_{broadcast_id}")]
+        if status == 'running':
+            buttons.append(types.InlineKeyboardButton("❌ لغو", callback_data=f"broadcast_cancel_{broadcast_id}"))
+        elif status == 'paused':
+            buttons.append(types.InlineKeyboardButton("▶️ ادامه", callback_data=f"broadcast_resume_{broadcast_id}"))
+        markup.add(*buttons)
+        return markup
@@ -0,0 +1,179 @@
+# callback_router.py
+"""
+مسیریاب callback_data با هزینه ثابت
+✅ تغییر مهم: به جای زنجیره lambdaهای telebot (c.data == ... / startswith ...) که برای هر کلیک
+یکی‌یکی اجرا می‌شوند، تطبیق دقیق با dict و تطبیق پیشوندی با trie انجام می‌شود.
+فقط یک handler در telebot ثبت می‌شود و همه callbackها از اینجا پخش می‌شوند.
+
+اجرای مستقیم فایل (python callback_router.py) بنچمارک مقایسه با روش قبلی را اجرا می‌کند.
+"""
+
+import logging
+from typing import Callable, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+_VALUE = object()  # کلید مقدار در نودهای trie
+
+
+class DispatchIndex:
+    """ایندکس کلید -> مقدار: تطبیق دقیق در dict و طولانی‌ترین پیشوند در trie"""
+
+    def __init__(self, name: str = 'index'):
+        self.name = name
+        self._exact: Dict[str, Any] = {}
+        self._trie: Dict[Any, Any] = {}
+        self._prefixes: Dict[str, Any] = {}
+
+    def add_exact(self, key: str, value):
+        if key in self._exact:
+            raise ValueError(f"{self.name}: کلید تکراری {key!r}")
+        self._exact[key] = value
+
+    def add_prefix(self, prefix: str, value):
+        if not prefix:
+            raise ValueError(f"{self.name}: پیشوند خالی مجاز نیست")
+        if prefix in self._prefixes:
+            raise ValueError(f"{self.name}: پیشوند تکراری {prefix!r}")
+        node = self._trie
+        for ch in prefix:
+            node = node.setdefault(ch, {})
+        node[_VALUE] = value
+        self._prefixes[prefix] = value
+
+    def lookup(self, key: str):
+        """اول تطبیق دقیق، بعد طولانی‌ترین پیشوند. اگر پیدا نشد None"""
+        value = self._exact.get(key)
+        if value is not None:
+            return value
+        node = self._trie
+        found = None
+        for ch in key:
+            node = node.get(ch)
+            if node is None:
+                break
+            value = node.get(_VALUE)
+            if value is not None:
+                found = value
+        return found
+
+    def __len__(self):
+        return len(self._exact) + len(self._prefixes)
+
+
+class CallbackRouter(DispatchIndex):
+    """پخش callback_queryها به handler مربوطه"""
+
+    def __init__(self):
+        super().__init__('callback_router')
+        self.unmatched = 0
+
+    # ثبت به شکل decorator (برای bot.py)
+    def on(self, data: str) -> Callable:
+        def decorator(handler):
+            self.add_exact(data, handler)
+            return handler
+        return decorator
+
+    def on_prefix(self, prefix: str) -> Callable:
+        def decorator(handler):
+            self.add_prefix(prefix, handler)
+            return handler
+        return decorator
+
+    def dispatch(self, call):
+        handler = self.lookup(call.data) if call.data else None
+        if handler is None:
+            self.unmatched += 1
+            logger.debug(f"callback بدون handler: {call.data!r}")
+            return
+        handler(call)
+
+    def install(self, bot):
+        """ثبت تنها handler مورد نیاز در telebot"""
+        bot.callback_query_handler(func=lambda call: True)(self.dispatch)
+
+
+# نمونه مشترک بین همه ماژول‌ها (مثل shared_state)
+router = CallbackRouter()
+
+
+# ===== BENCHMARK =====
+
+# callbackهای ثبت‌شده در ربات به همان ترتیب register_handlers ها: (نوع، مقدار)
+_REGISTRATIONS = [
+    ('exact', 'account_maker'), ('exact', 'chatgpt_go_start_purchase'), ('exact', 'my_custom_orders'),
+    ('exact', 'admin_account_maker'), ('exact', 'admin_acc_pending_orders'),
+    ('prefix', 'admin_acc_order_'), ('prefix', 'admin_acc_approve_'), ('prefix', 'admin_acc_reject_'),
+    ('prefix', 'admin_acc_send_'), ('prefix', 'admin_acc_pg_'),
+    ('exact', 'help_support'), ('exact', 'help_view_messages'), ('exact', 'help_send_message'),
+    ('exact', 'admin_support_panel'), ('exact', 'admin_view_tickets'), ('prefix', 'admin_ticket_'),
+    ('prefix', 'admin_reply_'), ('prefix', 'admin_close_'), ('prefix', 'admin_tickets_pg_'),
+    ('exact', 'payment_zibal'), ('prefix', 'zibal_amount_'), ('prefix', 'zibal_custom_amount'),
+    ('exact', 'zibal_transactions'),
+    ('exact', 'payment_digital'), ('prefix', 'crypto_select_'), ('prefix', 'crypto_amount_'),
+    ('prefix', 'crypto_custom_amount_'), ('prefix', 'crypto_pay_'), ('prefix', 'crypto_check_'),
+    ('exact', 'crypto_transactions'),
+    ('exact', 'admin_payments'), ('exact', 'admin_payment_zibal_settings'), ('exact', 'admin_zibal_toggle'),
+    ('exact', 'admin_zibal_set_merchant'), ('exact', 'admin_zibal_set_callback'),
+    ('exact', 'admin_zibal_set_limits'), ('exact', 'admin_zibal_transactions'), ('prefix', 'admin_zibal_tx_'),
+    ('prefix', 'admin_zibal_pg_'),
+    ('exact', 'admin_payment_crypto_settings'), ('exact', 'admin_crypto_toggle'),
+    ('exact', 'admin_crypto_set_api'), ('exact', 'admin_crypto_set_callback'),
+    ('exact', 'admin_crypto_test_api'), ('exact', 'admin_crypto_transactions'),
+    ('prefix', 'admin_crypto_tx_'), ('prefix', 'admin_crypto_pg_'), ('exact', 'admin_payment_statistics'),
+    ('prefix', 'admin_payment_report_'),
+    ('prefix', 'admin_verify_zibal_'), ('prefix', 'admin_verify_crypto_'),
+    ('exact', 'back_to_main'), ('exact', 'products_list'), ('exact', 'wallet'), ('exact', 'my_orders'),
+    ('prefix', 'my_orders_pg_'),
+    ('exact', 'admin_menu'),
+]
+
+
+def _benchmark(rounds: int = 20000):
+    import json
+    import time
+    import telebot
+    from telebot import types
+
+    def make_bot():
+        return telebot.TeleBot('0:benchmark', threaded=False)
+
+    def noop(call):
+        pass
+
+    # روش قبلی: یک lambda برای هر callback
+    linear_bot = make_bot()
+    for kind, value in _REGISTRATIONS:
+        if kind == 'exact':
+            linear_bot.callback_query_handler(func=lambda c, v=value: c.data == v)(noop)
+        else:
+            linear_bot.callback_query_handler(func=lambda c, v=value: c.data.startswith(v))(noop)
+
+    # روش جدید: یک handler + router
+    indexed_bot = make_bot()
+    bench_router = CallbackRouter()
+    for kind, value in _REGISTRATIONS:
+        (bench_router.add_exact if kind == 'exact' else bench_router.add_prefix)(value, noop)
+    bench_router.install(indexed_bot)
+
+    def make_call(data):
+        return types.CallbackQuery.de_json(json.dumps({
+            'id': '1', 'chat_instance': '1', 'data': data,
+            'from': {'id': 1, 'is_bot': False, 'first_name': 'b'},
+        }))
+
+    print(f"{'callback_data':<28}{'linear (µs)':>14}{'indexed (µs)':>14}")
+    for data in ('account_maker', 'admin_zibal_transactions', 'admin_verify_crypto_42', 'admin_menu'):
+        call = make_call(data)
+        timings = []
+        for bot in (linear_bot, indexed_bot):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                bot.process_new_callback_query([call])
+            timings.append((time.perf_counter() - start) / rounds * 1e6)
+        print(f"{data:<28}{timings[0]:>14.2f}{timings[1]:>14.2f}")
+
+
+if __name__ == '__main__':
+    _benchmark()
@@ -17,6 +17,71 @@ class Settings(BaseSettings):
     nowpayments_callback_url: Optional[str] = Field(None, env='NOWPAYMENTS_CALLBACK_URL')
     usd_to_toman_rate: int = Field(65000, env='USD_TO_TOMAN_RATE')
 
+    # pool اتصال‌های دیتابیس: تعداد اتصال و حداکثر انتظار برای گرفتن اتصال (ثانیه)
+    db_pool_size: int = Field(5, env='DB_POOL_SIZE')
+    db_pool_timeout: float = Field(10.0, env='DB_POOL_TIMEOUT')
+
+    # پروفایل PRAGMA دیتابیس (default / throughput / durable — تعریف در database.PRAGMA_PROFILES)
+    # و سیاست checkpoint فایل WAL: فاصله (ثانیه) و حجمی که بعد از آن WAL کوتاه می‌شود (MB)
+    db_pragma_profile: str = Field('throughput', env='DB_PRAGMA_PROFILE')
+    db_checkpoint_interval: float = Field(60, env='DB_CHECKPOINT_INTERVAL')
+    db_wal_max_mb: int = Field(64, env='DB_WAL_MAX_MB')
+
+    # صف write-behind برای نوشتن‌های غیرحیاتی (پیام پشتیبانی، audit):
+    # commit گروهی هر interval میلی‌ثانیه یا هر max_rows ردیف؛ durable=True یعنی fsync کامل هر batch
+    write_behind_interval_ms: int = Field(50, env='WRITE_BEHIND_INTERVAL_MS')
+    write_behind_max_rows: int = Field(200, env='WRITE_BEHIND_MAX_ROWS')
+    write_behind_durable: bool = Field(False, env='WRITE_BEHIND_DURABLE')
+
+    # تعداد ردیف‌های users نگه داشته‌شده در حافظه (LRU)؛ 0 یعنی بدون cache
+    user_cache_size: int = Field(10000, env='USER_CACHE_SIZE')
+
+    # رزرو اکانت بین زدن دکمه خرید و تایید پرداخت (ثانیه) و فاصله آزادسازی رزروهای منقضی
+    reservation_ttl: int = Field(120, env='RESERVATION_TTL')
+    reservation_sweep_interval: float = Field(5.0, env='RESERVATION_SWEEP_INTERVAL')
+
+    # بایگانی ردیف‌های تمام‌شده قدیمی‌تر از archive_after_days روز در {database}_archive.db (0 = غیرفعال)،
+    # اندازه هر batch و فاصله اجرا (ثانیه)
+    archive_after_days: int = Field(180, env='ARCHIVE_AFTER_DAYS')
+    archive_batch_size: int = Field(500, env='ARCHIVE_BATCH_SIZE')
+    archive_interval: float = Field(3600, env='ARCHIVE_INTERVAL')
+
+    # پشتیبان آنلاین (backup.py) هر backup_interval ثانیه در backup_dir (0 = غیرفعال)، تعداد نسخه‌های نگه داشته‌شده،
+    # و تعداد صفحه هر گام کپی / مکث بین گام‌ها (ثانیه)
+    backup_dir: str = Field('backups', env='BACKUP_DIR')
+    backup_interval: float = Field(21600, env='BACKUP_INTERVAL')
+    backup_keep: int = Field(7, env='BACKUP_KEEP')
+    backup_step_pages: int = Field(256, env='BACKUP_STEP_PAGES')
+    backup_step_sleep: float = Field(0.01, env='BACKUP_STEP_SLEEP')
+
+    # تاخیر (ثانیه) قبل از اجرای migrationهای سنگین پس‌زمینه بعد از راه‌اندازی
+    migration_delay: float = Field(5.0, env='MIGRATION_DELAY')
+
+    # صف webhook: تعداد worker، ظرفیت صف و رفتار در زمان پر بودن (reject = پاسخ 503 ، shed = دور ریختن)
+    webhook_workers: int = Field(4, env='WEBHOOK_WORKERS')
+    webhook_queue_size: int = Field(1000, env='WEBHOOK_QUEUE_SIZE')
+    webhook_overflow: str = Field('reject', env='WEBHOOK_OVERFLOW')
+
+    # پنجره تشخیص updateهای تکراری (ثانیه) و حداکثر update_id نگهداری‌شده
+    update_dedup_window: int = Field(86400, env='UPDATE_DEDUP_WINDOW')
+    update_dedup_max_size: int = Field(100000, env='UPDATE_DEDUP_MAX_SIZE')
+
+    # تعداد اتصالات keep-alive باز به Bot API (حداقل به اندازه webhook_workers)
+    telegram_pool_size: int = Field(16, env='TELEGRAM_POOL_SIZE')
+
+    # صف پیام‌های خروجی: سقف سراسری و هر چت (پیام در ثانیه)، تعداد worker و تلاش مجدد بعد از 429
+    outbound_global_rate: float = Field(30, env='OUTBOUND_GLOBAL_RATE')
+    outbound_per_chat_rate: float = Field(1, env='OUTBOUND_PER_CHAT_RATE')
+    outbound_workers: int = Field(4, env='OUTBOUND_WORKERS')
+    outbound_max_retries: int = Field(3, env='OUTBOUND_MAX_RETRIES')
+
+    # حداکثر انتظار webhook (ثانیه) برای handler (@replyable) تا فراخوانی تکی در پاسخ webhook برگردد؛
+    # 0 = غیرفعال. کوتاه بماند: در این مدت تایید update به تلگرام عقب می‌افتد
+    webhook_reply_wait: float = Field(0.005, env='WEBHOOK_REPLY_WAIT')
+
+    # توکن مسیر /stats (هدر X-Stats-Token)؛ بدون آن مسیر 404 برمی‌گرداند
+    stats_token: Optional[SecretStr] = Field(None, env='STATS_TOKEN')
+
     # deployment domains
     railway_public_domain: Optional[str] = Field(None, env='RAILWAY_PUBLIC_DOMAIN')
     render_external_url: Optional[str] = Field(None, env='RENDER_EXTERNAL_URL')
@@ -3,22 +3,412 @@
 # متدهای پایه‌ای که در bot_webhook و ماژول‌ها استفاده می‌شوند
 # ✅ تغییر مهم: آماده برای استفاده بدون تنظیمات اضافی
 
+import os
+import queue
 import sqlite3
-from typing import Optional, List, Dict, Any
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from types import MappingProxyType
+from typing import Optional, Dict, Any, Callable, Mapping, Tuple
 import time
 import logging
 
 logger = logging.getLogger(__name__)
 
+# پروفایل‌های PRAGMA که هنگام باز شدن هر اتصال اعمال می‌شوند (انتخاب با config.db_pragma_profile)
+PRAGMA_PROFILES: Dict[str, Dict[str, Any]] = {
+    # رفتار قبلی SQLite (rollback journal) + انتظار به جای خطای فوری database is locked
+    'default': {
+        'busy_timeout': 5000,
+    },
+    # WAL: خواننده‌ها پشت commitها نمی‌مانند؛ synchronous=NORMAL در WAL فقط آخرین تراکنش‌ها را
+    # در قطع برق (نه crash برنامه) در خطر می‌گذارد
+    'throughput': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -65536,          # KiB (حدود 64MB)
+        'mmap_size': 268435456,        # 256MB
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+        'wal_autocheckpoint': 1000,    # صفحه
+        'journal_size_limit': 67108864,  # بعد از checkpoint فایل WAL تا 64MB کوتاه می‌شود
+    },
+    # WAL با fsync کامل برای هر commit
+    'durable': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'busy_timeout': 5000,
+        'wal_autocheckpoint': 1000,
+        'journal_size_limit': 67108864,
+    },
+}
+
+
+def apply_pragmas(conn: sqlite3.Connection, profile: str):
+    if profile not in PRAGMA_PROFILES:
+        raise ValueError(f"پروفایل PRAGMA ناشناخته: {profile} (مجاز: {', '.join(PRAGMA_PROFILES)})")
+    for name, value in PRAGMA_PROFILES[profile].items():
+        conn.execute(f"PRAGMA {name} = {value}")
+
+
+class ConnectionPool:
+    """
+    pool محدود از اتصال‌های SQLite
+    ✅ تغییر مهم: هر unit of work یک اتصال جدا (و تراکنش جدا) می‌گیرد؛ threadها دیگر پشت
+    یک اتصال مشترک صف نمی‌کشند و تراکنش ضمنی همدیگر را commit نمی‌کنند.
+    """
+
+    def __init__(self, path: str, size: int = 5, timeout: float = 10.0, pragma_profile: str = 'default'):
+        self.path = path
+        self.pragma_profile = pragma_profile
+        # هر اتصال :memory: یک دیتابیس جداست؛ فقط یک اتصال مجاز است
+        self.size = 1 if path == ':memory:' else max(1, size)
+        self.timeout = timeout
+        # تنظیم اضافه هر اتصال تازه (مثلاً attach فایل بایگانی)
+        self.on_connect: Optional[Callable[[sqlite3.Connection], None]] = None
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+
+        # آمار انتظار برای گرفتن اتصال
+        self.acquired = 0
+        self.waited = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+        self.in_use = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        apply_pragmas(conn, self.pragma_profile)
+        if self.on_connect is not None:
+            self.on_connect(conn)
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if self._created < self.size:
+                    self._created += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                start = time.monotonic()
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self.timeouts += 1
+                    raise TimeoutError(f"هیچ اتصال آزادی در {self.timeout} ثانیه پیدا نشد (pool_size={self.size})")
+                waited = time.monotonic() - start
+                with self._lock:
+                    self.waited += 1
+                    self.wait_total += waited
+                    self.wait_max = max(self.wait_max, waited)
+        with self._lock:
+            self.acquired += 1
+            self.in_use += 1
+        return conn
+
+    def release(self, conn: sqlite3.Connection, discard: bool = False):
+        with self._lock:
+            self.in_use -= 1
+            if discard:
+                self._created -= 1
+        if discard:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        else:
+            self._idle.put(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._created -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'size': self.size,
+                'open': self._created,
+                'in_use': self.in_use,
+                'acquired': self.acquired,
+                'waited': self.waited,
+                'wait_avg_ms': (self.wait_total / self.waited * 1000) if self.waited else 0.0,
+                'wait_max_ms': self.wait_max * 1000,
+                'timeouts': self.timeouts,
+            }
+
+
+class UserCache:
+    """
+    LRU محدود از ردیف‌های users بر اساس telegram_id
+    ✅ تغییر مهم: /start و show_wallet در هر کلیک کاربر را از دیتابیس می‌خواندند.
+    هر تغییر موجودی باید از Database.add_balance رد شود تا ردیف بعد از commit از cache حذف شود.
+    """
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._rows: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._rows.get(telegram_id)
+            if row is None:
+                self.misses += 1
+                return None
+            self._rows.move_to_end(telegram_id)
+            self.hits += 1
+            return dict(row)
+
+    def put(self, telegram_id: int, row: Dict[str, Any]):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._rows[telegram_id] = dict(row)
+            self._rows.move_to_end(telegram_id)
+            while len(self._rows) > self.max_size:
+                self._rows.popitem(last=False)
+
+    def invalidate(self, telegram_id: int):
+        with self._lock:
+            if self._rows.pop(telegram_id, None) is not None:
+                self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._rows),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0,
+                'invalidations': self.invalidations,
+            }
+
+
+class CatalogSnapshot:
+    """نمای تغییرناپذیر از محصولات فعال در یک نسخه مشخص؛ بین threadها بدون قفل خوانده می‌شود"""
+
+    __slots__ = ('version', 'stock_version', 'products', 'by_id')
+
+    def __init__(self, version: int, stock_version: int, products: Tuple[Mapping[str, Any], ...]):
+        self.version = version
+        self.stock_version = stock_version
+        self.products = products
+        self.by_id: Mapping[int, Mapping[str, Any]] = MappingProxyType({p['id']: p for p in products})
+
+    @classmethod
+    def from_rows(cls, version: int, stock_version: int, rows) -> 'CatalogSnapshot':
+        return cls(version, stock_version, tuple(MappingProxyType(dict(r)) for r in rows))
+
+    @property
+    def key(self) -> Tuple[int, int]:
+        return self.version, self.stock_version
+
+    def with_stock(self, stocks: Dict[int, int], stock_version: int) -> 'CatalogSnapshot':
+        """snapshot جدید که فقط stock_count محصولات داده‌شده در آن عوض شده"""
+        products = tuple(
+            MappingProxyType(dict(p, stock_count=stocks[p['id']]))
+            if p['id'] in stocks and stocks[p['id']] != p['stock_count'] else p
+            for p in self.products
+        )
+        return CatalogSnapshot(self.version, stock_version, products)
+
+
+class CatalogCache:
+    """
+    cache خواندنی کاتالوگ
+    ✅ تغییر مهم: هر کلیک products_list کل جدول را می‌خواند و به dict تبدیل می‌کرد.
+    حالا هر خواندن فقط ردیف catalog_version را چک می‌کند:
+    - version (با trigger روی نام/قیمت/فعال بودن/درج/حذف) عوض شد: بارگذاری کامل
+    - فقط stock_version عوض شد: اگر تغییر با Database.track_stock همین process اعلام شده، snapshot
+      بعد از commit همان‌جا اصلاح شده؛ وگرنه فقط ستون stock_count دوباره خوانده می‌شود.
+    """
+
+    def __init__(self):
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.reloads = 0
+        self.stock_refreshes = 0
+        self.stock_patches = 0
+
+    def get(self, db: 'Database') -> CatalogSnapshot:
+        snapshot = self._snapshot
+        with db.get_connection() as conn:
+            version, stock_version = conn.execute(
+                "SELECT version, stock_version FROM catalog_version WHERE id = 1").fetchone()
+            if snapshot is not None and snapshot.key == (version, stock_version):
+                self.hits += 1
+                return snapshot
+            if snapshot is not None and snapshot.version == version:
+                rows = conn.execute("SELECT id, stock_count FROM products WHERE active = 1").fetchall()
+                snapshot = snapshot.with_stock({r[0]: r[1] for r in rows}, stock_version)
+                self.stock_refreshes += 1
+            else:
+                rows = conn.execute("SELECT * FROM products WHERE active = 1").fetchall()
+                snapshot = CatalogSnapshot.from_rows(version, stock_version, rows)
+                self.reloads += 1
+        with self._lock:
+            if self._snapshot is None or snapshot.key >= self._snapshot.key:
+                self._snapshot = snapshot
+        return snapshot
+
+    def patch_stock(self, product_id: int, stock_count: int, stock_version: int):
+        """اعمال تغییر موجودی commit‌شده؛ اگر تغییر دیگری در این فاصله جا افتاده باشد، خواندن بعدی آن را تازه می‌کند"""
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or stock_version != snapshot.stock_version + 1:
+                return
+            self._snapshot = snapshot.with_stock({product_id: stock_count}, stock_version)
+            self.stock_patches += 1
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            'version': snapshot.key if snapshot else None,
+            'products': len(snapshot.products) if snapshot else 0,
+            'hits': self.hits,
+            'reloads': self.reloads,
+            'stock_refreshes': self.stock_refreshes,
+            'stock_patches': self.stock_patches,
+        }
+
+
 class Database:
-    def __init__(self, path: str = 'shop.db'):
+    def __init__(self, path: str = 'shop.db', pool_size: int = 5, pool_timeout: float = 10.0,
+                 pragma_profile: str = 'default', user_cache_size: int = 10000):
         self.path = path
-        self.conn = sqlite3.connect(self.path, check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row
-        self._ensure_tables()
+        self.pool = ConnectionPool(path, size=pool_size, timeout=pool_timeout, pragma_profile=pragma_profile)
+        self.users = UserCache(user_cache_size)
+        self.catalog = CatalogCache()
+        self.archive_path: Optional[str] = None
+        self._local = threading.local()
+        self._checkpointer: Optional[threading.Thread] = None
+        self.checkpoints = 0
+        self.checkpoint_busy = 0
+        # schema از طریق migrations (مسیر سریع: فقط بررسی schema_version)
+        from migrations import migrate
+        migrate(self)
+
+    @contextmanager
+    def get_connection(self):
+        """
+        یک unit of work: اتصال از pool گرفته می‌شود، در پایان بلوک commit و در صورت خطا rollback.
+        فراخوانی تو در تو در همان thread از همان اتصال استفاده می‌کند و commit با بلوک بیرونی است.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+
+        conn = self.pool.acquire()
+        self._local.conn = conn
+        self._local.after_commit = []
+        discard = False
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                discard = True
+            raise
+        else:
+            for callback in self._local.after_commit:
+                callback()
+        finally:
+            self._local.conn = None
+            self._local.after_commit = []
+            self.pool.release(conn, discard=discard)
+
+    def attach_archive(self, path: str):
+        """
+        فایل بایگانی (archive.py) روی هر اتصال pool attach می‌شود؛ اتصال‌های بیکار بسته می‌شوند تا
+        دوباره با attach ساخته شوند (قبل از شروع workerها صدا زده شود)
+        """
+        from archive import attach
+        self.archive_path = path
+        self.pool.on_connect = lambda conn: attach(conn, path)
+        self.pool.close_all()
+        with self.get_connection():
+            pass  # ساخت schema بایگانی همین حالا، نه در اولین درخواست
+
+    def on_commit(self, callback: Callable[[], None]):
+        """اجرای callback بعد از commit بلوک بیرونی get_connection (با rollback اجرا نمی‌شود)"""
+        if getattr(self._local, 'conn', None) is None:
+            callback()
+        else:
+            self._local.after_commit.append(callback)
+
+    # ===== WAL checkpoint =====
+
+    def wal_size(self) -> int:
+        try:
+            return os.path.getsize(self.path + '-wal')
+        except OSError:
+            return 0
+
+    def checkpoint(self, mode: str = 'PASSIVE') -> Dict[str, int]:
+        """PRAGMA wal_checkpoint؛ busy=1 یعنی خواننده/نویسنده‌ای مانع کامل شدن شد"""
+        with self.get_connection() as conn:
+            busy, log_frames, checkpointed = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+        self.checkpoints += 1
+        if busy:
+            self.checkpoint_busy += 1
+        return {'busy': busy, 'log_frames': log_frames, 'checkpointed': checkpointed}
+
+    def start_checkpointer(self, interval: float = 60, max_wal_bytes: int = 64 * 1024 * 1024):
+        """
+        سیاست checkpoint در پس‌زمینه: هر interval ثانیه PASSIVE (بدون بلاک کردن کسی)،
+        و اگر فایل WAL از max_wal_bytes بزرگ‌تر شد TRUNCATE تا حجم آن محدود بماند.
+        """
+        if self._checkpointer is not None or self.path == ':memory:':
+            return
 
-    def _ensure_tables(self):
-        cur = self.conn.cursor()
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    mode = 'TRUNCATE' if self.wal_size() > max_wal_bytes else 'PASSIVE'
+                    result = self.checkpoint(mode)
+                    if mode == 'TRUNCATE':
+                        logger.info(f"🧹 WAL checkpoint (TRUNCATE): {result}")
+                except Exception as e:
+                    logger.error(f"خطا در WAL checkpoint: {e}")
+
+        self._checkpointer = threading.Thread(target=run, name='db-checkpointer', daemon=True)
+        self._checkpointer.start()
+
+    @staticmethod
+    def _create_tables(cur):
+        """جداول پایه (migration شماره 1)"""
         # users
         cur.execute("""
         CREATE TABLE IF NOT EXISTS users (
@@ -40,6 +430,22 @@ class Database:
             active INTEGER DEFAULT 1
         )
         """)
+        # نسخه کاتالوگ: با هر تغییر در products (از هر جایی) توسط trigger یکی زیاد می‌شود
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS catalog_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        """)
+        cur.execute("INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0)")
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS products_version_{event.lower()}
+            AFTER {event} ON products
+            BEGIN
+                UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+            END
+            """)
         # orders (simple)
         cur.execute("""
         CREATE TABLE IF NOT EXISTS orders (
@@ -51,66 +457,124 @@ class Database:
             created_at INTEGER
         )
         """)
-        self.conn.commit()
 
     def get_or_create_user(self, telegram_id: int, username: Optional[str], is_admin: bool=False) -> Dict[str, Any]:
-        cur = self.conn.cursor()
-        cur.execute("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,))
-        row = cur.fetchone()
-        if row:
-            return dict(row)
-        created_at = int(time.time())
-        cur.execute("INSERT INTO users (telegram_id, username, is_admin, created_at) VALUES (?, ?, ?, ?)",
-                    (telegram_id, username, 1 if is_admin else 0, created_at))
-        self.conn.commit()
-        cur.execute("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,))
-        return dict(cur.fetchone())
-
-    def get_active_products(self) -> List[Dict[str, Any]]:
-        cur = self.conn.cursor()
-        cur.execute("SELECT * FROM products WHERE active = 1")
-        rows = cur.fetchall()
-        if not rows:
-            # نمونه پیش‌فرض (در صورت خالی بودن جدول)
-            return [{
-                'id': 1,
-                'site_name': 'ChatGPT GO',
-                'price': 1499000,
-                'stock_count': 999
-            }]
-        return [dict(r) for r in rows]
-
-    def get_user_orders(self, telegram_id: int) -> List[Dict[str, Any]]:
-        cur = self.conn.cursor()
-        cur.execute("SELECT * FROM orders WHERE telegram_id = ? ORDER BY created_at DESC LIMIT 50", (telegram_id,))
-        return [dict(r) for r in cur.fetchall()]
+        user = self.users.get(telegram_id)
+        if user is not None:
+            return user
+        with self.get_connection() as conn:
+            # یک دستور: ساخت یا (در صورت وجود) برگرداندن ردیف فعلی؛ username خالی جایگزین نمی‌شود
+            row = conn.execute("""
+                INSERT INTO users (telegram_id, username, is_admin, created_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(telegram_id) DO UPDATE SET username = COALESCE(excluded.username, users.username)
+                RETURNING *
+            """, (telegram_id, username, 1 if is_admin else 0, int(time.time()))).fetchone()
+            user = dict(row)
+        self.users.put(telegram_id, user)
+        return user
+
+    def add_balance(self, telegram_id: int, amount: int, description: str, tx_type: str = 'deposit',
+                    allow_negative: bool = True) -> Optional[int]:
+        """
+        تغییر موجودی + ثبت در transactions (همزمان، داخل تراکنش فراخواننده اگر باز باشد).
+        ردیف cache شده کاربر بعد از commit حذف می‌شود.
+        Returns موجودی جدید؛ None اگر کاربر نبود یا (با allow_negative=False) موجودی کافی نبود
+        """
+        with self.get_connection() as conn:
+            sql = "UPDATE users SET balance = balance + ? WHERE telegram_id = ?"
+            if not allow_negative:
+                sql += " AND balance + ? >= 0"
+            params = (amount, telegram_id) if allow_negative else (amount, telegram_id, amount)
+            row = conn.execute(sql + " RETURNING balance", params).fetchone()
+            if row is None:
+                return None
+            conn.execute("""
+                INSERT INTO transactions (user_id, amount, type, description)
+                VALUES (?, ?, ?, ?)
+            """, (telegram_id, amount, tx_type, description))
+            self.on_commit(lambda: self.users.invalidate(telegram_id))
+        return row[0]
+
+    def get_catalog(self) -> CatalogSnapshot:
+        """snapshot فعلی محصولات فعال (تغییرناپذیر)"""
+        return self.catalog.get(self)
+
+    def get_active_products(self) -> Tuple[Mapping[str, Any], ...]:
+        """محصولات فعال به صورت mapping فقط‌خواندنی (جدول خالی = لیست خالی)"""
+        return self.catalog.get(self).products
+
+    def get_product_by_id(self, product_id: int) -> Optional[Mapping[str, Any]]:
+        """محصول فعال از snapshot"""
+        return self.catalog.get(self).by_id.get(product_id)
+
+    def add_product(self, site_name: str, price: int, stock_count: int = 0) -> int:
+        with self.get_connection() as conn:
+            cur = conn.execute("INSERT INTO products (site_name, price, stock_count) VALUES (?, ?, ?)",
+                               (site_name, price, stock_count))
+            return cur.lastrowid
+
+    def toggle_product_status(self, product_id: int) -> Optional[bool]:
+        """Returns وضعیت جدید (None اگر محصول وجود نداشت)"""
+        with self.get_connection() as conn:
+            row = conn.execute("UPDATE products SET active = 1 - active WHERE id = ? RETURNING active",
+                               (product_id,)).fetchone()
+            return bool(row[0]) if row else None
+
+    def track_stock(self, product_id: int) -> Optional[int]:
+        """
+        بعد از تغییر accounts (triggerها stock_count را به‌روز کرده‌اند) در همان تراکنش صدا زده می‌شود تا
+        snapshot کاتالوگ بعد از commit به صورت افزایشی اصلاح شود. Returns موجودی فعلی یا None
+        """
+        with self.get_connection() as conn:
+            row = conn.execute(
+                "SELECT stock_count, (SELECT stock_version FROM catalog_version WHERE id = 1) FROM products WHERE id = ?",
+                (product_id,)).fetchone()
+            if row is None:
+                return None
+            stock_count, stock_version = row[0], row[1]
+            self.on_commit(lambda: self.catalog.patch_stock(product_id, stock_count, stock_version))
+        return stock_count
+
+    def get_catalog_version(self) -> int:
+        """نسخه فعلی کاتالوگ (برای cache کیبورد/لیست محصولات)"""
+        with self.get_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT version FROM catalog_version WHERE id = 1")
+            return cur.fetchone()[0]
+
+    def get_user_orders(self, telegram_id: int, cursor: Optional[str] = None):
+        """یک صفحه از سفارش‌های کاربر (جدیدترین اول)؛ Returns paging.Page"""
+        from archive import history_table
+        from paging import fetch_page
+        with self.get_connection() as conn:
+            return fetch_page(conn, history_table(self, 'orders'), cursor, where='telegram_id = ?', params=(telegram_id,))
 
     def insert_order(self, telegram_id: int, site_name: str, price: int, status: str = 'pending') -> int:
-        cur = self.conn.cursor()
-        created_at = int(time.time())
-        cur.execute("INSERT INTO orders (telegram_id, site_name, price, status, created_at) VALUES (?, ?, ?, ?, ?)",
-                    (telegram_id, site_name, price, status, created_at))
-        self.conn.commit()
-        return cur.lastrowid
+        with self.get_connection() as conn:
+            cur = conn.cursor()
+            created_at = int(time.time())
+            cur.execute("INSERT INTO orders (telegram_id, site_name, price, status, created_at) VALUES (?, ?, ?, ?, ?)",
+                        (telegram_id, site_name, price, status, created_at))
+            return cur.lastrowid
 
     def get_detailed_statistics(self) -> Dict[str, int]:
-        cur = self.conn.cursor()
-        cur.execute("SELECT COUNT(*) as total_users FROM users")
-        total_users = cur.fetchone()['total_users']
-        cur.execute("SELECT COUNT(*) as active_products FROM products WHERE active = 1")
-        active_products = cur.fetchone()['active_products']
-        # بقیه آمارهای ضروری را به شکل ساده اضافه می‌کنیم
+        # شمارنده‌ها را triggerها به‌روز نگه می‌دارند (stats.py)؛ یک lookup به جای COUNT روی هر جدول
+        from stats import StatsDB
+        with self.get_connection() as conn:
+            counters = StatsDB.get(conn, 'users_total', 'products_total', 'products_active', 'accounts_available',
+                                   'accounts_sold', 'orders_delivered', 'orders_revenue')
+        total_users = counters['users_total']
         return {
             'real_users': max(total_users - 1, 0),
             'admin_count': 1,
             'total_users': total_users,
-            'active_products': active_products,
-            'total_products': active_products,
-            'available_accounts': 0,
-            'sold_accounts': 0,
-            'total_sales': 0,
-            'total_revenue': 0
+            'active_products': counters['products_active'],
+            'total_products': counters['products_total'],
+            'available_accounts': counters['accounts_available'],
+            'sold_accounts': counters['accounts_sold'],
+            'total_sales': counters['orders_delivered'],
+            'total_revenue': counters['orders_revenue']
         }
 
     def close(self):
-        self.conn.close()
+        self.pool.close_all()
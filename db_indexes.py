@@ -0,0 +1,225 @@
+# db_indexes.py
+"""
+ایندکس‌های مدیریت‌شده برای queryهای پرتکرار
+✅ تغییر مهم: همه جداول فقط کلید اصلی/UNIQUE داشتند و queryهای زیر کل جدول را می‌خواندند:
+get_user_orders، get_user_transactions، شمارش‌های وضعیت در get_statistics،
+get_unread_messages_count و mark_messages_as_read.
+ensure_indexes (migration پس‌زمینه hot_query_indexes) ایندکس‌ها را idempotent می‌سازد؛ جدولی که هنوز وجود ندارد رد می‌شود.
+
+اجرای مستقیم فایل (python db_indexes.py) یا tests/test_query_plans.py روی یک دیتابیس موقت همه queryهای
+کد را با EXPLAIN QUERY PLAN بررسی می‌کند: هر مرحله SCAN (حتی با ایندکس covering) یا TEMP B-TREE خطاست
+مگر در INTENDED_SCANS آمده باشد.
+"""
+
+import logging
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (نام ایندکس، جدول، ستون‌ها)
+INDEXES: List[Tuple[str, str, str]] = [
+    # database.py
+    ('idx_orders_user_created', 'orders', 'telegram_id, created_at'),
+    ('idx_orders_created', 'orders', 'created_at'),  # archive.py
+    ('idx_products_active', 'products', 'active'),
+    # payment_zibal.py / payment_admin.py
+    ('idx_zibal_user_created', 'zibal_transactions', 'user_id, created_at'),
+    ('idx_zibal_status_created', 'zibal_transactions', 'status, created_at, amount'),  # آمار: covering
+    ('idx_zibal_created', 'zibal_transactions', 'created_at'),
+    # payment_digital.py / payment_admin.py
+    ('idx_crypto_user_created', 'crypto_transactions', 'user_id, created_at'),
+    ('idx_crypto_status_created', 'crypto_transactions', 'payment_status, created_at, actual_amount_usd'),
+    ('idx_crypto_created', 'crypto_transactions', 'created_at'),
+    # تراکنش‌های کیف پول
+    ('idx_transactions_user_created', 'transactions', 'user_id, created_at'),
+    # help.py
+    ('idx_support_user_created', 'support_messages', 'user_id, created_at'),
+    ('idx_support_user_unread', 'support_messages', 'user_id, is_from_admin, is_read'),
+    ('idx_support_unread', 'support_messages', 'is_from_admin, is_read'),
+    ('idx_support_created', 'support_messages', 'created_at'),  # archive.py
+    ('idx_tickets_status_last', 'support_tickets', 'status, last_message_at'),
+    # broadcast.py / update_dedup.py
+    ('idx_broadcasts_status', 'broadcasts', 'status'),
+    ('idx_processed_updates_seen', 'processed_updates', 'seen_at'),
+]
+
+
+def ensure_indexes(conn) -> List[str]:
+    """ساخت ایندکس‌های موجود نبودن؛ Returns نام ایندکس‌های ساخته‌شده"""
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    created = []
+    for name, table, columns in INDEXES:
+        if table not in tables or name in existing:
+            continue
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+        created.append(name)
+    if created:
+        logger.info(f"✅ {len(created)} ایندکس ساخته شد: {', '.join(created)}")
+    return created
+
+
+# ===== QUERY PLAN CHECK =====
+
+# queryهایی که مستقیم داخل handlerها نوشته شده‌اند (بقیه با اجرای متدهای XxxDB ضبط می‌شوند)
+INLINE_QUERIES: List[Tuple[str, str, tuple]] = [
+    ('update_dedup._load',
+     "SELECT update_id, seen_at FROM processed_updates WHERE seen_at >= ? ORDER BY seen_at DESC LIMIT ?", (0, 10)),
+    ('update_dedup._prune_table', "DELETE FROM processed_updates WHERE update_id < ?", (1,)),
+]
+
+
+# SCANهای عمدی: (مرحله plan، بخشی از متن query، دلیل)
+INTENDED_SCANS: List[Tuple[str, str, str]] = [
+    # صفحه اول لیست‌ها (paging.fetch_page بدون مکان‌نما): پیمایش به ترتیب ایندکس که بعد از LIMIT می‌ایستد
+    ('SCAN zibal_transactions USING INDEX idx_zibal_created',
+     'FROM zibal_transactions ORDER BY created_at DESC, id DESC LIMIT', 'صفحه اول تراکنش‌ها'),
+    ('SCAN crypto_transactions USING INDEX idx_crypto_created',
+     'FROM crypto_transactions ORDER BY created_at DESC, id DESC LIMIT', 'صفحه اول تراکنش‌ها'),
+    # تعداد گیرندگان پیام همگانی (یکبار برای هر broadcast، نه روی مسیر کاربر)
+    ('SCAN u USING COVERING INDEX sqlite_autoindex_users_1',
+     'SELECT COUNT(*) FROM users u WHERE NOT EXISTS', 'BroadcastDB.count_recipients'),
+    ('SCAN w', 'SELECT COUNT(*) FROM maintenance_waitlist w WHERE NOT EXISTS', 'BroadcastDB.count_recipients'),
+]
+
+
+def bad_plan_steps(conn, sql: str, params: tuple = ()) -> List[str]:
+    """مراحل plan که به جای SEARCH کل جدول/ایندکس را می‌خوانند یا مرتب‌سازی موقت دارند"""
+    text = ' '.join(sql.split())
+    bad = []
+    for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params):
+        detail = row[3]
+        if detail == 'SCAN CONSTANT ROW':
+            continue
+        if detail.startswith('SCAN ') or 'TEMP B-TREE' in detail:
+            if not any(detail == step and fragment in text for step, fragment, _ in INTENDED_SCANS):
+                bad.append(detail)
+    return bad
+
+
+def _build_schema(db):
+    from migrations import run_background
+
+    # جداول foreground هنگام ساخت Database ساخته شده‌اند
+    run_background(db)
+
+
+def _exercise(db):
+    """اجرای متدهای دیتابیس تا queryهای واقعی آن‌ها ضبط شوند"""
+    from payment_zibal import PaymentZibalDB
+    from payment_digital import PaymentDigitalDB
+    from help import HelpDB
+    from broadcast import BroadcastDB
+    from stats import StatsDB, report_since
+    from paging import encode_cursor
+    from archive import run_archive
+    from inventory import (InventoryDB, add_account, purchase_account, reserve_account, release_reservation,
+                           sweep_expired_reservations)
+
+    db.get_or_create_user(1, 'u')
+    db.add_balance(1, 0, 'plan check')
+    product_id = db.add_product('p', 1, 1)
+    db.get_active_products()
+    with db.get_connection() as conn:
+        conn.execute("UPDATE products SET stock_count = 5 WHERE id = ?", (product_id,))
+    db.get_catalog()  # فقط stock_count
+    add_account(db, product_id, 'login', 'password')
+    db.add_balance(1, 10, 'plan check')
+    purchase_account(db, 1, product_id)
+    add_account(db, product_id, 'login2', 'password')
+    db.add_balance(1, 10, 'plan check')
+    reservation = reserve_account(db, 1, product_id)
+    if reservation['success']:
+        release_reservation(db, 1, reservation['account_id'])
+        reservation = reserve_account(db, 1, product_id)
+        purchase_account(db, 1, product_id, account_id=reservation['account_id'])
+    sweep_expired_reservations(db)
+    run_archive(db, max_age_days=0)  # همه ردیف‌های تمام‌شده تا اینجا
+    db.toggle_product_status(product_id)
+    db.get_catalog_version()
+    # صفحه اول و صفحه‌های بعد/قبل (keyset)
+    for cursor in (None, encode_cursor('n', 0, 1), encode_cursor('p', 0, 1)):
+        db.get_user_orders(1, cursor)
+    db.get_detailed_statistics()
+    with db.get_connection() as conn:
+        PaymentZibalDB.get_transaction(conn, transaction_id=1)
+        PaymentZibalDB.get_transaction(conn, track_id=1)
+        PaymentZibalDB.get_user_transactions(conn, 1)
+        PaymentZibalDB.get_payment_settings(conn)
+        PaymentZibalDB.update_transaction(conn, 1, status='success')
+        PaymentZibalDB.get_statistics(conn)
+        PaymentDigitalDB.get_transaction(conn, transaction_id=1)
+        PaymentDigitalDB.get_transaction(conn, payment_id='p')
+        PaymentDigitalDB.get_transaction(conn, order_id='o')
+        PaymentDigitalDB.get_user_transactions(conn, 1)
+        PaymentDigitalDB.get_exchange_rate(conn, 'USD', 'IRT')
+        PaymentDigitalDB.update_transaction(conn, 1, payment_status='finished')
+        PaymentDigitalDB.get_statistics(conn)
+        HelpDB.check_rate_limit(conn, 1, increment=False)
+        HelpDB.get_user_messages(conn, 1)
+        HelpDB.get_unread_messages_count(conn, 1)
+        HelpDB.get_unread_messages_count(conn, 1, for_admin=True)
+        HelpDB.mark_messages_as_read(conn, 1, is_from_admin=True)
+        HelpDB.mark_messages_as_read(conn, 1, is_from_admin=False)
+        for cursor in (None, encode_cursor('n', '2000-01-01', 1), encode_cursor('p', '2000-01-01', 1)):
+            PaymentZibalDB.get_transactions_page(conn, cursor)
+            PaymentDigitalDB.get_transactions_page(conn, cursor)
+            HelpDB.get_open_tickets(conn, cursor)
+        HelpDB.close_ticket(conn, 1)
+        HelpDB.get_statistics(conn)
+        BroadcastDB.count_recipients(conn)
+        BroadcastDB.count_recipients(conn, 'waitlist')
+        BroadcastDB.next_chunk(conn, 0, 100, 'waitlist')
+        BroadcastDB.clear_waitlist(conn, [0, 1])
+        BroadcastDB.get(conn, 1)
+        BroadcastDB.get_running_ids(conn)
+        BroadcastDB.next_chunk(conn, 0, 100)
+        BroadcastDB.checkpoint(conn, 1, 1, 1, 0, 0)
+        BroadcastDB.unblock(conn, 1)
+        InventoryDB.count_unsold(conn, 1)
+        StatsDB.get(conn)
+        StatsDB.payment_totals(conn, report_since('mtd'))
+
+
+def check_query_plans() -> int:
+    """Returns تعداد queryهای مشکل‌دار (0 یعنی همه از ایندکس استفاده می‌کنند)"""
+    import os
+    import tempfile
+    from database import Database
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'plan_check.db'), pool_size=1)
+        _build_schema(db)
+        # صفحه‌های تاریخچه از viewهای هر دو فایل می‌خوانند
+        db.attach_archive(os.path.join(tmp, 'plan_check_archive.db'))
+
+        captured = []
+        with db.get_connection() as conn:
+            conn.set_trace_callback(captured.append)
+            try:
+                _exercise(db)
+            finally:
+                conn.set_trace_callback(None)
+
+        queries = [(f"traced #{i}", sql, ()) for i, sql in enumerate(dict.fromkeys(captured))
+                   if sql.lstrip().split(None, 1)[0].upper() in ('SELECT', 'UPDATE', 'DELETE')]
+        queries += INLINE_QUERIES
+
+        failures = 0
+        with db.get_connection() as conn:
+            for name, sql, params in queries:
+                bad = bad_plan_steps(conn, sql, params)
+                status = 'FAIL' if bad else 'ok'
+                print(f"[{status}] {name}: {' '.join(sql.split())[:110]}")
+                for detail in bad:
+                    print(f"        -> {detail}")
+                failures += bool(bad)
+        db.close()
+
+    print(f"\n{len(queries)} query بررسی شد، {failures} مورد بدون ایندکس")
+    return failures
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(1 if check_query_plans() else 0)
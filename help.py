@@ -10,8 +10,23 @@ from typing import Optional, Dict, List
 from telebot import types
 import time
 
+from callback_router import router
+from paging import cursor_from, nav_buttons
+from archive import history_table
+from shared_state import clear_state
+import shared_state
+from outbound import scheduler_for, fan_out, edit_fan_out
+from write_behind import writer_for
+
 logger = logging.getLogger(__name__)
 
+# تیکت کاربر باز/به‌روز می‌شود؛ INSERT OR REPLACE ردیف قبلی را بدون اجرای trigger حذف (stat_counters)
+# می‌کرد و tickets_open با هر پیام کاربری که تیکت داشت بالا می‌رفت
+_OPEN_TICKET = """
+    INSERT INTO support_tickets (user_id, status, last_message_at) VALUES (?, 'open', ?)
+    ON CONFLICT (user_id) DO UPDATE SET status = 'open', last_message_at = excluded.last_message_at
+"""
+
 # ===== DATABASE METHODS =====
 
 class HelpDB:
@@ -62,7 +77,12 @@ class HelpDB:
     
     @staticmethod
     def check_rate_limit(conn, user_id: int, limit: int = 5, increment: bool = True) -> Dict:
-        """بررسی محدودیت تعداد پیام"""
+        """
+        بررسی محدودیت تعداد پیام
+        افزایش شمارنده همزمان و در همان تراکنش خواندن است (نه write_behind)؛ وگرنه پیام‌های پشت سر هم
+        همه شمارش قدیمی را می‌دیدند و از محدودیت رد می‌شدند.
+        """
+        execute = conn.execute
         cursor = conn.execute("""
             SELECT message_count, last_reset 
             FROM message_rate_limit 
@@ -75,9 +95,10 @@ class HelpDB:
         if not row:
             # اولین پیام کاربر
             if increment:
-                conn.execute("""
+                execute("""
                     INSERT INTO message_rate_limit (user_id, message_count, last_reset)
                     VALUES (?, 1, ?)
+                    ON CONFLICT(user_id) DO UPDATE SET message_count = message_count + 1
                 """, (user_id, current_time.isoformat()))
                 return {"allowed": True, "remaining": limit - 1}
             else:
@@ -91,7 +112,7 @@ class HelpDB:
         if current_time - last_reset > timedelta(hours=1):
             # ریست کردن شمارنده
             if increment:
-                conn.execute("""
+                execute("""
                     UPDATE message_rate_limit 
                     SET message_count = 1, last_reset = ?
                     WHERE user_id = ?
@@ -113,7 +134,7 @@ class HelpDB:
         
         # افزایش شمارنده (فقط اگر increment=True باشد)
         if increment:
-            conn.execute("""
+            execute("""
                 UPDATE message_rate_limit 
                 SET message_count = message_count + 1
                 WHERE user_id = ?
@@ -134,18 +155,26 @@ class HelpDB:
         """, (user_id, admin_id, message_text, is_from_admin, parent_message_id))
         
         # به‌روزرسانی تیکت
-        conn.execute("""
-            INSERT OR REPLACE INTO support_tickets (user_id, status, last_message_at)
-            VALUES (?, 'open', ?)
-        """, (user_id, datetime.now().isoformat()))
+        conn.execute(_OPEN_TICKET, (user_id, datetime.now().isoformat()))
         
         return cursor.lastrowid
+
+    @staticmethod
+    def queue_message(writer, user_id: int, message_text: str, is_from_admin: bool = False,
+                      admin_id: int = None, parent_message_id: int = None):
+        """مثل save_message ولی از طریق write_behind (بدون id برگشتی)"""
+        writer.write("""
+            INSERT INTO support_messages 
+            (user_id, admin_id, message_text, is_from_admin, parent_message_id)
+            VALUES (?, ?, ?, ?, ?)
+        """, (user_id, admin_id, message_text, is_from_admin, parent_message_id))
+        writer.write(_OPEN_TICKET, (user_id, datetime.now().isoformat()))
     
     @staticmethod
-    def get_user_messages(conn, user_id: int, limit: int = 20):
-        """دریافت پیام‌های کاربر"""
-        cursor = conn.execute("""
-            SELECT * FROM support_messages
+    def get_user_messages(conn, user_id: int, limit: int = 20, table: str = 'support_messages'):
+        """دریافت پیام‌های کاربر (table: history_table(...) برای کل تاریخچه)"""
+        cursor = conn.execute(f"""
+            SELECT * FROM {table}
             WHERE user_id = ?
             ORDER BY created_at DESC
             LIMIT ?
@@ -189,20 +218,19 @@ class HelpDB:
             """, (user_id,))
     
     @staticmethod
-    def get_open_tickets(conn):
-        """دریافت تیکت‌های باز"""
-        cursor = conn.execute("""
-            SELECT t.*, 
+    def get_open_tickets(conn, cursor: Optional[str] = None):
+        """یک صفحه از تیکت‌های باز (آخرین پیام جدیدتر اول)؛ Returns paging.Page"""
+        from paging import fetch_page
+        return fetch_page(
+            conn, 'support_tickets t', cursor,
+            where="t.status = 'open'", key='t.last_message_at', id_column='t.id',
+            columns="""t.*,
                    (SELECT COUNT(*) FROM support_messages 
                     WHERE user_id = t.user_id AND is_read = 0 AND is_from_admin = 0) as unread_count,
                    (SELECT message_text FROM support_messages 
                     WHERE user_id = t.user_id 
-                    ORDER BY created_at DESC LIMIT 1) as last_message
-            FROM support_tickets t
-            WHERE status = 'open'
-            ORDER BY last_message_at DESC
-        """)
-        return [dict(row) for row in cursor.fetchall()]
+                    ORDER BY created_at DESC LIMIT 1) as last_message"""
+        )
     
     @staticmethod
     def close_ticket(conn, user_id: int):
@@ -215,24 +243,16 @@ class HelpDB:
     
     @staticmethod
     def get_statistics(conn):
-        """آمار سیستم پشتیبانی"""
-        cursor = conn.execute("SELECT COUNT(*) FROM support_tickets WHERE status = 'open'")
-        open_tickets = cursor.fetchone()[0]
-        
-        cursor = conn.execute("SELECT COUNT(*) FROM support_messages WHERE is_from_admin = 0")
-        total_user_messages = cursor.fetchone()[0]
-        
-        cursor = conn.execute("SELECT COUNT(*) FROM support_messages WHERE is_from_admin = 1")
-        total_admin_messages = cursor.fetchone()[0]
-        
-        cursor = conn.execute("SELECT COUNT(*) FROM support_messages WHERE is_read = 0 AND is_from_admin = 0")
-        unread_messages = cursor.fetchone()[0]
+        """آمار سیستم پشتیبانی (یک lookup روی stat_counters)"""
+        from stats import StatsDB
+        counters = StatsDB.get(conn, 'tickets_open', 'support_user_messages',
+                               'support_admin_messages', 'support_unread_messages')
         
         return {
-            "open_tickets": open_tickets,
-            "total_user_messages": total_user_messages,
-            "total_admin_messages": total_admin_messages,
-            "unread_messages": unread_messages
+            "open_tickets": counters['tickets_open'],
+            "total_user_messages": counters['support_user_messages'],
+            "total_admin_messages": counters['support_admin_messages'],
+            "unread_messages": counters['support_unread_messages']
         }
 
 
@@ -261,14 +281,15 @@ class HelpHandlers:
         self.bot.message_handler(commands=['closeticket'])(self.cmd_closeticket)
         
         # Callback handlers
-        self.bot.callback_query_handler(func=lambda c: c.data == "help_support")(self.show_support)
-        self.bot.callback_query_handler(func=lambda c: c.data == "help_view_messages")(self.view_messages)
-        self.bot.callback_query_handler(func=lambda c: c.data == "help_send_message")(self.start_send_message)
-        self.bot.callback_query_handler(func=lambda c: c.data == "admin_support_panel")(self.admin_support_panel)
-        self.bot.callback_query_handler(func=lambda c: c.data == "admin_view_tickets")(self.admin_view_tickets)
-        self.bot.callback_query_handler(func=lambda c: c.data.startswith("admin_ticket_"))(self.admin_view_ticket)
-        self.bot.callback_query_handler(func=lambda c: c.data.startswith("admin_reply_"))(self.admin_start_reply)
-        self.bot.callback_query_handler(func=lambda c: c.data.startswith("admin_close_"))(self.admin_close_ticket)
+        router.add_exact("help_support", self.show_support)
+        router.add_exact("help_view_messages", self.view_messages)
+        router.add_exact("help_send_message", self.start_send_message)
+        router.add_exact("admin_support_panel", self.admin_support_panel)
+        router.add_exact("admin_view_tickets", self.admin_view_tickets)
+        router.add_prefix("admin_tickets_pg_", self.admin_view_tickets)
+        router.add_prefix("admin_ticket_", self.admin_view_ticket)
+        router.add_prefix("admin_reply_", self.admin_start_reply)
+        router.add_prefix("admin_close_", self.admin_close_ticket)
     
     # ===== USER HANDLERS =====
     
@@ -383,7 +404,7 @@ class HelpHandlers:
             return
         
         # تنظیم state
-        from bot import set_state, user_data
+        from shared_state import set_state, user_data
         set_state(user_id, "help_waiting_message")
         user_data[user_id] = {'remaining': rate_check['remaining']}
         
@@ -403,14 +424,15 @@ class HelpHandlers:
     
     def cmd_tickets(self, message):
         """دستور /tickets - مشاهده تیکت‌ها"""
-        from bot import is_admin
+        from shared_state import is_admin
         
         if not is_admin(message.from_user.id):
             self.bot.send_message(message.chat.id, "❌ شما دسترسی ندارید!")
             return
         
         with self.db.get_connection() as conn:
-            tickets = HelpDB.get_open_tickets(conn)
+            page = HelpDB.get_open_tickets(conn)
+        tickets = page.rows
         
         if not tickets:
             self.bot.send_message(message.chat.id, "✅ تیکت بازی وجود ندارد!")
@@ -427,13 +449,14 @@ class HelpHandlers:
             button_text = f"{unread} کاربر {ticket['user_id']}: {last_msg}"
             markup.add(types.InlineKeyboardButton(button_text, callback_data=f"admin_ticket_{ticket['user_id']}"))
         
+        markup.row(*nav_buttons(page, "admin_tickets_pg_"))
         markup.add(types.InlineKeyboardButton("🔄 بروزرسانی", callback_data="admin_view_tickets"))
         
         self.bot.send_message(message.chat.id, text, reply_markup=markup)
     
     def cmd_sendto(self, message):
         """دستور /sendto <user_id> <message> - ارسال پیام به کاربر"""
-        from bot import is_admin
+        from shared_state import is_admin
         
         if not is_admin(message.from_user.id):
             self.bot.send_message(message.chat.id, "❌ شما دسترسی ندارید!")
@@ -452,33 +475,39 @@ class HelpHandlers:
             target_user_id = int(parts[1])
             message_text = parts[2]
             
-            # ذخیره پیام
-            with self.db.get_connection() as conn:
-                HelpDB.save_message(
-                    conn, 
-                    user_id=target_user_id, 
-                    message_text=message_text,
-                    is_from_admin=True,
-                    admin_id=message.from_user.id
-                )
+            # ذخیره پیام (commit گروهی)
+            writer = writer_for(self.db)
+            HelpDB.queue_message(
+                writer,
+                user_id=target_user_id,
+                message_text=message_text,
+                is_from_admin=True,
+                admin_id=message.from_user.id
+            )
+            writer.audit('support_reply', actor_id=message.from_user.id, target_id=target_user_id)
             
-            # ارسال به کاربر
-            try:
-                self.bot.send_message(
-                    target_user_id,
-                    f"🟢 **پیام از پشتیبانی:**\n\n{message_text}\n\n"
-                    f"برای پاسخ، دستور /help را بزنید."
-                )
-                self.bot.send_message(message.chat.id, f"✅ پیام به کاربر {target_user_id} ارسال شد!")
-            except Exception as e:
-                self.bot.send_message(message.chat.id, f"❌ خطا در ارسال: {e}")
+            # ارسال به کاربر؛ نتیجه بعد از ارسال به ادمین گزارش می‌شود
+            outbound = scheduler_for(self.bot)
+            admin_chat_id = message.chat.id
+
+            def report(future):
+                if future.exception() is None:
+                    outbound.send_message(admin_chat_id, f"✅ پیام به کاربر {target_user_id} ارسال شد!")
+                else:
+                    outbound.send_message(admin_chat_id, f"❌ خطا در ارسال: {future.exception()}")
+
+            outbound.send_message(
+                target_user_id,
+                f"🟢 **پیام از پشتیبانی:**\n\n{message_text}\n\n"
+                f"برای پاسخ، دستور /help را بزنید."
+            ).add_done_callback(report)
         
         except ValueError:
             self.bot.send_message(message.chat.id, "❌ user_id باید عدد باشد!")
     
     def cmd_closeticket(self, message):
         """دستور /closeticket <user_id> - بستن تیکت"""
-        from bot import is_admin
+        from shared_state import is_admin
         
         if not is_admin(message.from_user.id):
             self.bot.send_message(message.chat.id, "❌ شما دسترسی ندارید!")
@@ -495,24 +524,24 @@ class HelpHandlers:
             
             with self.db.get_connection() as conn:
                 HelpDB.close_ticket(conn, target_user_id)
+            writer_for(self.db).audit('ticket_closed', actor_id=message.from_user.id, target_id=target_user_id)
             
             self.bot.send_message(message.chat.id, f"✅ تیکت کاربر {target_user_id} بسته شد!")
             
+            close_ticket_notifications(self.bot, target_user_id)
+
             # اطلاع به کاربر
-            try:
-                self.bot.send_message(
-                    target_user_id,
-                    "✅ تیکت شما بسته شد.\n\nدر صورت نیاز، می‌توانید تیکت جدید باز کنید."
-                )
-            except:
-                pass
+            scheduler_for(self.bot).send_message(
+                target_user_id,
+                "✅ تیکت شما بسته شد.\n\nدر صورت نیاز، می‌توانید تیکت جدید باز کنید."
+            )
         
         except ValueError:
             self.bot.send_message(message.chat.id, "❌ user_id باید عدد باشد!")
     
     def admin_support_panel(self, call):
         """پنل پشتیبانی ادمین"""
-        from bot import is_admin
+        from shared_state import is_admin
         
         if not is_admin(call.from_user.id):
             self.bot.answer_callback_query(call.id, "❌ دسترسی غیرمجاز!", show_alert=True)
@@ -539,13 +568,15 @@ class HelpHandlers:
     
     def admin_view_tickets(self, call):
         """نمایش تیکت‌های باز"""
-        from bot import is_admin
+        from shared_state import is_admin
         
         if not is_admin(call.from_user.id):
             return
         
+        # admin_view_tickets (صفحه اول) یا admin_tickets_pg_{مکان‌نما}
         with self.db.get_connection() as conn:
-            tickets = HelpDB.get_open_tickets(conn)
+            page = HelpDB.get_open_tickets(conn, cursor_from(call, "admin_tickets_pg_"))
+        tickets = page.rows
         
         if not tickets:
             markup = types.InlineKeyboardMarkup()
@@ -570,13 +601,14 @@ class HelpHandlers:
             button_text = f"{unread} کاربر {ticket['user_id']}: {last_msg}"
             markup.add(types.InlineKeyboardButton(button_text, callback_data=f"admin_ticket_{ticket['user_id']}"))
         
+        markup.row(*nav_buttons(page, "admin_tickets_pg_"))
         markup.add(types.InlineKeyboardButton("🔙 بازگشت", callback_data="admin_support_panel"))
         
         self.bot.edit_message_text(text, call.message.chat.id, call.message.message_id, reply_markup=markup)
     
     def admin_view_ticket(self, call):
         """نمایش جزئیات تیکت"""
-        from bot import is_admin
+        from shared_state import is_admin
         
         if not is_admin(call.from_user.id):
             return
@@ -584,7 +616,8 @@ class HelpHandlers:
         user_id = int(call.data.split("_")[2])
         
         with self.db.get_connection() as conn:
-            messages = HelpDB.get_user_messages(conn, user_id, limit=15)
+            messages = HelpDB.get_user_messages(conn, user_id, limit=15,
+                                                table=history_table(self.db, 'support_messages'))
             HelpDB.mark_messages_as_read(conn, user_id, is_from_admin=True)
         
         if not messages:
@@ -609,7 +642,7 @@ class HelpHandlers:
     
     def admin_start_reply(self, call):
         """شروع پاسخ ادمین"""
-        from bot import is_admin, set_state, user_data
+        from shared_state import is_admin, set_state, user_data
         
         if not is_admin(call.from_user.id):
             return
@@ -631,7 +664,7 @@ class HelpHandlers:
     
     def admin_close_ticket(self, call):
         """بستن تیکت"""
-        from bot import is_admin
+        from shared_state import is_admin
         
         if not is_admin(call.from_user.id):
             return
@@ -640,17 +673,17 @@ class HelpHandlers:
         
         with self.db.get_connection() as conn:
             HelpDB.close_ticket(conn, user_id)
+        writer_for(self.db).audit('ticket_closed', actor_id=call.from_user.id, target_id=user_id)
         
         self.bot.answer_callback_query(call.id, "✅ تیکت بسته شد!", show_alert=True)
         
+        close_ticket_notifications(self.bot, user_id)
+
         # اطلاع به کاربر
-        try:
-            self.bot.send_message(
-                user_id,
-                "✅ تیکت شما بسته شد.\n\nدر صورت نیاز، می‌توانید تیکت جدید باز کنید."
-            )
-        except:
-            pass
+        scheduler_for(self.bot).send_message(
+            user_id,
+            "✅ تیکت شما بسته شد.\n\nدر صورت نیاز، می‌توانید تیکت جدید باز کنید."
+        )
         
         # بازگشت به لیست تیکت‌ها
         call.data = "admin_view_tickets"
@@ -659,6 +692,10 @@ class HelpHandlers:
 
 # ===== MESSAGE HANDLERS برای State Management =====
 
+# stateهای متعلق به این ماژول (در bot.py در state_router ثبت می‌شوند)
+HELP_STATES = ("help_waiting_message",)
+HELP_STATE_PREFIXES = ("help_admin_reply_",)
+
 def handle_help_states(bot, db, message, user_id, state, user_data):
     """مدیریت state های سیستم پشتیبانی"""
     
@@ -666,22 +703,22 @@ def handle_help_states(bot, db, message, user_id, state, user_data):
     if state == "help_waiting_message":
         message_text = message.text
         
-        # بررسی محدودیت (با افزایش شمارنده)
+        # بررسی محدودیت (با افزایش شمارنده، همزمان)؛ خود پیام با commit گروهی نوشته می‌شود
+        writer = writer_for(db)
         with db.get_connection() as conn:
             rate_check = HelpDB.check_rate_limit(conn, user_id, increment=True)  # ✅ تغییر اینجا
             
-            if not rate_check['allowed']:
-                bot.send_message(
-                    message.chat.id,
-                    f"⚠️ شما به حد مجاز رسیده‌اید!\n\n"
-                    f"لطفاً {rate_check['minutes_left']} دقیقه دیگر تلاش کنید."
-                )
-                from bot import clear_state
-                clear_state(user_id)
-                return True
-            
-            # ذخیره پیام
-            HelpDB.save_message(conn, user_id, message_text, is_from_admin=False)
+        if not rate_check['allowed']:
+            bot.send_message(
+                message.chat.id,
+                f"⚠️ شما به حد مجاز رسیده‌اید!\n\n"
+                f"لطفاً {rate_check['minutes_left']} دقیقه دیگر تلاش کنید."
+            )
+            clear_state(user_id)
+            return True
+        
+        # ذخیره پیام
+        HelpDB.queue_message(writer, user_id, message_text, is_from_admin=False)
         
         markup = types.InlineKeyboardMarkup()
         markup.add(types.InlineKeyboardButton("🏠 منوی اصلی", callback_data="back_to_main"))
@@ -698,7 +735,6 @@ def handle_help_states(bot, db, message, user_id, state, user_data):
         handlers = HelpHandlers(bot, db)
         handlers.notify_admins_new_message(user_id, message_text)
         
-        from bot import clear_state
         clear_state(user_id)
         return True
     
@@ -722,11 +758,15 @@ def notify_admins_new_message_helper(bot, db, user_id: int, message_text: str):
     markup = types.InlineKeyboardMarkup()
     markup.add(types.InlineKeyboardButton("💬 مشاهده تیکت", callback_data=f"admin_ticket_{user_id}"))
     
-    for admin_id in config.admin_list:
-        try:
-            bot.send_message(admin_id, text, reply_markup=markup)
-        except Exception as e:
-            logger.error(f"خطا در ارسال به ادمین {admin_id}: {e}")
+    # ارسال همزمان به همه ادمین‌ها (خطاها در outbound لاگ می‌شوند)؛ پیام‌ها برای ویرایش بعدی نگه داشته می‌شوند
+    result = fan_out(bot, config.admin_list, text, reply_markup=markup)
+    shared_state.admin_notifications.add(f"ticket:{user_id}", result)
+
+
+def close_ticket_notifications(bot, user_id: int):
+    """ویرایش اعلان‌های تیکت نزد ادمین‌ها بعد از بسته شدن"""
+    for result in shared_state.admin_notifications.pop(f"ticket:{user_id}"):
+        edit_fan_out(bot, result, f"✅ تیکت کاربر `{user_id}` بسته شد.")
 
 # اضافه کردن متد به کلاس
 HelpHandlers.notify_admins_new_message = lambda self, user_id, message_text: notify_admins_new_message_helper(self.bot, self.db, user_id, message_text)
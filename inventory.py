@@ -0,0 +1,615 @@
+# inventory.py
+"""
+موجودی اکانت‌های آماده و خرید فوری
+✅ تغییر مهم: handlers/user.py و models.Account به purchase_account و جدول accounts اشاره می‌کردند
+ولی هیچ‌کدام وجود نداشت. حالا خرید در یک تراکنش کوتاه (BEGIN IMMEDIATE) انجام می‌شود:
+کسر موجودی کیف پول (شرطی)، برداشتن یک اکانت فروخته‌نشده با UPDATE ... RETURNING،
+و ثبت سفارش. هیچ فراخوانی تلگرام داخل تراکنش نیست.
+
+- وقتی snapshot کاتالوگ موجودی صفر نشان می‌دهد، درخواست بدون گرفتن قفل نوشتن رد می‌شود
+  (در فروش ویژه صدها خریدار بعد از تمام شدن موجودی پشت قفل صف نمی‌کشند).
+- هر شکست (موجودی کیف پول، تمام شدن اکانت) کل تراکنش را rollback می‌کند.
+✅ تغییر مهم: دکمه خرید اول یک اکانت را برای مدت کوتاه (reservation_ttl) رزرو می‌کند و
+تایید پرداخت همان اکانت را می‌فروشد؛ بین دیدن محصول و پرداخت، موجودی دیگر از زیر دست کاربر نمی‌رود.
+رزروهای منقضی را sweeper با ایندکس reserved_until به صورت دسته‌ای آزاد می‌کند (بدون پیمایش همه اکانت‌ها).
+
+✅ تغییر مهم: products.stock_count ستون مشتق از accounts است (تعداد اکانت‌های فروخته‌نشده و رزرونشده)
+که triggerهای accounts آن را با هر درج/حذف/فروش/رزرو/آزادسازی یکی کم و زیاد می‌کنند؛
+لیست محصولات هیچ‌وقت COUNT روی accounts نمی‌زند. check_stock / repair_stock انحراف را پیدا و اصلاح می‌کنند.
+
+اجرای مستقیم فایل:
+  python inventory.py                      تست فشار همزمان و بررسی فروش تکراری
+  python inventory.py check shop.db        بررسی همخوانی stock_count با accounts
+  python inventory.py check shop.db --repair
+"""
+
+import logging
+import threading
+import time
+from collections import Counter
+from typing import Dict, Any, Optional
+
+from telebot import types
+
+from callback_router import router
+
+logger = logging.getLogger(__name__)
+
+# ===== DATABASE METHODS =====
+
+class InventoryDB:
+    """متدهای دیتابیس برای اکانت‌های آماده"""
+
+    @staticmethod
+    def init_tables(conn):
+        """ایجاد جداول مورد نیاز"""
+
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS accounts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                product_id INTEGER NOT NULL REFERENCES products(id),
+                login TEXT NOT NULL,
+                password TEXT NOT NULL,
+                additional_info TEXT,
+                is_sold INTEGER NOT NULL DEFAULT 0,
+                sold_to INTEGER,
+                sold_at REAL,
+                order_id INTEGER,
+                created_at REAL
+            )
+        """)
+
+        # فقط اکانت‌های فروخته‌نشده؛ برداشتن اکانت بعدی یک جستجوی ایندکس است
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_accounts_unsold
+            ON accounts (product_id, id) WHERE is_sold = 0
+        """)
+
+    @staticmethod
+    def init_stock_triggers(conn):
+        """stock_count = اکانت‌های is_sold = 0 AND reserved_until IS NULL؛ هر تغییر accounts آن را به‌روز می‌کند"""
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS accounts_stock_insert
+            AFTER INSERT ON accounts
+            WHEN NEW.is_sold = 0 AND NEW.reserved_until IS NULL
+            BEGIN
+                UPDATE products SET stock_count = stock_count + 1 WHERE id = NEW.product_id;
+            END
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS accounts_stock_delete
+            AFTER DELETE ON accounts
+            WHEN OLD.is_sold = 0 AND OLD.reserved_until IS NULL
+            BEGIN
+                UPDATE products SET stock_count = stock_count - 1 WHERE id = OLD.product_id;
+            END
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS accounts_stock_update
+            AFTER UPDATE OF is_sold, reserved_until, product_id ON accounts
+            WHEN (OLD.is_sold = 0 AND OLD.reserved_until IS NULL) IS NOT (NEW.is_sold = 0 AND NEW.reserved_until IS NULL)
+              OR OLD.product_id IS NOT NEW.product_id
+            BEGIN
+                UPDATE products SET stock_count = stock_count - 1
+                WHERE id = OLD.product_id AND OLD.is_sold = 0 AND OLD.reserved_until IS NULL;
+                UPDATE products SET stock_count = stock_count + 1
+                WHERE id = NEW.product_id AND NEW.is_sold = 0 AND NEW.reserved_until IS NULL;
+            END
+        """)
+
+    @staticmethod
+    def stock_drift(conn):
+        """محصولاتی که stock_count آن‌ها با accounts نمی‌خواند: [(product_id, stock_count, actual)]"""
+        cursor = conn.execute("""
+            SELECT id, stock_count, actual FROM (
+                SELECT p.id, p.stock_count,
+                       (SELECT COUNT(*) FROM accounts a
+                        WHERE a.product_id = p.id AND a.is_sold = 0 AND a.reserved_until IS NULL) AS actual
+                FROM products p
+            )
+            WHERE stock_count IS NOT actual
+        """)
+        return [tuple(row) for row in cursor.fetchall()]
+
+    @staticmethod
+    def add_account(conn, product_id: int, login: str, password: str, additional_info: str = None) -> int:
+        cursor = conn.execute("""
+            INSERT INTO accounts (product_id, login, password, additional_info, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, (product_id, login, password, additional_info or None, time.time()))
+        return cursor.lastrowid
+
+    @staticmethod
+    def init_reservations(conn):
+        """ستون‌ها و ایندکس‌های رزرو (migration جدا از init_tables چون accounts قبلاً ساخته شده است)"""
+        from migrations import add_column
+        add_column(conn, 'accounts', 'reserved_by', 'INTEGER')
+        add_column(conn, 'accounts', 'reserved_until', 'REAL')
+        # اکانت بعدی قابل فروش/رزرو
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_accounts_available
+            ON accounts (product_id, id) WHERE is_sold = 0 AND reserved_until IS NULL
+        """)
+        # sweeper: فقط رزروها به ترتیب انقضا
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_accounts_reserved_until
+            ON accounts (reserved_until) WHERE reserved_until IS NOT NULL
+        """)
+        # رزرو فعلی یک کاربر
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_accounts_reserved_by
+            ON accounts (reserved_by, product_id) WHERE reserved_until IS NOT NULL
+        """)
+
+    @staticmethod
+    def claim_account(conn, product_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+        """علامت‌گذاری اولین اکانت فروخته‌نشده و رزرونشده به نام کاربر (None اگر تمام شده)"""
+        row = conn.execute("""
+            UPDATE accounts SET is_sold = 1, sold_to = ?, sold_at = ?
+            WHERE id = (
+                SELECT id FROM accounts
+                WHERE product_id = ? AND is_sold = 0 AND reserved_until IS NULL
+                ORDER BY id LIMIT 1
+            )
+            RETURNING id, login, password, additional_info
+        """, (user_id, time.time(), product_id)).fetchone()
+        return dict(row) if row else None
+
+    @staticmethod
+    def claim_reserved(conn, account_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+        """فروش اکانت رزروشده همین کاربر (None اگر رزرو منقضی یا مال دیگری است)"""
+        now = time.time()
+        row = conn.execute("""
+            UPDATE accounts SET is_sold = 1, sold_to = ?, sold_at = ?, reserved_by = NULL, reserved_until = NULL
+            WHERE id = ? AND reserved_by = ? AND is_sold = 0 AND reserved_until > ?
+            RETURNING id, login, password, additional_info
+        """, (user_id, now, account_id, user_id, now)).fetchone()
+        return dict(row) if row else None
+
+    @staticmethod
+    def reserve(conn, product_id: int, user_id: int, ttl: float) -> Optional[Dict[str, Any]]:
+        """رزرو اولین اکانت آزاد محصول (None اگر آزاد نیست)"""
+        row = conn.execute("""
+            UPDATE accounts SET reserved_by = ?, reserved_until = ?
+            WHERE id = (
+                SELECT id FROM accounts
+                WHERE product_id = ? AND is_sold = 0 AND reserved_until IS NULL
+                ORDER BY id LIMIT 1
+            )
+            RETURNING id, reserved_until
+        """, (user_id, time.time() + ttl, product_id)).fetchone()
+        return dict(row) if row else None
+
+    @staticmethod
+    def get_reservation(conn, product_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+        row = conn.execute("""
+            SELECT id, reserved_until FROM accounts
+            WHERE reserved_by = ? AND product_id = ? AND reserved_until IS NOT NULL AND reserved_until > ?
+        """, (user_id, product_id, time.time())).fetchone()
+        return dict(row) if row else None
+
+    @staticmethod
+    def release(conn, account_id: int, user_id: int) -> Optional[int]:
+        """لغو رزرو توسط خود کاربر. Returns product_id یا None"""
+        row = conn.execute("""
+            UPDATE accounts SET reserved_by = NULL, reserved_until = NULL
+            WHERE id = ? AND reserved_by = ? AND is_sold = 0 AND reserved_until IS NOT NULL
+            RETURNING product_id
+        """, (account_id, user_id)).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def release_expired(conn, now: float, limit: int) -> Counter:
+        """آزادسازی حداکثر limit رزرو منقضی (به ترتیب انقضا). Returns product_id -> تعداد"""
+        rows = conn.execute("""
+            UPDATE accounts SET reserved_by = NULL, reserved_until = NULL
+            WHERE id IN (
+                SELECT id FROM accounts
+                WHERE reserved_until IS NOT NULL AND reserved_until <= ?
+                ORDER BY reserved_until LIMIT ?
+            )
+            RETURNING product_id
+        """, (now, limit)).fetchall()
+        return Counter(row[0] for row in rows)
+
+    @staticmethod
+    def create_order(conn, user_id: int, product_id: int, account_id: int, site_name: str, price: int) -> int:
+        cursor = conn.execute("""
+            INSERT INTO orders (telegram_id, site_name, price, status, created_at, product_id, account_id)
+            VALUES (?, ?, ?, 'delivered', ?, ?, ?)
+        """, (user_id, site_name, price, int(time.time()), product_id, account_id))
+        conn.execute("UPDATE accounts SET order_id = ? WHERE id = ?", (cursor.lastrowid, account_id))
+        return cursor.lastrowid
+
+    @staticmethod
+    def count_unsold(conn, product_id: int) -> int:
+        cursor = conn.execute("SELECT COUNT(*) FROM accounts WHERE product_id = ? AND is_sold = 0", (product_id,))
+        return cursor.fetchone()[0]
+
+
+# ===== ENGINE =====
+
+class _PurchaseAborted(Exception):
+    """شکست خرید داخل تراکنش؛ get_connection آن را rollback می‌کند"""
+
+
+def add_account(db, product_id: int, login: str, password: str, additional_info: str = None) -> Optional[int]:
+    """افزودن اکانت (trigger موجودی را زیاد می‌کند). Returns id اکانت یا None اگر محصول نبود"""
+    with db.get_connection() as conn:
+        if conn.execute("SELECT 1 FROM products WHERE id = ?", (product_id,)).fetchone() is None:
+            return None
+        account_id = InventoryDB.add_account(conn, product_id, login, password, additional_info)
+        db.track_stock(product_id)
+    return account_id
+
+
+def reserve_account(db, user_id: int, product_id: int, ttl: float = 120) -> Dict[str, Any]:
+    """
+    رزرو یک اکانت برای ttl ثانیه (رزرو فعلی کاربر برای همین محصول دوباره برگردانده می‌شود).
+    Returns {"success": True, account_id, expires_at, price, site_name} یا {"success": False, "error": ...}
+    """
+    product = db.get_product_by_id(product_id)
+    if product is None:
+        return {"success": False, "error": "محصول یافت نشد"}
+    user = db.get_or_create_user(user_id, None)
+    if user['balance'] < product['price']:
+        return {"success": False, "error": "موجودی کیف پول کافی نیست"}
+
+    with db.get_connection() as conn:
+        reservation = InventoryDB.get_reservation(conn, product_id, user_id)
+        if reservation is None:
+            if product['stock_count'] <= 0:
+                return {"success": False, "error": "موجودی این محصول تمام شده است"}
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            # دوباره زیر قفل: دو کلیک همزمان یک کاربر دو اکانت رزرو نمی‌کند
+            reservation = InventoryDB.get_reservation(conn, product_id, user_id)
+        if reservation is None:
+            reservation = InventoryDB.reserve(conn, product_id, user_id, ttl)
+            if reservation is None:
+                return {"success": False, "error": "موجودی این محصول تمام شده است"}
+            db.track_stock(product_id)
+    return {
+        "success": True,
+        "account_id": reservation['id'],
+        "expires_at": reservation['reserved_until'],
+        "price": product['price'],
+        "site_name": product['site_name'],
+    }
+
+
+def release_reservation(db, user_id: int, account_id: int) -> bool:
+    with db.get_connection() as conn:
+        product_id = InventoryDB.release(conn, account_id, user_id)
+        if product_id is None:
+            return False
+        db.track_stock(product_id)
+    return True
+
+
+def sweep_expired_reservations(db, batch_size: int = 500) -> int:
+    """آزادسازی دسته‌ای رزروهای منقضی و برگرداندن آن‌ها به stock_count. Returns تعداد"""
+    released = 0
+    while True:
+        with db.get_connection() as conn:
+            counts = InventoryDB.release_expired(conn, time.time(), batch_size)
+            for product_id in counts:
+                db.track_stock(product_id)
+        batch = sum(counts.values())
+        released += batch
+        if batch < batch_size:
+            return released
+
+
+def check_stock(db):
+    """Returns [(product_id, stock_count, actual)] برای محصولات ناهمخوان"""
+    with db.get_connection() as conn:
+        return InventoryDB.stock_drift(conn)
+
+
+def repair_stock(db):
+    """اصلاح stock_count محصولات ناهمخوان (زیر قفل نوشتن تا تغییر همزمان بین بررسی و اصلاح جا نیفتد)"""
+    with db.get_connection() as conn:
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        drift = InventoryDB.stock_drift(conn)
+        conn.executemany("UPDATE products SET stock_count = ? WHERE id = ?",
+                         [(actual, product_id) for product_id, _, actual in drift])
+    return drift
+
+
+def start_reservation_sweeper(db, interval: float = 5.0) -> threading.Thread:
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                released = sweep_expired_reservations(db)
+                if released:
+                    logger.info(f"⏳ {released} رزرو منقضی آزاد شد")
+            except Exception as e:
+                logger.error(f"خطا در آزادسازی رزروها: {e}")
+
+    thread = threading.Thread(target=run, name='reservation-sweeper', daemon=True)
+    thread.start()
+    return thread
+
+
+def purchase_account(db, user_id: int, product_id: int, account_id: Optional[int] = None) -> Dict[str, Any]:
+    """
+    خرید یک اکانت؛ با account_id همان اکانت رزروشده کاربر، بدون آن اولین اکانت آزاد.
+    Returns {"success": True, login, password, additional_info, price, order_id, balance}
+    یا {"success": False, "error": ...}
+    """
+    product = db.get_product_by_id(product_id)
+    if product is None:
+        return {"success": False, "error": "محصول یافت نشد"}
+    if account_id is None and product['stock_count'] <= 0:
+        return {"success": False, "error": "موجودی این محصول تمام شده است"}
+
+    try:
+        with db.get_connection() as conn:
+            # قفل نوشتن از ابتدا: بین خواندن قیمت و نوشتن، نویسنده دیگری snapshot را کهنه نمی‌کند
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT site_name, price FROM products WHERE id = ? AND active = 1",
+                               (product_id,)).fetchone()
+            if row is None:
+                raise _PurchaseAborted("محصول یافت نشد")
+            site_name, price = row[0], row[1]
+
+            balance = db.add_balance(user_id, -price, f"خرید {site_name}", tx_type='purchase', allow_negative=False)
+            if balance is None:
+                raise _PurchaseAborted("موجودی کیف پول کافی نیست")
+
+            if account_id is not None:
+                # اکانت رزروشده در stock_count حساب نشده است
+                account = InventoryDB.claim_reserved(conn, account_id, user_id)
+                if account is None:
+                    raise _PurchaseAborted("مهلت رزرو تمام شده است؛ دوباره خرید را بزنید")
+            else:
+                account = InventoryDB.claim_account(conn, product_id, user_id)
+                if account is None:
+                    raise _PurchaseAborted("موجودی این محصول تمام شده است")
+                db.track_stock(product_id)
+
+            order_id = InventoryDB.create_order(conn, user_id, product_id, account['id'], site_name, price)
+    except _PurchaseAborted as e:
+        return {"success": False, "error": str(e)}
+
+    logger.info(f"✅ خرید - کاربر: {user_id}, محصول: {product_id}, سفارش: {order_id}")
+    return {
+        "success": True,
+        "login": account['login'],
+        "password": account['password'],
+        "additional_info": account['additional_info'],
+        "price": price,
+        "order_id": order_id,
+        "balance": balance,
+    }
+
+
+# ===== HANDLERS =====
+
+class InventoryHandlers:
+    def __init__(self, bot, db, reservation_ttl: float = 120):
+        self.bot = bot
+        self.db = db
+        self.reservation_ttl = reservation_ttl
+
+    def register_handlers(self):
+        """ثبت handlers"""
+        self.bot.message_handler(commands=['addaccount'])(self.cmd_addaccount)
+        router.add_prefix("product_", self.show_product)
+        router.add_prefix("buy_", self.reserve)
+        router.add_prefix("buyok_", self.buy)
+        router.add_prefix("buyno_", self.cancel)
+
+    def show_product(self, call):
+        """جزئیات محصول (از snapshot کاتالوگ)"""
+        product = self.db.get_product_by_id(int(call.data.replace("product_", "")))
+        if product is None:
+            self.bot.answer_callback_query(call.id, "❌ محصول یافت نشد!", show_alert=True)
+            return
+
+        in_stock = product['stock_count'] > 0
+        text = (
+            f"📦 **{product['site_name']}**\n\n"
+            f"💰 قیمت: {product['price']:,} تومان\n"
+            f"📊 موجودی: {product['stock_count']} عدد\n"
+            f"🔔 وضعیت: {'✅ موجود' if in_stock else '❌ ناموجود'}"
+        )
+        markup = types.InlineKeyboardMarkup()
+        if in_stock:
+            markup.add(types.InlineKeyboardButton("🛒 خرید", callback_data=f"buy_{product['id']}"))
+        markup.add(types.InlineKeyboardButton("🔙 بازگشت", callback_data="products_list"))
+        self.bot.edit_message_text(text, call.message.chat.id, call.message.message_id, reply_markup=markup)
+
+    def reserve(self, call):
+        """رزرو یک اکانت و نمایش تایید پرداخت"""
+        product_id = int(call.data.replace("buy_", ""))
+        result = reserve_account(self.db, call.from_user.id, product_id, ttl=self.reservation_ttl)
+        if not result['success']:
+            self.bot.answer_callback_query(call.id, f"❌ {result['error']}", show_alert=True)
+            return
+
+        minutes, seconds = divmod(max(0, int(result['expires_at'] - time.time())), 60)
+        text = (
+            f"🛒 **{result['site_name']}**\n\n"
+            f"💰 مبلغ: {result['price']:,} تومان\n"
+            f"⏳ یک اکانت تا {minutes}:{seconds:02d} دقیقه دیگر برای شما رزرو شد.\n\n"
+            f"برای پرداخت از کیف پول تایید کنید."
+        )
+        markup = types.InlineKeyboardMarkup(row_width=2)
+        markup.add(
+            types.InlineKeyboardButton("✅ پرداخت", callback_data=f"buyok_{product_id}_{result['account_id']}"),
+            types.InlineKeyboardButton("❌ انصراف", callback_data=f"buyno_{product_id}_{result['account_id']}"),
+        )
+        self.bot.edit_message_text(text, call.message.chat.id, call.message.message_id, reply_markup=markup)
+
+    def cancel(self, call):
+        product_id, account_id = map(int, call.data.replace("buyno_", "").split("_"))
+        release_reservation(self.db, call.from_user.id, account_id)
+        call.data = f"product_{product_id}"
+        self.show_product(call)
+
+    def buy(self, call):
+        """پرداخت اکانت رزروشده؛ پیام‌ها بعد از commit فرستاده می‌شوند"""
+        product_id, account_id = map(int, call.data.replace("buyok_", "").split("_"))
+        result = purchase_account(self.db, call.from_user.id, product_id, account_id=account_id)
+        if not result['success']:
+            self.bot.answer_callback_query(call.id, f"❌ {result['error']}", show_alert=True)
+            return
+
+        text = (
+            f"✅ **خرید موفق!**\n\n"
+            f"🔑 **اطلاعات اکانت شما:**\n\n"
+            f"👤 نام کاربری: `{result['login']}`\n"
+            f"🔐 رمز عبور: `{result['password']}`\n"
+        )
+        if result['additional_info']:
+            text += f"\n📋 اطلاعات تکمیلی:\n{result['additional_info']}\n"
+        text += (
+            f"\n💰 مبلغ پرداختی: {result['price']:,} تومان\n"
+            f"💳 موجودی کیف پول: {result['balance']:,} تومان\n"
+            f"🆔 شماره سفارش: #{result['order_id']}\n\n"
+            f"⚠️ لطفاً اطلاعات خود را در جای امن ذخیره کنید."
+        )
+        markup = types.InlineKeyboardMarkup()
+        markup.add(types.InlineKeyboardButton("🏠 منوی اصلی", callback_data="back_to_main"))
+        self.bot.edit_message_text(text, call.message.chat.id, call.message.message_id, reply_markup=markup)
+
+    def cmd_addaccount(self, message):
+        """دستور /addaccount <product_id> <login> <password> [اطلاعات تکمیلی]"""
+        from shared_state import is_admin
+
+        if not is_admin(message.from_user.id):
+            return
+
+        parts = message.text.split(maxsplit=4)
+        if len(parts) < 4 or not parts[1].isdigit():
+            self.bot.send_message(
+                message.chat.id,
+                "❌ فرمت صحیح:\n`/addaccount <product_id> <login> <password> [اطلاعات تکمیلی]`"
+            )
+            return
+
+        product_id = int(parts[1])
+        account_id = add_account(self.db, product_id, parts[2], parts[3], parts[4] if len(parts) > 4 else None)
+        if account_id is None:
+            self.bot.send_message(message.chat.id, f"❌ محصول {product_id} یافت نشد!")
+            return
+        self.bot.send_message(message.chat.id, f"✅ اکانت #{account_id} به محصول {product_id} اضافه شد.")
+
+
+# ===== STRESS TEST =====
+
+def _stress(buyers: int = 400, accounts: int = 100, price: int = 1000, pool_size: int = 8, reserve: bool = False):
+    """
+    همه خریداران با هم (barrier) یک محصول را می‌خرند؛ نصف آن‌ها پول کافی برای یک خرید دارند.
+    reserve=True: هر خریدار اول رزرو می‌کند و بعد همان اکانت را پرداخت می‌کند.
+    Returns تعداد خطاهای سازگاری (0 = بدون فروش تکراری)
+    """
+    import os
+    import tempfile
+    import threading
+    from database import Database
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'stress.db'), pool_size=pool_size, pool_timeout=60,
+                      pragma_profile='throughput')
+        product_id = db.add_product('Flash Sale', price)
+        for i in range(accounts):
+            add_account(db, product_id, f"user{i}", f"pass{i}")
+        for uid in range(1, buyers + 1):
+            db.get_or_create_user(uid, None)
+            if uid % 2 == 0:
+                db.add_balance(uid, price, 'stress')
+
+        results, latencies = {}, []
+        barrier = threading.Barrier(buyers)
+
+        def buyer(uid):
+            barrier.wait()
+            start = time.perf_counter()
+            if reserve:
+                held = reserve_account(db, uid, product_id)
+                results[uid] = purchase_account(db, uid, product_id, account_id=held['account_id']) \
+                    if held['success'] else held
+            else:
+                results[uid] = purchase_account(db, uid, product_id)
+            latencies.append(time.perf_counter() - start)
+
+        threads = [threading.Thread(target=buyer, args=(uid,)) for uid in range(1, buyers + 1)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+
+        wins = [r for r in results.values() if r['success']]
+        errors = {}
+        for r in results.values():
+            if not r['success']:
+                errors[r['error']] = errors.get(r['error'], 0) + 1
+
+        problems = []
+        with db.get_connection() as conn:
+            sold = conn.execute("SELECT COUNT(*) FROM accounts WHERE is_sold = 1").fetchone()[0]
+            orders = conn.execute("SELECT COUNT(*) FROM orders WHERE product_id = ?", (product_id,)).fetchone()[0]
+            stock = conn.execute("SELECT stock_count FROM products WHERE id = ?", (product_id,)).fetchone()[0]
+            negative = conn.execute("SELECT COUNT(*) FROM users WHERE balance < 0").fetchone()[0]
+            held = conn.execute("SELECT COUNT(*) FROM accounts WHERE reserved_until IS NOT NULL").fetchone()[0]
+            spent = conn.execute("SELECT -COALESCE(SUM(amount), 0) FROM transactions WHERE type = 'purchase'").fetchone()[0]
+            double = conn.execute("SELECT COUNT(*) FROM (SELECT account_id FROM orders WHERE account_id IS NOT NULL "
+                                  "GROUP BY account_id HAVING COUNT(*) > 1)").fetchone()[0]
+        if len({r['login'] for r in wins}) != len(wins):
+            problems.append("یک اکانت به دو خریدار داده شد")
+        if double:
+            problems.append(f"{double} اکانت در بیش از یک سفارش")
+        if not (sold == orders == len(wins)):
+            problems.append(f"sold={sold} orders={orders} wins={len(wins)}")
+        if stock != accounts - sold:
+            problems.append(f"stock_count={stock} انتظار {accounts - sold}")
+        if held:
+            problems.append(f"{held} رزرو باقی‌مانده")
+        if negative:
+            problems.append(f"{negative} کاربر با موجودی منفی")
+        if spent != len(wins) * price:
+            problems.append(f"مبلغ کسر شده {spent} انتظار {len(wins) * price}")
+        if db.get_product_by_id(product_id)['stock_count'] != stock:
+            problems.append("snapshot کاتالوگ با دیتابیس همخوان نیست")
+        db.close()
+
+    latencies.sort()
+    print(f"{buyers} خریدار همزمان، {accounts} اکانت، {buyers // 2} خریدار با موجودی کافی"
+          f"{' (رزرو + پرداخت)' if reserve else ''}")
+    print(f"موفق: {len(wins)}  ناموفق: {errors}")
+    print(f"زمان کل: {elapsed * 1000:.0f}ms  p50: {latencies[len(latencies) // 2] * 1000:.2f}ms  "
+          f"p99: {latencies[int(len(latencies) * 0.99)] * 1000:.2f}ms")
+    for problem in problems:
+        print(f"❌ {problem}")
+    print("✅ بدون فروش تکراری" if not problems else f"❌ {len(problems)} مشکل")
+    return len(problems)
+
+
+def _check(path: str, repair: bool) -> int:
+    from database import Database
+
+    db = Database(path, pool_size=1)
+    drift = repair_stock(db) if repair else check_stock(db)
+    for product_id, stored, actual in drift:
+        print(f"{'🔧' if repair else '❌'} محصول {product_id}: stock_count={stored} ولی {actual} اکانت آزاد")
+    print(f"{len(drift)} محصول ناهمخوان" + (" (اصلاح شد)" if repair and drift else ""))
+    db.close()
+    return 0 if repair or not drift else 1
+
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) > 2 and sys.argv[1] == 'check':
+        sys.exit(_check(sys.argv[2], '--repair' in sys.argv[3:]))
+    failures = _stress()
+    print()
+    failures += _stress(reserve=True)
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,122 @@
+# keyboard_cache.py
+"""
+کیبوردهای از پیش ساخته‌شده
+✅ تغییر مهم: منوی اصلی (نسخه ادمین و کاربر) و منوهای ثابت یکبار ساخته و به JSON تبدیل می‌شوند؛
+telebot برای FrozenMarkup فقط همان رشته آماده را می‌فرستد.
+✅ کیبورد لیست محصولات بر اساس نسخه snapshot کاتالوگ (Database.get_catalog) نگه داشته می‌شود و
+با هر تغییر در جدول products (از جمله موجودی) از روی همان snapshot دوباره ساخته می‌شود.
+
+اجرای مستقیم فایل (python keyboard_cache.py) بنچمارک ساخت کیبورد را اجرا می‌کند.
+"""
+
+import threading
+from typing import Tuple, Optional
+
+from telebot import types
+
+
+class FrozenMarkup(types.JsonSerializable):
+    """markup تغییرناپذیر با JSON از پیش محاسبه‌شده"""
+
+    __slots__ = ('_json',)
+
+    def __init__(self, markup):
+        self._json = markup.to_json()
+
+    def to_json(self):
+        return self._json
+
+
+def _button_markup(*buttons: Tuple[str, str], row_width: int = 1) -> FrozenMarkup:
+    markup = types.InlineKeyboardMarkup(row_width=row_width)
+    markup.add(*[types.InlineKeyboardButton(text, callback_data=data) for text, data in buttons])
+    return FrozenMarkup(markup)
+
+
+# ===== منوهای ثابت =====
+
+_MAIN_MENU_BUTTONS = (
+    ("🛒 لیست محصولات", "products_list"),
+    ("🎯 خرید اکانت سفارشی", "account_maker"),
+    ("💳 کیف پول", "wallet"),
+    ("📦 سفارش‌های من", "my_orders"),
+    ("💬 پشتیبانی", "help_support"),
+)
+
+MAIN_MENU = _button_markup(*_MAIN_MENU_BUTTONS)
+MAIN_MENU_ADMIN = _button_markup(*_MAIN_MENU_BUTTONS, ("🔧 پنل ادمین", "admin_menu"))
+
+WALLET_MENU = _button_markup(
+    ("💳 پرداخت مستقیم", "payment_zibal"),
+    ("💎 پرداخت با ارز دیجیتال", "payment_digital"),
+    ("🔙 بازگشت", "back_to_main"),
+)
+
+ADMIN_MENU = _button_markup(("🛡️ مدیریت اکانت سفارشی", "admin_account_maker"))
+
+BACK_TO_MAIN = _button_markup(("🔙 بازگشت", "back_to_main"))
+
+
+def main_menu(is_admin: bool) -> FrozenMarkup:
+    return MAIN_MENU_ADMIN if is_admin else MAIN_MENU
+
+
+# ===== کیبوردهای پویا =====
+
+class ProductsKeyboardCache:
+    """کیبورد لیست محصولات؛ فقط وقتی snapshot کاتالوگ عوض شود دوباره ساخته می‌شود"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version: Optional[Tuple[int, int]] = None
+        self._markup: Optional[FrozenMarkup] = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, catalog) -> FrozenMarkup:
+        """catalog: database.CatalogSnapshot"""
+        version = catalog.key
+        with self._lock:
+            if version == self._version:
+                self.hits += 1
+                return self._markup
+        markup = build_products_markup(catalog.products)
+        with self._lock:
+            self.misses += 1
+            self._version, self._markup = version, markup
+        return markup
+
+
+def build_products_markup(products) -> FrozenMarkup:
+    return _button_markup(
+        *[(f"✅ {p['site_name']} - {p['stock_count']} عدد", f"product_{p['id']}") for p in products],
+        ("🔙 بازگشت", "back_to_main"),
+    )
+
+
+# نمونه مشترک
+products_keyboard = ProductsKeyboardCache()
+
+
+# ===== BENCHMARK =====
+
+def _benchmark(rounds: int = 20000):
+    import time
+    from telebot import apihelper
+
+    def rebuild():
+        markup = types.InlineKeyboardMarkup(row_width=1)
+        markup.add(*[types.InlineKeyboardButton(text, callback_data=data)
+                     for text, data in _MAIN_MENU_BUTTONS + (("🔧 پنل ادمین", "admin_menu"),)])
+        return markup
+
+    print(f"{'':<10}{'µs per main menu':>18}")
+    for name, get in (('rebuild', rebuild), ('cached', lambda: MAIN_MENU_ADMIN)):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            apihelper._convert_markup(get())
+        print(f"{name:<10}{(time.perf_counter() - start) / rounds * 1e6:>18.2f}")
+
+
+if __name__ == '__main__':
+    _benchmark()
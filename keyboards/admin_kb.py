@@ -1,7 +1,10 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from functools import lru_cache
 from typing import List
 from models import Product
 
+# کیبوردهای ثابت یکبار ساخته می‌شوند (نمونه برگشتی نباید تغییر داده شود)
+@lru_cache(maxsize=None)
 def admin_menu_keyboard() -> InlineKeyboardMarkup:
     """منوی ادمین"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -43,6 +46,7 @@ def admin_product_actions_keyboard(product_id: int, is_active: bool) -> InlineKe
     ])
     return keyboard
 
+@lru_cache(maxsize=None)
 def cancel_keyboard() -> InlineKeyboardMarkup:
     """دکمه لغو"""
     return InlineKeyboardMarkup(inline_keyboard=[
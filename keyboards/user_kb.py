@@ -1,7 +1,10 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from functools import lru_cache
 from typing import List
 from models import Product
 
+# کیبوردهای ثابت یکبار ساخته می‌شوند (نمونه برگشتی نباید تغییر داده شود)
+@lru_cache(maxsize=None)
 def main_menu_keyboard() -> InlineKeyboardMarkup:
     """منوی اصلی کاربر"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -42,6 +45,7 @@ def product_detail_keyboard(product_id: int, has_stock: bool) -> InlineKeyboardM
     
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+@lru_cache(maxsize=None)
 def back_to_main_keyboard() -> InlineKeyboardMarkup:
     """دکمه بازگشت به منوی اصلی"""
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -0,0 +1,311 @@
+# migrations.py
+"""
+مهاجرت‌های نسخه‌دار schema
+✅ تغییر مهم: ساخت جداول قبلاً بین Database._ensure_tables و init_tables سه ماژول پخش بود و
+init_tableها از هیچ‌جا صدا زده نمی‌شدند (جدول transactions هم اصلاً ساخته نمی‌شد).
+حالا همه مراحل به ترتیب در جدول schema_version ثبت می‌شوند.
+✅ تغییر مهم: هر مرحله با ثبت نسخه‌اش در یک تراکنش صریح (BEGIN IMMEDIATE) اجرا می‌شود؛ sqlite3 پایتون برای
+CREATE/ALTER خودش تراکنش باز نمی‌کند و خطای وسط مرحله قبلاً نیمی از schema را بدون ثبت نسخه جا می‌گذاشت
+(اجرای بعدی روی ALTER تکراری شکست می‌خورد). حالا خطا کل مرحله را rollback می‌کند و اجرای بعدی از اول آن را
+اعمال می‌کند؛ ADD COLUMNها هم با add_column (بررسی PRAGMA table_info) تکرارپذیرند.
+
+- مسیر سریع راه‌اندازی: فقط یک SELECT روی schema_version؛ اگر همه مراحل اعمال شده باشند کاری انجام نمی‌شود.
+- مراحل سنگین (ساخت ایندکس، backfill) با background=True بعد از بالا آمدن webhook در thread جدا اجرا می‌شوند.
+
+برای تغییر schema یک Migration جدید با version بزرگ‌تر به انتهای MIGRATIONS اضافه کنید؛
+مراحل قبلی را تغییر ندهید.
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, List, NamedTuple, Set
+
+logger = logging.getLogger(__name__)
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable  # apply(conn)
+    background: bool = False
+
+
+def add_column(conn, table: str, column: str, decl: str):
+    """ALTER TABLE ... ADD COLUMN فقط اگر ستون هنوز وجود نداشته باشد"""
+    if column not in {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+# ===== مراحل =====
+
+def _base_tables(conn):
+    from database import Database
+    Database._create_tables(conn.cursor())
+
+
+def _zibal_tables(conn):
+    from payment_zibal import PaymentZibalDB
+    PaymentZibalDB.init_tables(conn)
+
+
+def _digital_tables(conn):
+    from payment_digital import PaymentDigitalDB
+    PaymentDigitalDB.init_tables(conn)
+
+
+def _help_tables(conn):
+    from help import HelpDB
+    HelpDB.init_tables(conn)
+
+
+def _broadcast_tables(conn):
+    from broadcast import BroadcastDB
+    BroadcastDB.init_tables(conn)
+
+
+def _transactions_table(conn):
+    # تراکنش‌های کیف پول (payment_zibal / payment_digital / payment_admin در آن می‌نویسند)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            amount INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            description TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def _write_behind_tables(conn):
+    # write_behind.WriteBehind.audit
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS audit_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event TEXT NOT NULL,
+            actor_id INTEGER,
+            target_id INTEGER,
+            details TEXT,
+            created_at REAL NOT NULL
+        )
+    """)
+    # کاربرانی که در حالت تعمیر (update.py) به ربات پیام داده‌اند
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS maintenance_waitlist (
+            user_id INTEGER PRIMARY KEY,
+            first_seen REAL NOT NULL,
+            last_seen REAL NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 1
+        )
+    """)
+
+
+def _catalog_stock_version(conn):
+    # تغییر موجودی دیگر کل کاتالوگ را نامعتبر نمی‌کند (database.CatalogCache)؛
+    # ستون جدید products که در لیست نمایش داده می‌شود باید به UPDATE OF اضافه شود
+    add_column(conn, 'catalog_version', 'stock_version', 'INTEGER NOT NULL DEFAULT 0')
+    conn.execute("DROP TRIGGER IF EXISTS products_version_update")
+    conn.execute("""
+        CREATE TRIGGER products_version_update
+        AFTER UPDATE OF site_name, price, active ON products
+        BEGIN
+            UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS products_stock_version
+        AFTER UPDATE OF stock_count ON products
+        BEGIN
+            UPDATE catalog_version SET stock_version = stock_version + 1 WHERE id = 1;
+        END
+    """)
+
+
+def _processed_updates_table(conn):
+    # update_dedup.UpdateDeduplicator (قبلاً خودش با اتصال جدا می‌ساخت)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS processed_updates (
+            update_id INTEGER PRIMARY KEY,
+            seen_at REAL NOT NULL
+        )
+    """)
+
+
+def _inventory_tables(conn):
+    from inventory import InventoryDB
+    InventoryDB.init_tables(conn)
+    # سفارش‌های خرید فوری به محصول و اکانت تحویل‌شده اشاره می‌کنند
+    add_column(conn, 'orders', 'product_id', 'INTEGER')
+    add_column(conn, 'orders', 'account_id', 'INTEGER')
+
+
+def _inventory_reservations(conn):
+    from inventory import InventoryDB
+    InventoryDB.init_reservations(conn)
+
+
+def _accounts_stock_triggers(conn):
+    from inventory import InventoryDB
+    InventoryDB.init_stock_triggers(conn)
+    # مقدار اولیه از روی accounts (موجودی دستی قبلی بدون اکانت قابل فروش نبود)
+    conn.executemany("UPDATE products SET stock_count = ? WHERE id = ?",
+                     [(actual, product_id) for product_id, _, actual in InventoryDB.stock_drift(conn)])
+
+
+def _stat_counters(conn):
+    from stats import StatsDB
+    StatsDB.init_tables(conn)
+
+
+def _payment_daily_rollups(conn):
+    from stats import StatsDB
+    StatsDB.init_rollups(conn)
+
+
+def _payment_daily_table(conn):
+    # payment_totals (/stats) از اولین راه‌اندازی به payment_daily نیاز دارد؛ قبلاً تا تمام شدن migration
+    # پس‌زمینه 14 با «no such table» خطا می‌داد. جدول و triggerها اینجا، فقط محاسبه اولیه در 14 می‌ماند
+    from stats import StatsDB
+    StatsDB.create_rollup_table(conn)
+
+
+def _archive_support(conn):
+    # حذف هنگام بایگانی (archive.py) شمارنده‌ها و payment_daily را کم نکند
+    from stats import StatsDB
+    StatsDB.create_triggers(conn)
+    # payment_daily را migration پس‌زمینه 14 می‌سازد (با همین triggerها)؛ تا آن موقع trigger روی جدولی
+    # که وجود ندارد هر INSERT/UPDATE تراکنش را خراب می‌کند
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'payment_daily'").fetchone():
+        StatsDB.create_rollup_triggers(conn)
+
+
+def _rebuild_stat_counters(conn):
+    # tickets_open قبلاً با INSERT OR REPLACE روی support_tickets بالا رفته بود
+    from stats import StatsDB
+    StatsDB.rebuild(conn)
+
+
+def _broadcast_audience(conn):
+    # پیام پایان تعمیر به maintenance_waitlist (broadcast.AUDIENCES)
+    add_column(conn, 'broadcasts', 'audience', "TEXT NOT NULL DEFAULT 'users'")
+
+
+def _indexes(conn):
+    from db_indexes import ensure_indexes
+    ensure_indexes(conn)
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, 'base_tables', _base_tables),
+    Migration(2, 'zibal_tables', _zibal_tables),
+    Migration(3, 'digital_tables', _digital_tables),
+    Migration(4, 'help_tables', _help_tables),
+    Migration(5, 'broadcast_tables', _broadcast_tables),
+    Migration(6, 'transactions_table', _transactions_table),
+    Migration(7, 'hot_query_indexes', _indexes, background=True),
+    Migration(8, 'write_behind_tables', _write_behind_tables),
+    Migration(9, 'catalog_stock_version', _catalog_stock_version),
+    Migration(10, 'inventory_tables', _inventory_tables),
+    Migration(11, 'inventory_reservations', _inventory_reservations),
+    Migration(12, 'accounts_stock_triggers', _accounts_stock_triggers),
+    Migration(13, 'stat_counters', _stat_counters),
+    # محاسبه اولیه کل تاریخچه تراکنش‌ها را می‌خواند
+    Migration(14, 'payment_daily_rollups', _payment_daily_rollups, background=True),
+    Migration(15, 'archive_support', _archive_support),
+    # ایندکس‌های created_at که بایگانی batchها را با آن‌ها پیدا می‌کند
+    Migration(16, 'archive_indexes', _indexes, background=True),
+    Migration(17, 'rebuild_stat_counters', _rebuild_stat_counters, background=True),
+    Migration(18, 'processed_updates', _processed_updates_table),
+    Migration(19, 'broadcast_audience', _broadcast_audience),
+    Migration(20, 'payment_daily_table', _payment_daily_table),
+]
+
+
+# ===== اجرا =====
+
+def _ensure_version_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at REAL NOT NULL,
+            duration_ms REAL
+        )
+    """)
+
+
+def _applied_versions(conn) -> Set[int]:
+    return {row[0] for row in conn.execute("SELECT version FROM schema_version")}
+
+
+def is_current(db) -> bool:
+    """مسیر سریع: یک query روی schema_version"""
+    import sqlite3
+    with db.get_connection() as conn:
+        try:
+            count, latest = conn.execute("SELECT COUNT(*), MAX(version) FROM schema_version").fetchone()
+        except sqlite3.OperationalError:
+            return False  # دیتابیس جدید
+    return count == len(MIGRATIONS) and latest == MIGRATIONS[-1].version
+
+
+def _apply(db, migration: Migration) -> bool:
+    """
+    اعمال یک مرحله و ثبت نسخه در یک تراکنش (get_connection در پایان commit و با خطا rollback می‌کند).
+    Returns False اگر اتصال دیگری همزمان همین مرحله را اعمال کرده باشد
+    """
+    start = time.perf_counter()
+    with db.get_connection() as conn:
+        # BEGIN صریح تا DDL هم جزو تراکنش باشد؛ IMMEDIATE قفل نوشتن را از همین ابتدا می‌گیرد
+        conn.execute("BEGIN IMMEDIATE")
+        if conn.execute("SELECT 1 FROM schema_version WHERE version = ?", (migration.version,)).fetchone():
+            return False
+        migration.apply(conn)
+        conn.execute(
+            "INSERT OR REPLACE INTO schema_version (version, name, applied_at, duration_ms) VALUES (?, ?, ?, ?)",
+            (migration.version, migration.name, time.time(), (time.perf_counter() - start) * 1000)
+        )
+    logger.info(f"✅ migration {migration.version} ({migration.name}) اعمال شد")
+    return True
+
+
+def pending(db, background: bool) -> List[Migration]:
+    with db.get_connection() as conn:
+        _ensure_version_table(conn)
+        applied = _applied_versions(conn)
+    return [m for m in MIGRATIONS if m.background == background and m.version not in applied]
+
+
+def migrate(db) -> int:
+    """
+    اجرای مراحل foreground که هنوز اعمال نشده‌اند (هنگام ساخت Database).
+    Returns تعداد مراحل اعمال‌شده
+    """
+    if is_current(db):
+        return 0
+    return sum(_apply(db, migration) for migration in pending(db, background=False))
+
+
+def run_background(db) -> int:
+    """اجرای مراحل سنگین به صورت همزمان (برای اسکریپت‌ها و بررسی‌ها)"""
+    return sum(_apply(db, migration) for migration in pending(db, background=True))
+
+
+def start_background(db, delay: float = 5.0):
+    """اجرای مراحل سنگین در thread جدا، delay ثانیه بعد از راه‌اندازی تا webhook اول بالا بیاید"""
+    if is_current(db):
+        return None
+
+    def run():
+        time.sleep(delay)
+        try:
+            count = run_background(db)
+            if count:
+                logger.info(f"✅ {count} migration پس‌زمینه تمام شد")
+        except Exception as e:
+            logger.error(f"خطا در migration پس‌زمینه: {e}", exc_info=True)
+
+    thread = threading.Thread(target=run, name='background-migrations', daemon=True)
+    thread.start()
+    return thread
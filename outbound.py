@@ -0,0 +1,379 @@
+# outbound.py
+"""
+زمان‌بند پیام‌های خروجی با رعایت محدودیت‌های flood تلگرام
+✅ تغییر مهم: handlerها پیام را در صف می‌گذارند و منتظر شبکه نمی‌مانند.
+- token bucket سراسری (حدود 30 پیام در ثانیه) و token bucket برای هر چت (حدود 1 پیام در ثانیه)
+- پاسخ 429 با retry_after رعایت می‌شود و پیام دوباره (با حفظ ترتیب چت) فرستاده می‌شود
+- پیام‌های کاربر (PRIORITY_USER) قبل از اعلان‌های گروهی (PRIORITY_BULK) ارسال می‌شوند
+
+اجرای مستقیم فایل (python outbound.py) یک شبیه‌سازی با bot ساختگی اجرا می‌کند.
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait as futures_wait
+from typing import Dict, Any, Optional, Iterable
+
+from telebot.apihelper import ApiTelegramException
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_USER = 0  # پاسخ/اطلاع مستقیم به کاربر
+PRIORITY_BULK = 1  # اعلان‌های ادمین و پیام‌های گروهی
+
+
+class TokenBucket:
+    """token bucket ساده؛ قفل بیرونی (زمان‌بند) از آن محافظت می‌کند"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """چند ثانیه تا آزاد شدن یک token (0 یعنی همین حالا)"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Job:
+    __slots__ = ('method', 'args', 'kwargs', 'priority', 'future', 'attempts')
+
+    def __init__(self, method: str, args, kwargs, priority: int):
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.future: Future = Future()
+        self.attempts = 0
+
+
+class _ChatQueue:
+    __slots__ = ('jobs', 'bucket', 'blocked_until', 'scheduled', 'in_flight')
+
+    def __init__(self, bucket: TokenBucket):
+        self.jobs: deque = deque()
+        self.bucket = bucket
+        self.blocked_until = 0.0
+        self.scheduled = False  # در heap آماده یا تاخیری هست
+        self.in_flight = False  # یک پیام این چت در حال ارسال است (حفظ ترتیب)
+
+
+class OutboundScheduler:
+    """صف خروجی: یک thread زمان‌بند + pool از workerها برای فراخوانی Bot API"""
+
+    CLEANUP_INTERVAL = 60  # ثانیه؛ حذف bucketهای پر شده چت‌های بیکار
+
+    def __init__(self, bot, global_rate: float = 30, per_chat_rate: float = 1, per_chat_burst: int = 3,
+                 workers: int = 4, max_retries: int = 3):
+        self.bot = bot
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: Dict[int, _ChatQueue] = {}
+        self._ready = []    # (priority, seq, chat_id)
+        self._delayed = []  # (ready_at, seq, chat_id)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='outbound')
+        self._thread: Optional[threading.Thread] = None
+        self._last_cleanup = time.monotonic()
+
+        # آمار
+        self.enqueued = 0
+        self.sent = 0
+        self.failed = 0
+        self.rate_limited = 0
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._dispatch_loop, name='outbound-scheduler', daemon=True)
+            self._thread.start()
+        logger.info("✅ زمان‌بند پیام‌های خروجی راه‌اندازی شد")
+
+    # ===== API =====
+
+    def submit(self, chat_id: int, method: str, *args, priority: int = PRIORITY_USER, **kwargs) -> Future:
+        """
+        صف کردن bot.<method>(chat_id, *args, **kwargs)
+        Returns Future که نتیجه فراخوانی (مثلاً Message) یا خطا را نگه می‌دارد
+        """
+        return self._enqueue(chat_id, _Job(method, (chat_id,) + args, kwargs, priority))
+
+    def send_message(self, chat_id: int, text: str, priority: int = PRIORITY_USER, **kwargs) -> Future:
+        return self.submit(chat_id, 'send_message', text, priority=priority, **kwargs)
+
+    def edit_message_text(self, chat_id: int, message_id: int, text: str, priority: int = PRIORITY_USER,
+                          **kwargs) -> Future:
+        # در telebot ترتیب آرگومان‌ها (text, chat_id, message_id) است
+        return self._enqueue(chat_id, _Job('edit_message_text', (text, chat_id, message_id), kwargs, priority))
+
+    def _enqueue(self, chat_id: int, job: '_Job') -> Future:
+        with self._cond:
+            chat = self._chats.get(chat_id)
+            if chat is None:
+                chat = self._chats[chat_id] = _ChatQueue(TokenBucket(self.per_chat_rate, self.per_chat_burst))
+            chat.jobs.append(job)
+            self.enqueued += 1
+            if not chat.scheduled and not chat.in_flight:
+                self._schedule(chat_id, chat, time.monotonic())
+            self._cond.notify()
+        return job.future
+
+    def pending(self) -> int:
+        with self._cond:
+            return sum(len(c.jobs) for c in self._chats.values())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'pending': sum(len(c.jobs) for c in self._chats.values()),
+                'chats': len(self._chats),
+                'enqueued': self.enqueued,
+                'sent': self.sent,
+                'failed': self.failed,
+                'rate_limited': self.rate_limited,
+            }
+
+    # ===== داخلی (با قفل _cond صدا زده می‌شوند) =====
+
+    def _schedule(self, chat_id: int, chat: _ChatQueue, now: float):
+        if chat.blocked_until > now:
+            heapq.heappush(self._delayed, (chat.blocked_until, next(self._seq), chat_id))
+        else:
+            heapq.heappush(self._ready, (chat.jobs[0].priority, next(self._seq), chat_id))
+        chat.scheduled = True
+
+    def _cleanup(self, now: float):
+        for chat_id in [cid for cid, c in self._chats.items()
+                        if not c.jobs and not c.in_flight and not c.scheduled
+                        and c.blocked_until <= now and c.bucket.is_full(now)]:
+            del self._chats[chat_id]
+        self._last_cleanup = now
+
+    def _dispatch_loop(self):
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                while self._delayed and self._delayed[0][0] <= now:
+                    _, _, chat_id = heapq.heappop(self._delayed)
+                    heapq.heappush(self._ready, (self._chats[chat_id].jobs[0].priority, next(self._seq), chat_id))
+
+                if now - self._last_cleanup > self.CLEANUP_INTERVAL:
+                    self._cleanup(now)
+
+                if not self._ready:
+                    timeout = self._delayed[0][0] - now if self._delayed else None
+                    self._cond.wait(timeout)
+                    continue
+
+                global_wait = self._global.delay(now)
+                if global_wait > 0:
+                    self._cond.wait(global_wait)
+                    continue
+
+                _, _, chat_id = heapq.heappop(self._ready)
+                chat = self._chats[chat_id]
+                chat_wait = max(chat.bucket.delay(now), chat.blocked_until - now)
+                if chat_wait > 0:
+                    heapq.heappush(self._delayed, (now + chat_wait, next(self._seq), chat_id))
+                    continue
+
+                job = chat.jobs.popleft()
+                chat.scheduled = False
+                chat.in_flight = True
+                self._global.take(now)
+                chat.bucket.take(now)
+
+            self._executor.submit(self._run, chat_id, job)
+
+    def _run(self, chat_id: int, job: _Job):
+        job.attempts += 1
+        retry_after = None
+        try:
+            result = getattr(self.bot, job.method)(*job.args, **job.kwargs)
+        except ApiTelegramException as e:
+            if e.error_code == 429 and job.attempts <= self.max_retries:
+                retry_after = (e.result_json or {}).get('parameters', {}).get('retry_after', 1)
+            else:
+                self._finish_error(chat_id, job, e)
+        except Exception as e:
+            self._finish_error(chat_id, job, e)
+        else:
+            job.future.set_result(result)
+            with self._cond:
+                self.sent += 1
+
+        with self._cond:
+            chat = self._chats[chat_id]
+            chat.in_flight = False
+            now = time.monotonic()
+            if retry_after is not None:
+                self.rate_limited += 1
+                logger.warning(f"⏳ 429 برای چت {chat_id}؛ تلاش دوباره بعد از {retry_after} ثانیه")
+                chat.jobs.appendleft(job)
+                chat.blocked_until = now + retry_after
+            if chat.jobs:
+                self._schedule(chat_id, chat, now)
+                self._cond.notify()
+
+    def _finish_error(self, chat_id: int, job: _Job, error: Exception):
+        logger.error(f"خطا در {job.method} به چت {chat_id}: {error}")
+        job.future.set_exception(error)
+        with self._cond:
+            self.failed += 1
+
+
+# یک زمان‌بند برای هر bot (مثل shared_state، بین ماژول‌ها مشترک است)
+_schedulers: Dict[int, OutboundScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def scheduler_for(bot, **options) -> OutboundScheduler:
+    """زمان‌بند مربوط به bot؛ اولین فراخوانی (در bot.py) تنظیمات را تعیین می‌کند"""
+    with _schedulers_lock:
+        scheduler = _schedulers.get(id(bot))
+        if scheduler is None:
+            scheduler = _schedulers[id(bot)] = OutboundScheduler(bot, **options)
+            scheduler.start()
+        return scheduler
+
+
+# ===== FAN-OUT =====
+
+class FanOutResult:
+    """نتیجه ارسال یک پیام به چند گیرنده: chat_id -> Future"""
+
+    def __init__(self, futures: Dict[int, Future]):
+        self.futures = futures
+        self._lock = threading.Lock()
+        self._remaining = len(futures)
+        self._callbacks = []
+        for future in futures.values():
+            future.add_done_callback(self._on_done)
+
+    def _on_done(self, _future):
+        with self._lock:
+            self._remaining -= 1
+            callbacks = self._callbacks if self._remaining == 0 else []
+        for callback in callbacks:
+            callback(self)
+
+    def done(self) -> bool:
+        with self._lock:
+            return self._remaining == 0
+
+    def add_done_callback(self, callback):
+        """callback(result) بعد از تمام شدن همه ارسال‌ها (یا فوراً اگر تمام شده باشند)"""
+        with self._lock:
+            if self._remaining:
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def wait(self, timeout: Optional[float] = None) -> 'FanOutResult':
+        futures_wait(list(self.futures.values()), timeout=timeout)
+        return self
+
+    @property
+    def sent(self) -> Dict[int, int]:
+        """chat_id -> message_id برای ارسال‌های موفق"""
+        return {chat_id: f.result().message_id for chat_id, f in self.futures.items()
+                if f.done() and f.exception() is None}
+
+    @property
+    def failed(self) -> Dict[int, Exception]:
+        return {chat_id: f.exception() for chat_id, f in self.futures.items()
+                if f.done() and f.exception() is not None}
+
+
+def fan_out(bot, chat_ids: Iterable[int], text: str, priority: int = PRIORITY_BULK, **kwargs) -> FanOutResult:
+    """
+    ارسال همزمان یک پیام به چند چت (مثلاً همه ادمین‌ها) از طریق workerهای زمان‌بند.
+    منتظر نمی‌ماند؛ برای نتیجه از wait() یا add_done_callback() استفاده کنید.
+    """
+    outbound = scheduler_for(bot)
+    return FanOutResult({chat_id: outbound.send_message(chat_id, text, priority=priority, **kwargs)
+                         for chat_id in dict.fromkeys(chat_ids)})
+
+
+def edit_fan_out(bot, result: FanOutResult, text: str, **kwargs):
+    """ویرایش در جای پیام‌های یک fan_out (مثلاً بعد از تایید سفارش) وقتی ارسال‌ها تمام شدند"""
+    def edit(done: FanOutResult):
+        outbound = scheduler_for(bot)
+        for chat_id, message_id in done.sent.items():
+            outbound.edit_message_text(chat_id, message_id, text, priority=PRIORITY_BULK, **kwargs)
+    result.add_done_callback(edit)
+
+
+# ===== SIMULATION =====
+
+def _simulate():
+    """ارسال 60 پیام bulk و 5 پیام کاربر به bot ساختگی که گاهی 429 می‌دهد"""
+    import json
+
+    class FakeBot:
+        def __init__(self):
+            self.log = []
+            self.lock = threading.Lock()
+            self.calls = 0
+
+        def send_message(self, chat_id, text, **kwargs):
+            with self.lock:
+                self.calls += 1
+                if self.calls % 25 == 0:
+                    raise ApiTelegramException('sendMessage', None, {
+                        'ok': False, 'error_code': 429, 'description': 'Too Many Requests',
+                        'parameters': {'retry_after': 1},
+                    })
+                self.log.append((time.monotonic(), chat_id, text))
+            return text
+
+    fake = FakeBot()
+    scheduler = OutboundScheduler(fake, global_rate=30, per_chat_rate=1, per_chat_burst=3, workers=4)
+    scheduler.start()
+    start = time.monotonic()
+    futures = [scheduler.send_message(1000 + i % 20, f"bulk {i}", priority=PRIORITY_BULK) for i in range(60)]
+    futures += [scheduler.send_message(1, f"user {i}") for i in range(5)]
+    for f in futures:
+        f.result(timeout=30)
+
+    per_chat: Dict[int, list] = {}
+    for at, chat_id, text in fake.log:
+        per_chat.setdefault(chat_id, []).append(text)
+    ordered = all(texts == sorted(texts, key=lambda t: int(t.split()[1])) for texts in per_chat.values())
+    first_user = next(i for i, (_, chat_id, _) in enumerate(fake.log) if chat_id == 1)
+    elapsed = time.monotonic() - start
+    print(json.dumps({
+        'elapsed_s': round(elapsed, 2),
+        'messages_per_s': round(len(fake.log) / elapsed, 1),
+        'per_chat_order_kept': ordered,
+        'first_user_message_position': first_user,
+        **scheduler.stats(),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    _simulate()
@@ -0,0 +1,128 @@
+# paging.py
+"""
+صفحه‌بندی keyset برای صفحه‌های لیست
+✅ تغییر مهم: لیست سفارش‌ها، تراکنش‌های زیبال/کریپتو، تیکت‌ها و سفارشات اکانت‌ساز به 10 یا 20 ردیف
+اول محدود بودند و بقیه ردیف‌هایی که خوانده می‌شد دور ریخته می‌شد. حالا هر صفحه با یک خواندن بازه‌ای
+روی ایندکس (key, id) گرفته می‌شود و مکان‌نما (key و id آخرین/اولین ردیف) در callback_data می‌ماند؛
+صفحه صدم به اندازه صفحه اول هزینه دارد (OFFSET استفاده نمی‌شود).
+
+مکان‌نما: '{n|p}{نوع}{key}|{id}' — n صفحه بعد (قدیمی‌تر)، p صفحه قبل؛ نوع i/f/s تا مقایسه
+با همان نوع ستون انجام شود. callback_data بیشتر از 64 بایت مجاز نیست؛ دکمه‌ای که جا نشود ساخته نمی‌شود.
+"""
+
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from telebot import types
+
+PAGE_SIZE = 10
+MAX_CALLBACK_BYTES = 64
+
+
+class Page(NamedTuple):
+    rows: List[Dict[str, Any]]
+    next_cursor: Optional[str]  # صفحه قدیمی‌تر
+    prev_cursor: Optional[str]  # صفحه جدیدتر
+
+
+def encode_cursor(direction: str, key, row_id) -> str:
+    tag = 'i' if isinstance(key, int) else 'f' if isinstance(key, float) else 's'
+    return f"{direction}{tag}{key}|{row_id}"
+
+
+def decode_cursor(token: str) -> Tuple[bool, Any, str]:
+    """Returns (forward, key, id)؛ مکان‌نمای خراب ValueError می‌دهد"""
+    direction, tag, rest = token[:1], token[1:2], token[2:]
+    key, sep, row_id = rest.rpartition('|')
+    if direction not in ('n', 'p') or tag not in ('i', 'f', 's') or not sep:
+        raise ValueError(f"مکان‌نمای نامعتبر: {token!r}")
+    key = int(key) if tag == 'i' else float(key) if tag == 'f' else key
+    return direction == 'n', key, row_id
+
+
+def _page(rows: List[Dict[str, Any]], forward: bool, first: bool, page_size: int,
+          key_of: Callable, id_of: Callable) -> Page:
+    # یک ردیف بیشتر خوانده می‌شود تا معلوم شود صفحه دیگری در همان جهت هست یا نه
+    more = len(rows) > page_size
+    rows = rows[:page_size]
+    if not forward:
+        rows.reverse()
+    if not rows:
+        return Page(rows, None, None)
+    newest, oldest = rows[0], rows[-1]
+    has_next = more if forward else True
+    has_prev = (not first) if forward else more
+    return Page(
+        rows,
+        encode_cursor('n', key_of(oldest), id_of(oldest)) if has_next else None,
+        encode_cursor('p', key_of(newest), id_of(newest)) if has_prev else None,
+    )
+
+
+def fetch_page(conn, table: str, cursor: Optional[str] = None, where: str = '', params: Sequence = (),
+               page_size: int = PAGE_SIZE, key: str = 'created_at', id_column: str = 'id',
+               columns: str = '*') -> Page:
+    """
+    یک صفحه از table به ترتیب (key, id) نزولی (جدیدترین اول)
+    where باید با ایندکسی که key را بعد از ستون‌های برابری دارد جور باشد (id در ایندکس rowid هست)
+    """
+    try:
+        forward, cursor_key, cursor_id = decode_cursor(cursor) if cursor else (True, None, None)
+        cursor_id = int(cursor_id) if cursor else None
+    except ValueError:
+        # دکمه قدیمی/دستکاری‌شده: صفحه اول
+        forward, cursor_key, cursor_id, cursor = True, None, None, None
+
+    conditions = [where] if where else []
+    args = list(params)
+    if cursor:
+        conditions.append(f"({key}, {id_column}) {'<' if forward else '>'} (?, ?)")
+        args += [cursor_key, cursor_id]
+    order = 'DESC' if forward else 'ASC'
+    sql = (f"SELECT {columns} FROM {table}"
+           + (f" WHERE {' AND '.join(conditions)}" if conditions else '')
+           + f" ORDER BY {key} {order}, {id_column} {order} LIMIT ?")
+    rows = [dict(row) for row in conn.execute(sql, (*args, page_size + 1)).fetchall()]
+
+    key_name, id_name = key.split('.')[-1], id_column.split('.')[-1]
+    return _page(rows, forward, cursor is None, page_size, lambda r: r[key_name], lambda r: r[id_name])
+
+
+def page_items(items: Sequence[Tuple[Any, str, Any]], cursor: Optional[str] = None,
+               page_size: int = PAGE_SIZE) -> Page:
+    """همان صفحه‌بندی برای لیست‌های داخل حافظه: items = [(key, id, obj)]؛ rows همان objها هستند"""
+    try:
+        forward, cursor_key, cursor_id = decode_cursor(cursor) if cursor else (True, None, None)
+    except ValueError:
+        forward, cursor_key, cursor_id, cursor = True, None, None, None
+
+    ordered = sorted(items, key=lambda item: (item[0], item[1]), reverse=forward)
+    if cursor:
+        position = (cursor_key, cursor_id)
+        ordered = [item for item in ordered
+                   if ((item[0], item[1]) < position if forward else (item[0], item[1]) > position)]
+    page = _page(ordered[:page_size + 1], forward, cursor is None, page_size,
+                 lambda item: item[0], lambda item: item[1])
+    return page._replace(rows=[item[2] for item in page.rows])
+
+
+def callback(prefix: str, token: Optional[str]) -> Optional[str]:
+    if token is None:
+        return None
+    data = prefix + token
+    return data if len(data.encode('utf-8')) <= MAX_CALLBACK_BYTES else None
+
+
+def nav_buttons(page: Page, prefix: str) -> List[types.InlineKeyboardButton]:
+    """دکمه‌های «قبلی/بعدی»؛ prefix همان پیشوندی است که handler لیست با add_prefix ثبت کرده"""
+    buttons = []
+    prev_data, next_data = callback(prefix, page.prev_cursor), callback(prefix, page.next_cursor)
+    if prev_data:
+        buttons.append(types.InlineKeyboardButton("◀️ قبلی", callback_data=prev_data))
+    if next_data:
+        buttons.append(types.InlineKeyboardButton("بعدی ▶️", callback_data=next_data))
+    return buttons
+
+
+def cursor_from(call, prefix: str) -> Optional[str]:
+    """مکان‌نمای داخل callback_data (برای callback اصلی لیست None)"""
+    return call.data[len(prefix):] if call.data.startswith(prefix) else None
@@ -16,6 +16,11 @@ logger = logging.getLogger(__name__)
 # Import database classes
 from payment_zibal import PaymentZibalDB, ZibalAPI
 from payment_digital import PaymentDigitalDB, NOWPaymentsAPI
+from stats import StatsDB, REPORT_RANGES, report_since
+from callback_router import router
+from paging import cursor_from, nav_buttons
+from archive import history_table
+from shared_state import is_admin, clear_state
 
 # ===== HANDLERS =====
 
@@ -30,46 +35,50 @@ class PaymentAdminHandlers:
         """ثبت handlers"""
         
         # Menu handlers
-        self.bot.callback_query_handler(func=lambda c: c.data == "admin_payments")(self.main_menu)
+        router.add_exact("admin_payments", self.main_menu)
         
         # Zibal handlers
-        self.bot.callback_query_handler(func=lambda c: c.data == "admin_payment_zibal_settings")(self.zibal_settings)
-        self.bot.callback_query_handler(func=lambda c: c.data == "admin_zibal_toggle")(self.zibal_toggle)
-        self.bot.callback_query_handler(func=lambda c: c.data == "admin_zibal_set_merchant")(self.zibal_set_merchant)
-        self.bot.callback_query_handler(func=lambda c: c.data == "admin_zibal_set_callback")(self.zibal_set_callback)
-        self.bot.callback_query_handler(func=lambda c: c.data == "admin_zibal_set_limits")(self.zibal_set_limits)
-        self.bot.callback_query_handler(func=lambda c: c.data == "admin_zibal_transactions")(self.zibal_transactions)
-        self.bot.callback_query_handler(func=lambda c: c.data.startswith("admin_zibal_tx_"))(self.zibal_transaction_detail)
+        router.add_exact("admin_payment_zibal_settings", self.zibal_settings)
+        router.add_exact("admin_zibal_toggle", self.zibal_toggle)
+        router.add_exact("admin_zibal_set_merchant", self.zibal_set_merchant)
+        router.add_exact("admin_zibal_set_callback", self.zibal_set_callback)
+        router.add_exact("admin_zibal_set_limits", self.zibal_set_limits)
+        router.add_exact("admin_zibal_transactions", self.zibal_transactions)
+        router.add_prefix("admin_zibal_tx_", self.zibal_transaction_detail)
+        router.add_prefix("admin_zibal_pg_", self.zibal_transactions)
         
         # Crypto handlers
-        self.bot.callback_query_handler(func=lambda c: c.data == "admin_payment_crypto_settings")(self.crypto_settings)
-        self.bot.callback_query_handler(func=lambda c: c.data == "admin_crypto_toggle")(self.crypto_toggle)
-        self.bot.callback_query_handler(func=lambda c: c.data == "admin_crypto_set_api")(self.crypto_set_api)
-        self.bot.callback_query_handler(func=lambda c: c.data == "admin_crypto_set_callback")(self.crypto_set_callback)
-        self.bot.callback_query_handler(func=lambda c: c.data == "admin_crypto_test_api")(self.crypto_test_api)
-        self.bot.callback_query_handler(func=lambda c: c.data == "admin_crypto_transactions")(self.crypto_transactions)
-        self.bot.callback_query_handler(func=lambda c: c.data.startswith("admin_crypto_tx_"))(self.crypto_transaction_detail)
+        router.add_exact("admin_payment_crypto_settings", self.crypto_settings)
+        router.add_exact("admin_crypto_toggle", self.crypto_toggle)
+        router.add_exact("admin_crypto_set_api", self.crypto_set_api)
+        router.add_exact("admin_crypto_set_callback", self.crypto_set_callback)
+        router.add_exact("admin_crypto_test_api", self.crypto_test_api)
+        router.add_exact("admin_crypto_transactions", self.crypto_transactions)
+        router.add_prefix("admin_crypto_tx_", self.crypto_transaction_detail)
+        router.add_prefix("admin_crypto_pg_", self.crypto_transactions)
         
         # Statistics
-        self.bot.callback_query_handler(func=lambda c: c.data == "admin_payment_statistics")(self.payment_statistics)
+        router.add_exact("admin_payment_statistics", self.payment_statistics)
+        router.add_prefix("admin_payment_report_", self.payment_statistics)
         
         # Manual verification
-        self.bot.callback_query_handler(func=lambda c: c.data.startswith("admin_verify_zibal_"))(self.manual_verify_zibal)
-        self.bot.callback_query_handler(func=lambda c: c.data.startswith("admin_verify_crypto_"))(self.manual_verify_crypto)
+        router.add_prefix("admin_verify_zibal_", self.manual_verify_zibal)
+        router.add_prefix("admin_verify_crypto_", self.manual_verify_crypto)
     
     # ===== MAIN MENU =====
     
     def main_menu(self, call):
         """منوی اصلی پنل پرداخت"""
-        from bot import is_admin
+        from shared_state import is_admin
         
         if not is_admin(call.from_user.id):
             self.bot.answer_callback_query(call.id, "❌ دسترسی غیرمجاز!", show_alert=True)
             return
         
         with self.db.get_connection() as conn:
-            zibal_stats = PaymentZibalDB.get_statistics(conn)
-            crypto_stats = PaymentDigitalDB.get_statistics(conn)
+            counters = StatsDB.get(conn)
+            zibal_stats = PaymentZibalDB.get_statistics(conn, counters)
+            crypto_stats = PaymentDigitalDB.get_statistics(conn, counters)
             
             zibal_settings = PaymentZibalDB.get_payment_settings(conn, 'zibal')
             crypto_settings = PaymentZibalDB.get_payment_settings(conn, 'crypto')
@@ -103,7 +112,7 @@ class PaymentAdminHandlers:
     
     def zibal_settings(self, call):
         """تنظیمات زیبال"""
-        from bot import is_admin
+        from shared_state import is_admin
         
         if not is_admin(call.from_user.id):
             return
@@ -155,7 +164,7 @@ class PaymentAdminHandlers:
     
     def zibal_toggle(self, call):
         """فعال/غیرفعال کردن زیبال"""
-        from bot import is_admin
+        from shared_state import is_admin
         
         if not is_admin(call.from_user.id):
             return
@@ -174,7 +183,7 @@ class PaymentAdminHandlers:
     
     def zibal_set_merchant(self, call):
         """تنظیم merchant ID"""
-        from bot import is_admin, set_state, user_data
+        from shared_state import is_admin, set_state, user_data
         
         if not is_admin(call.from_user.id):
             return
@@ -197,7 +206,7 @@ class PaymentAdminHandlers:
     
     def zibal_set_callback(self, call):
         """تنظیم callback URL"""
-        from bot import is_admin, set_state, user_data
+        from shared_state import is_admin, set_state, user_data
         
         if not is_admin(call.from_user.id):
             return
@@ -221,7 +230,7 @@ class PaymentAdminHandlers:
     
     def zibal_set_limits(self, call):
         """تنظیم محدودیت‌ها"""
-        from bot import is_admin, set_state, user_data
+        from shared_state import is_admin, set_state, user_data
         
         if not is_admin(call.from_user.id):
             return
@@ -245,18 +254,16 @@ class PaymentAdminHandlers:
     
     def zibal_transactions(self, call):
         """لیست تراکنش‌های زیبال"""
-        from bot import is_admin
+        from shared_state import is_admin
         
         if not is_admin(call.from_user.id):
             return
         
+        # admin_zibal_transactions (صفحه اول) یا admin_zibal_pg_{مکان‌نما}
         with self.db.get_connection() as conn:
-            cursor = conn.execute("""
-                SELECT * FROM zibal_transactions
-                ORDER BY created_at DESC
-                LIMIT 20
-            """)
-            transactions = [dict(row) for row in cursor.fetchall()]
+            page = PaymentZibalDB.get_transactions_page(conn, cursor_from(call, "admin_zibal_pg_"),
+                                                        history_table(self.db, 'zibal_transactions'))
+        transactions = page.rows
         
         if not transactions:
             markup = types.InlineKeyboardMarkup()
@@ -270,7 +277,7 @@ class PaymentAdminHandlers:
             )
             return
         
-        text = "📜 **تراکنش‌های زیبال (20 تای آخر):**\n\n"
+        text = "📜 **تراکنش‌های زیبال:**\n\n"
         
         status_emoji = {
             'pending': '⏳',
@@ -282,13 +289,14 @@ class PaymentAdminHandlers:
         
         markup = types.InlineKeyboardMarkup(row_width=1)
         
-        for tx in transactions[:10]:
+        for tx in transactions:
             emoji = status_emoji.get(tx['status'], '❓')
             button_text = f"{emoji} {tx['user_id']} - {tx['amount']:,}T - {tx['status']}"
             markup.add(
                 types.InlineKeyboardButton(button_text, callback_data=f"admin_zibal_tx_{tx['id']}")
             )
         
+        markup.row(*nav_buttons(page, "admin_zibal_pg_"))
         markup.add(types.InlineKeyboardButton("🔙 بازگشت", callback_data="admin_payment_zibal_settings"))
         
         self.bot.edit_message_text(
@@ -300,7 +308,7 @@ class PaymentAdminHandlers:
     
     def zibal_transaction_detail(self, call):
         """جزئیات تراکنش زیبال"""
-        from bot import is_admin
+        from shared_state import is_admin
         
         if not is_admin(call.from_user.id):
             return
@@ -308,7 +316,8 @@ class PaymentAdminHandlers:
         tx_id = int(call.data.split("_")[3])
         
         with self.db.get_connection() as conn:
-            transaction = PaymentZibalDB.get_transaction(conn, transaction_id=tx_id)
+            transaction = PaymentZibalDB.get_transaction(conn, transaction_id=tx_id,
+                                                         table=history_table(self.db, 'zibal_transactions'))
         
         if not transaction:
             self.bot.answer_callback_query(call.id, "❌ تراکنش یافت نشد!", show_alert=True)
@@ -349,7 +358,7 @@ class PaymentAdminHandlers:
     
     def manual_verify_zibal(self, call):
         """تایید دستی تراکنش زیبال"""
-        from bot import is_admin
+        from shared_state import is_admin
         
         if not is_admin(call.from_user.id):
             return
@@ -391,7 +400,7 @@ class PaymentAdminHandlers:
     
     def crypto_settings(self, call):
         """تنظیمات ارز دیجیتال"""
-        from bot import is_admin
+        from shared_state import is_admin
         
         if not is_admin(call.from_user.id):
             return
@@ -443,7 +452,7 @@ class PaymentAdminHandlers:
     
     def crypto_toggle(self, call):
         """فعال/غیرفعال کردن کریپتو"""
-        from bot import is_admin
+        from shared_state import is_admin
         
         if not is_admin(call.from_user.id):
             return
@@ -462,7 +471,7 @@ class PaymentAdminHandlers:
     
     def crypto_set_api(self, call):
         """تنظیم API key"""
-        from bot import is_admin, set_state, user_data
+        from shared_state import is_admin, set_state, user_data
         
         if not is_admin(call.from_user.id):
             return
@@ -486,7 +495,7 @@ class PaymentAdminHandlers:
     
     def crypto_set_callback(self, call):
         """تنظیم callback URL"""
-        from bot import is_admin, set_state, user_data
+        from shared_state import is_admin, set_state, user_data
         
         if not is_admin(call.from_user.id):
             return
@@ -510,7 +519,7 @@ class PaymentAdminHandlers:
     
     def crypto_test_api(self, call):
         """تست API"""
-        from bot import is_admin
+        from shared_state import is_admin
         
         if not is_admin(call.from_user.id):
             return
@@ -541,18 +550,16 @@ class PaymentAdminHandlers:
     
     def crypto_transactions(self, call):
         """لیست تراکنش‌های کریپتو"""
-        from bot import is_admin
+        from shared_state import is_admin
         
         if not is_admin(call.from_user.id):
             return
         
+        # admin_crypto_transactions (صفحه اول) یا admin_crypto_pg_{مکان‌نما}
         with self.db.get_connection() as conn:
-            cursor = conn.execute("""
-                SELECT * FROM crypto_transactions
-                ORDER BY created_at DESC
-                LIMIT 20
-            """)
-            transactions = [dict(row) for row in cursor.fetchall()]
+            page = PaymentDigitalDB.get_transactions_page(conn, cursor_from(call, "admin_crypto_pg_"),
+                                                          history_table(self.db, 'crypto_transactions'))
+        transactions = page.rows
         
         if not transactions:
             markup = types.InlineKeyboardMarkup()
@@ -566,7 +573,7 @@ class PaymentAdminHandlers:
             )
             return
         
-        text = "📜 **تراکنش‌های ارز دیجیتال (20 تای آخر):**\n\n"
+        text = "📜 **تراکنش‌های ارز دیجیتال:**\n\n"
         
         status_emoji = {
             'waiting': '⏳',
@@ -579,13 +586,14 @@ class PaymentAdminHandlers:
         
         markup = types.InlineKeyboardMarkup(row_width=1)
         
-        for tx in transactions[:10]:
+        for tx in transactions:
             emoji = status_emoji.get(tx['payment_status'], '❓')
             button_text = f"{emoji} {tx['user_id']} - ${tx['amount_usd']:.2f} - {tx['currency'].upper()}"
             markup.add(
                 types.InlineKeyboardButton(button_text, callback_data=f"admin_crypto_tx_{tx['id']}")
             )
         
+        markup.row(*nav_buttons(page, "admin_crypto_pg_"))
         markup.add(types.InlineKeyboardButton("🔙 بازگشت", callback_data="admin_payment_crypto_settings"))
         
         self.bot.edit_message_text(
@@ -597,7 +605,7 @@ class PaymentAdminHandlers:
     
     def crypto_transaction_detail(self, call):
         """جزئیات تراکنش کریپتو"""
-        from bot import is_admin
+        from shared_state import is_admin
         
         if not is_admin(call.from_user.id):
             return
@@ -605,7 +613,8 @@ class PaymentAdminHandlers:
         tx_id = int(call.data.split("_")[3])
         
         with self.db.get_connection() as conn:
-            transaction = PaymentDigitalDB.get_transaction(conn, transaction_id=tx_id)
+            transaction = PaymentDigitalDB.get_transaction(conn, transaction_id=tx_id,
+                                                           table=history_table(self.db, 'crypto_transactions'))
         
         if not transaction:
             self.bot.answer_callback_query(call.id, "❌ تراکنش یافت نشد!", show_alert=True)
@@ -650,7 +659,7 @@ class PaymentAdminHandlers:
     
     def manual_verify_crypto(self, call):
         """بروزرسانی وضعیت تراکنش کریپتو"""
-        from bot import is_admin
+        from shared_state import is_admin
         
         if not is_admin(call.from_user.id):
             return
@@ -689,15 +698,7 @@ class PaymentAdminHandlers:
                     
                     amount_toman = int(transaction['amount_usd'] * handlers.USD_TO_TOMAN_RATE)
                     
-                    conn.execute(
-                        "UPDATE users SET balance = balance + ? WHERE telegram_id = ?",
-                        (amount_toman, transaction['user_id'])
-                    )
-                    
-                    conn.execute("""
-                        INSERT INTO transactions (user_id, amount, type, description)
-                        VALUES (?, ?, 'deposit', ?)
-                    """, (transaction['user_id'], amount_toman, f"شارژ کیف پول - کریپتو"))
+                    self.db.add_balance(transaction['user_id'], amount_toman, "شارژ کیف پول - کریپتو")
             
             self.bot.answer_callback_query(
                 call.id,
@@ -719,32 +720,26 @@ class PaymentAdminHandlers:
     
     def payment_statistics(self, call):
         """آمار کامل پرداخت‌ها"""
-        from bot import is_admin
+        from shared_state import is_admin
         
         if not is_admin(call.from_user.id):
             return
         
+        # admin_payment_statistics (پیش‌فرض 30 روز) یا admin_payment_report_{7|30|90|mtd}
+        range_key = call.data[len("admin_payment_report_"):] if call.data.startswith("admin_payment_report_") else '30'
+        titles = {key: title for key, title, _ in REPORT_RANGES}
+        if range_key not in titles:
+            return
+        range_title = titles[range_key]
+        
         with self.db.get_connection() as conn:
-            zibal_stats = PaymentZibalDB.get_statistics(conn)
-            crypto_stats = PaymentDigitalDB.get_statistics(conn)
+            counters = StatsDB.get(conn)
+            zibal_stats = PaymentZibalDB.get_statistics(conn, counters)
+            crypto_stats = PaymentDigitalDB.get_statistics(conn, counters)
             
-            # آمار 30 روز اخیر - زیبال
-            cursor = conn.execute("""
-                SELECT COUNT(*), COALESCE(SUM(amount), 0)
-                FROM zibal_transactions
-                WHERE status = 'success' 
-                AND datetime(created_at) > datetime('now', '-30 days')
-            """)
-            zibal_30d = cursor.fetchone()
-            
-            # آمار 30 روز اخیر - کریپتو
-            cursor = conn.execute("""
-                SELECT COUNT(*), COALESCE(SUM(actual_amount_usd), 0)
-                FROM crypto_transactions
-                WHERE payment_status = 'finished'
-                AND datetime(created_at) > datetime('now', '-30 days')
-            """)
-            crypto_30d = cursor.fetchone()
+            # آمار بازه از جمع ردیف‌های روزانه payment_daily (نه پیمایش تراکنش‌ها)
+            totals = StatsDB.payment_totals(conn, report_since(range_key))
+        zibal_range, crypto_range = totals['zibal'], totals['crypto']
         
         text = (
             f"📊 **آمار کامل پرداخت‌ها**\n\n"
@@ -752,17 +747,24 @@ class PaymentAdminHandlers:
             f"├ کل تراکنش‌های موفق: {zibal_stats['successful_count']}\n"
             f"├ مجموع درآمد: {zibal_stats['total_amount']:,.0f} تومان\n"
             f"├ در انتظار: {zibal_stats['pending_count']}\n"
-            f"└ 30 روز اخیر: {zibal_30d[0]} تراکنش - {zibal_30d[1]:,.0f} تومان\n\n"
+            f"└ {range_title}: {zibal_range['success_count']} تراکنش - {zibal_range['success_amount']:,.0f} تومان"
+            f" ({zibal_range['failed_count']} ناموفق)\n\n"
             f"**💎 ارز دیجیتال:**\n"
             f"├ کل تراکنش‌های موفق: {crypto_stats['successful_count']}\n"
             f"├ مجموع درآمد: ${crypto_stats['total_amount_usd']:,.2f}\n"
             f"├ در انتظار: {crypto_stats['pending_count']}\n"
-            f"└ 30 روز اخیر: {crypto_30d[0]} تراکنش - ${crypto_30d[1]:,.2f}\n\n"
+            f"└ {range_title}: {crypto_range['success_count']} تراکنش - ${crypto_range['success_amount']:,.2f}"
+            f" ({crypto_range['failed_count']} ناموفق)\n\n"
             f"**📈 جمع کل:**\n"
             f"└ {zibal_stats['successful_count'] + crypto_stats['successful_count']} تراکنش موفق"
         )
         
-        markup = types.InlineKeyboardMarkup()
+        markup = types.InlineKeyboardMarkup(row_width=4)
+        markup.add(*[
+            types.InlineKeyboardButton(f"{'• ' if key == range_key else ''}{key.upper() if key == 'mtd' else key + 'd'}",
+                                       callback_data=f"admin_payment_report_{key}")
+            for key, _, _ in REPORT_RANGES
+        ])
         markup.add(types.InlineKeyboardButton("🔙 بازگشت", callback_data="admin_payments"))
         
         self.bot.edit_message_text(text, call.message.chat.id, call.message.message_id, reply_markup=markup)
@@ -770,10 +772,17 @@ class PaymentAdminHandlers:
 
 # ===== MESSAGE HANDLERS برای State Management =====
 
+# stateهای متعلق به این ماژول (در bot.py در state_router ثبت می‌شوند)
+PAYMENT_ADMIN_STATES = (
+    "payment_admin_zibal_merchant",
+    "payment_admin_zibal_callback",
+    "payment_admin_zibal_limits",
+    "payment_admin_crypto_api",
+    "payment_admin_crypto_callback",
+)
+
 def handle_payment_admin_states(bot, db, message, user_id, state, user_data):
     """مدیریت state های پنل ادمین پرداخت"""
-    from bot import is_admin, clear_state
-    
     if not is_admin(user_id):
         return False
     
@@ -11,6 +11,8 @@ from datetime import datetime
 from typing import Optional, Dict, List
 from telebot import types
 from payment_zibal import PaymentZibalDB
+from callback_router import router
+from shared_state import clear_state
 
 logger = logging.getLogger(__name__)
 
@@ -97,10 +99,12 @@ class PaymentDigitalDB:
         conn.execute(query, values)
     
     @staticmethod
-    def get_transaction(conn, transaction_id: int = None, payment_id: str = None, order_id: str = None):
+    def get_transaction(conn, transaction_id: int = None, payment_id: str = None, order_id: str = None,
+                        table: str = 'crypto_transactions'):
         """دریافت تراکنش"""
         if transaction_id:
-            cursor = conn.execute("SELECT * FROM crypto_transactions WHERE id = ?", (transaction_id,))
+            # table: history_table(...) برای پیدا کردن تراکنش بایگانی‌شده هم
+            cursor = conn.execute(f"SELECT * FROM {table} WHERE id = ?", (transaction_id,))
         elif payment_id:
             cursor = conn.execute("SELECT * FROM crypto_transactions WHERE payment_id = ?", (payment_id,))
         elif order_id:
@@ -122,6 +126,12 @@ class PaymentDigitalDB:
         """, (user_id, limit))
         return [dict(row) for row in cursor.fetchall()]
     
+    @staticmethod
+    def get_transactions_page(conn, cursor: Optional[str] = None, table: str = 'crypto_transactions'):
+        """یک صفحه از همه تراکنش‌ها (جدیدترین اول) برای پنل ادمین؛ table: history_table(...) برای کل تاریخچه"""
+        from paging import fetch_page
+        return fetch_page(conn, table, cursor)
+    
     @staticmethod
     def update_exchange_rate(conn, currency_from: str, currency_to: str, rate: float):
         """به‌روزرسانی نرخ ارز"""
@@ -141,28 +151,16 @@ class PaymentDigitalDB:
         return dict(row) if row else None
     
     @staticmethod
-    def get_statistics(conn):
-        """آمار پرداخت‌های دیجیتال"""
-        cursor = conn.execute("""
-            SELECT COUNT(*) FROM crypto_transactions WHERE payment_status = 'finished'
-        """)
-        successful_count = cursor.fetchone()[0]
-        
-        cursor = conn.execute("""
-            SELECT COALESCE(SUM(actual_amount_usd), 0) FROM crypto_transactions 
-            WHERE payment_status = 'finished'
-        """)
-        total_amount_usd = cursor.fetchone()[0]
-        
-        cursor = conn.execute("""
-            SELECT COUNT(*) FROM crypto_transactions WHERE payment_status = 'waiting'
-        """)
-        pending_count = cursor.fetchone()[0]
+    def get_statistics(conn, counters: Optional[Dict] = None):
+        """آمار پرداخت‌های دیجیتال (از stat_counters؛ counters: نتیجه StatsDB.get که از قبل خوانده شده)"""
+        from stats import StatsDB
+        if counters is None:
+            counters = StatsDB.get(conn, 'crypto_finished_count', 'crypto_finished_usd', 'crypto_waiting_count')
         
         return {
-            "successful_count": successful_count,
-            "total_amount_usd": total_amount_usd,
-            "pending_count": pending_count
+            "successful_count": counters['crypto_finished_count'],
+            "total_amount_usd": counters['crypto_finished_usd'],
+            "pending_count": counters['crypto_waiting_count']
         }
 
 
@@ -354,13 +352,13 @@ class PaymentDigitalHandlers:
     def register_handlers(self):
         """ثبت handlers"""
         
-        self.bot.callback_query_handler(func=lambda c: c.data == "payment_digital")(self.start_payment)
-        self.bot.callback_query_handler(func=lambda c: c.data.startswith("crypto_select_"))(self.select_currency)
-        self.bot.callback_query_handler(func=lambda c: c.data.startswith("crypto_amount_"))(self.select_amount)
-        self.bot.callback_query_handler(func=lambda c: c.data.startswith("crypto_custom_amount_"))(self.custom_amount)
-        self.bot.callback_query_handler(func=lambda c: c.data.startswith("crypto_pay_"))(self.process_payment)
-        self.bot.callback_query_handler(func=lambda c: c.data.startswith("crypto_check_"))(self.check_payment_status)
-        self.bot.callback_query_handler(func=lambda c: c.data == "crypto_transactions")(self.show_transactions)
+        router.add_exact("payment_digital", self.start_payment)
+        router.add_prefix("crypto_select_", self.select_currency)
+        router.add_prefix("crypto_amount_", self.select_amount)
+        router.add_prefix("crypto_custom_amount_", self.custom_amount)
+        router.add_prefix("crypto_pay_", self.process_payment)
+        router.add_prefix("crypto_check_", self.check_payment_status)
+        router.add_exact("crypto_transactions", self.show_transactions)
     
     def start_payment(self, call):
         """شروع پرداخت کریپتو"""
@@ -459,7 +457,7 @@ class PaymentDigitalHandlers:
         user_id = call.from_user.id
         currency = call.data.split("_")[3]
         
-        from bot import set_state, user_data
+        from shared_state import set_state, user_data
         set_state(user_id, f"payment_crypto_waiting_amount_{currency}")
         user_data[user_id] = {'currency': currency}
         
@@ -666,16 +664,9 @@ class PaymentDigitalHandlers:
                     # افزودن موجودی
                     amount_toman = int(transaction['amount_usd'] * self.USD_TO_TOMAN_RATE)
                     
-                    conn.execute(
-                        "UPDATE users SET balance = balance + ? WHERE telegram_id = ?",
-                        (amount_toman, user_id)
-                    )
-                    
-                    # ثبت تراکنش موجودی
-                    conn.execute("""
-                        INSERT INTO transactions (user_id, amount, type, description)
-                        VALUES (?, ?, 'deposit', ?)
-                    """, (user_id, amount_toman, f"شارژ کیف پول - کریپتو {transaction['currency'].upper()}"))
+                    # همراه ثبت تراکنش موجودی (cache کاربر بعد از commit پاک می‌شود)
+                    self.db.add_balance(user_id, amount_toman,
+                                        f"شارژ کیف پول - کریپتو {transaction['currency'].upper()}")
                     
                     self.bot.answer_callback_query(
                         call.id,
@@ -778,6 +769,9 @@ class PaymentDigitalHandlers:
 
 # ===== MESSAGE HANDLERS برای State Management =====
 
+# stateهای متعلق به این ماژول (در bot.py در state_router ثبت می‌شوند)
+PAYMENT_DIGITAL_STATE_PREFIXES = ("payment_crypto_waiting_amount_",)
+
 def handle_payment_digital_states(bot, db, message, user_id, state, user_data):
     """مدیریت state های پرداخت دیجیتال"""
     
@@ -792,7 +786,6 @@ def handle_payment_digital_states(bot, db, message, user_id, state, user_data):
             
             if not info:
                 bot.send_message(message.chat.id, "❌ ارز نامعتبر!")
-                from bot import clear_state
                 clear_state(user_id)
                 return True
             
@@ -819,7 +812,6 @@ def handle_payment_digital_states(bot, db, message, user_id, state, user_data):
             
             handlers._show_payment_confirmation(fake_call, user_id, currency, amount_toman)
             
-            from bot import clear_state
             clear_state(user_id)
             return True
             
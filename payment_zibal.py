@@ -10,6 +10,9 @@ from datetime import datetime
 from typing import Optional, Dict
 from telebot import types
 
+from callback_router import router
+from shared_state import clear_state
+
 logger = logging.getLogger(__name__)
 
 # ===== DATABASE METHODS =====
@@ -85,10 +88,11 @@ class PaymentZibalDB:
         conn.execute(query, values)
     
     @staticmethod
-    def get_transaction(conn, transaction_id: int = None, track_id: int = None):
+    def get_transaction(conn, transaction_id: int = None, track_id: int = None, table: str = 'zibal_transactions'):
         """دریافت تراکنش"""
         if transaction_id:
-            cursor = conn.execute("SELECT * FROM zibal_transactions WHERE id = ?", (transaction_id,))
+            # table: history_table(...) برای پیدا کردن تراکنش بایگانی‌شده هم
+            cursor = conn.execute(f"SELECT * FROM {table} WHERE id = ?", (transaction_id,))
         elif track_id:
             cursor = conn.execute("SELECT * FROM zibal_transactions WHERE track_id = ?", (track_id,))
         else:
@@ -108,6 +112,12 @@ class PaymentZibalDB:
         """, (user_id, limit))
         return [dict(row) for row in cursor.fetchall()]
     
+    @staticmethod
+    def get_transactions_page(conn, cursor: Optional[str] = None, table: str = 'zibal_transactions'):
+        """یک صفحه از همه تراکنش‌ها (جدیدترین اول) برای پنل ادمین؛ table: history_table(...) برای کل تاریخچه"""
+        from paging import fetch_page
+        return fetch_page(conn, table, cursor)
+    
     @staticmethod
     def get_payment_settings(conn, gateway_type: str = 'zibal'):
         """دریافت تنظیمات درگاه"""
@@ -150,27 +160,16 @@ class PaymentZibalDB:
         conn.execute(query, values)
     
     @staticmethod
-    def get_statistics(conn):
-        """آمار پرداخت‌های زیبال"""
-        cursor = conn.execute("""
-            SELECT COUNT(*) FROM zibal_transactions WHERE status = 'success'
-        """)
-        successful_count = cursor.fetchone()[0]
-        
-        cursor = conn.execute("""
-            SELECT COALESCE(SUM(amount), 0) FROM zibal_transactions WHERE status = 'success'
-        """)
-        total_amount = cursor.fetchone()[0]
-        
-        cursor = conn.execute("""
-            SELECT COUNT(*) FROM zibal_transactions WHERE status = 'pending'
-        """)
-        pending_count = cursor.fetchone()[0]
+    def get_statistics(conn, counters: Optional[Dict] = None):
+        """آمار پرداخت‌های زیبال (از stat_counters؛ counters: نتیجه StatsDB.get که از قبل خوانده شده)"""
+        from stats import StatsDB
+        if counters is None:
+            counters = StatsDB.get(conn, 'zibal_success_count', 'zibal_success_amount', 'zibal_pending_count')
         
         return {
-            "successful_count": successful_count,
-            "total_amount": total_amount,
-            "pending_count": pending_count
+            "successful_count": counters['zibal_success_count'],
+            "total_amount": counters['zibal_success_amount'],
+            "pending_count": counters['zibal_pending_count']
         }
 
 
@@ -293,10 +292,10 @@ class PaymentZibalHandlers:
     def register_handlers(self):
         """ثبت handlers"""
         
-        self.bot.callback_query_handler(func=lambda c: c.data == "payment_zibal")(self.start_payment)
-        self.bot.callback_query_handler(func=lambda c: c.data.startswith("zibal_amount_"))(self.select_amount)
-        self.bot.callback_query_handler(func=lambda c: c.data.startswith("zibal_custom_amount"))(self.custom_amount)
-        self.bot.callback_query_handler(func=lambda c: c.data == "zibal_transactions")(self.show_transactions)
+        router.add_exact("payment_zibal", self.start_payment)
+        router.add_prefix("zibal_amount_", self.select_amount)
+        router.add_prefix("zibal_custom_amount", self.custom_amount)
+        router.add_exact("zibal_transactions", self.show_transactions)
     
     def start_payment(self, call):
         """شروع پرداخت زیبال"""
@@ -357,7 +356,7 @@ class PaymentZibalHandlers:
         """مبلغ دلخواه"""
         user_id = call.from_user.id
         
-        from bot import set_state, user_data
+        from shared_state import set_state, user_data
         set_state(user_id, "payment_zibal_waiting_amount")
         user_data[user_id] = {}
         
@@ -535,17 +534,8 @@ class PaymentZibalHandlers:
                     verified_at=datetime.now().isoformat()
                 )
                 
-                # افزودن موجودی کاربر
-                conn.execute(
-                    "UPDATE users SET balance = balance + ? WHERE telegram_id = ?",
-                    (transaction['amount'], user_id)
-                )
-                
-                # ثبت تراکنش موجودی
-                conn.execute("""
-                    INSERT INTO transactions (user_id, amount, type, description)
-                    VALUES (?, ?, 'deposit', ?)
-                """, (user_id, transaction['amount'], f"شارژ کیف پول - زیبال #{track_id}"))
+                # افزودن موجودی کاربر و ثبت تراکنش موجودی (cache کاربر بعد از commit پاک می‌شود)
+                self.db.add_balance(user_id, transaction['amount'], f"شارژ کیف پول - زیبال #{track_id}")
                 
                 logger.info(f"✅ پرداخت موفق - کاربر: {user_id}, مبلغ: {transaction['amount']}")
                 
@@ -567,6 +557,9 @@ class PaymentZibalHandlers:
 
 # ===== MESSAGE HANDLERS برای State Management =====
 
+# stateهای متعلق به این ماژول (در bot.py در state_router ثبت می‌شوند)
+PAYMENT_ZIBAL_STATES = ("payment_zibal_waiting_amount",)
+
 def handle_payment_zibal_states(bot, db, message, user_id, state, user_data):
     """مدیریت state های پرداخت زیبال"""
     
@@ -606,7 +599,6 @@ def handle_payment_zibal_states(bot, db, message, user_id, state, user_data):
             handlers = PaymentZibalHandlers(bot, db)
             handlers._process_payment(fake_call, user_id, amount)
             
-            from bot import clear_state
             clear_state(user_id)
             return True
             
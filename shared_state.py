@@ -2,7 +2,12 @@
 # ماژول مشترک برای نگهداری stateهای موقت و pending orders
 # ✅ تغییر مهم: جلوگیری از circular import بین bot_webhook.py و accountmaker.py
 
-from typing import Dict, Any
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List
+
+from config import config
 
 # state کاربر: user_id -> state_name
 user_states: Dict[int, str] = {}
@@ -15,3 +20,61 @@ pending_orders: Dict[str, Dict[str, Any]] = {}
 
 # شمارنده سفارش (در حافظه)
 order_counter = 1
+
+class AdminNotifications:
+    """
+    پیام‌های اعلان فرستاده‌شده به ادمین‌ها: "order:<id>" / "ticket:<user_id>" -> [FanOutResult]
+    با تغییر وضعیت سفارش/تیکت همین پیام‌ها در جا ویرایش می‌شوند. سفارش/تیکتی که هیچ‌وقت تایید/رد/بسته
+    نشود بعد از ttl ثانیه (یا وقتی بیش از max_keys کلید باشد، قدیمی‌ترین) فراموش می‌شود.
+    """
+
+    def __init__(self, ttl: float = 7 * 86400, max_keys: int = 1000):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (created_at, [FanOutResult])
+        self._lock = threading.Lock()
+
+    def add(self, key: str, result):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = (now, [])
+            entry[1].append(result)
+            self._evict(now)
+
+    def pop(self, key: str) -> List[Any]:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return entry[1] if entry else []
+
+    def _evict(self, now: float):
+        while self._entries:
+            created_at = next(iter(self._entries.values()))[0]
+            if now - created_at <= self.ttl and len(self._entries) <= self.max_keys:
+                break
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+admin_notifications = AdminNotifications()
+
+
+# ===== helperهای state (قبلاً در bot.py بودند) =====
+# ✅ تغییر مهم: ماژول‌ها این توابع را از اینجا import می‌کنند، نه از bot؛
+# import کردن bot از داخل handlerها کل ماژول bot را دوباره اجرا می‌کرد.
+
+def is_admin(user_id: int) -> bool:
+    return user_id in config.admin_list
+
+def set_state(user_id: int, state: str):
+    user_states[user_id] = state
+
+def get_state(user_id: int):
+    return user_states.get(user_id)
+
+def clear_state(user_id: int):
+    user_states.pop(user_id, None)
+    user_data.pop(user_id, None)
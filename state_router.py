@@ -0,0 +1,51 @@
+# state_router.py
+"""
+جدول پخش stateهای کاربر
+✅ تغییر مهم: هر ماژول stateهایی را که مالک آن‌هاست اعلام می‌کند و پیام متنی مستقیم به همان
+handler می‌رسد؛ دیگر handle_*_states ها پشت سر هم امتحان نمی‌شوند.
+state تکراری (یا state ای که با پیشوند ماژول دیگری تداخل دارد) هنگام راه‌اندازی خطا می‌دهد.
+"""
+
+import logging
+from typing import Callable, Iterable
+
+from callback_router import DispatchIndex
+
+logger = logging.getLogger(__name__)
+
+
+class StateRouter(DispatchIndex):
+    """state_name -> handler(bot, db, message, user_id, state, user_data)"""
+
+    def __init__(self):
+        super().__init__('state_router')
+        self.unknown = 0
+
+    def register(self, handler: Callable, states: Iterable[str] = (), prefixes: Iterable[str] = ()):
+        """ثبت stateهای یک ماژول؛ برای stateهای پویا (مثلاً ..._{currency}) از prefixes استفاده کنید"""
+        for state in states:
+            owner = self.lookup(state)
+            if owner is not None and owner is not handler:
+                raise ValueError(f"state {state!r} قبلاً توسط {owner.__module__} ثبت شده است")
+            self.add_exact(state, handler)
+        for prefix in prefixes:
+            owner = self.lookup(prefix)
+            if owner is not None and owner is not handler:
+                raise ValueError(f"پیشوند state {prefix!r} با {owner.__module__} تداخل دارد")
+            for state, other in list(self._exact.items()) + list(self._prefixes.items()):
+                if state.startswith(prefix) and other is not handler:
+                    raise ValueError(f"پیشوند state {prefix!r} با state {state!r} از {other.__module__} تداخل دارد")
+            self.add_prefix(prefix, handler)
+
+    def dispatch(self, bot, db, message, user_id: int, state: str, user_data) -> bool:
+        """Returns True اگر پیام توسط handler مالک state مصرف شد"""
+        handler = self.lookup(state)
+        if handler is None:
+            self.unknown += 1
+            logger.debug(f"state ناشناخته برای کاربر {user_id}: {state!r}")
+            return False
+        return bool(handler(bot, db, message, user_id, state, user_data))
+
+
+# نمونه مشترک
+state_router = StateRouter()
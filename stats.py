@@ -0,0 +1,394 @@
+# stats.py
+"""
+شمارنده‌های آمار داشبوردهای ادمین
+✅ تغییر مهم: get_detailed_statistics و get_statisticsهای زیبال، کریپتو و پشتیبانی هر بار سه چهار
+COUNT/SUM روی کل جدول اجرا می‌کردند (منوی پرداخت دو دسته از آن‌ها را با هر باز شدن).
+حالا هر شمارنده یک ردیف در stat_counters است که triggerهای همان جدول، در همان تراکنشی که وضعیت
+را تغییر می‌دهد، به‌روزش می‌کنند؛ خواندن داشبورد یک lookup روی کلید اصلی است.
+
+- شمارنده جدید: یک Counter به COUNTERS اضافه کنید و یک migration جدید که init_tables را دوباره صدا بزند
+  (triggerها دوباره ساخته و مقدارها از نو محاسبه می‌شوند).
+- python stats.py check <db> [--repair]: محاسبه دوباره همه شمارنده‌ها از روی جداول و گزارش اختلاف.
+
+✅ تغییر مهم: گزارش 30 روزه پرداخت‌ها هر بار همه تراکنش‌های موفق را می‌خواند. حالا payment_daily برای
+هر روز (date(created_at)، UTC) و هر درگاه تعداد و مبلغ موفق و تعداد ناموفق را نگه می‌دارد؛ triggerها
+هنگام رسیدن تراکنش به وضعیت نهایی ردیف همان روز را به‌روز می‌کنند و هر بازه (REPORT_RANGES)
+با جمع حداکثر چند صد ردیف جواب داده می‌شود.
+"""
+
+import logging
+import os
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Counter(NamedTuple):
+    name: str
+    table: str
+    where: str            # شرط روی ستون‌های ردیف (با پیشوند {row}.)
+    value: str = '1'      # مقداری که هر ردیف به شمارنده اضافه می‌کند (COUNT → 1، SUM → ستون)
+    columns: Tuple[str, ...] = ()  # ستون‌هایی که تغییرشان شمارنده را جابه‌جا می‌کند
+
+
+COUNTERS: List[Counter] = [
+    # database.get_detailed_statistics
+    Counter('users_total', 'users', '1'),
+    Counter('products_total', 'products', '1'),
+    Counter('products_active', 'products', '{row}.active = 1', columns=('active',)),
+    Counter('accounts_available', 'accounts', '{row}.is_sold = 0 AND {row}.reserved_until IS NULL',
+            columns=('is_sold', 'reserved_until')),
+    Counter('accounts_sold', 'accounts', '{row}.is_sold = 1', columns=('is_sold',)),
+    Counter('orders_delivered', 'orders', "{row}.status = 'delivered'", columns=('status',)),
+    Counter('orders_revenue', 'orders', "{row}.status = 'delivered'", 'COALESCE({row}.price, 0)',
+            columns=('status', 'price')),
+    # payment_zibal.PaymentZibalDB.get_statistics
+    Counter('zibal_success_count', 'zibal_transactions', "{row}.status = 'success'", columns=('status',)),
+    Counter('zibal_success_amount', 'zibal_transactions', "{row}.status = 'success'", 'COALESCE({row}.amount, 0)',
+            columns=('status', 'amount')),
+    Counter('zibal_pending_count', 'zibal_transactions', "{row}.status = 'pending'", columns=('status',)),
+    # payment_digital.PaymentDigitalDB.get_statistics
+    Counter('crypto_finished_count', 'crypto_transactions', "{row}.payment_status = 'finished'",
+            columns=('payment_status',)),
+    Counter('crypto_finished_usd', 'crypto_transactions', "{row}.payment_status = 'finished'",
+            'COALESCE({row}.actual_amount_usd, 0)', columns=('payment_status', 'actual_amount_usd')),
+    Counter('crypto_waiting_count', 'crypto_transactions', "{row}.payment_status = 'waiting'",
+            columns=('payment_status',)),
+    # help.HelpDB.get_statistics
+    Counter('tickets_open', 'support_tickets', "{row}.status = 'open'", columns=('status',)),
+    Counter('support_user_messages', 'support_messages', '{row}.is_from_admin = 0', columns=('is_from_admin',)),
+    Counter('support_admin_messages', 'support_messages', '{row}.is_from_admin = 1', columns=('is_from_admin',)),
+    Counter('support_unread_messages', 'support_messages', '{row}.is_read = 0 AND {row}.is_from_admin = 0',
+            columns=('is_read', 'is_from_admin')),
+]
+
+COUNTER_NAMES = tuple(c.name for c in COUNTERS)
+
+
+class Rollup(NamedTuple):
+    gateway: str
+    table: str
+    status: str       # ستون وضعیت
+    success: str      # وضعیت‌های نهایی موفق/ناموفق (به شکل لیست SQL)
+    failed: str
+    amount: str       # ستون مبلغ موفق
+
+
+ROLLUPS: List[Rollup] = [
+    Rollup('zibal', 'zibal_transactions', 'status', "('success')", "('failed')", 'amount'),
+    Rollup('crypto', 'crypto_transactions', 'payment_status', "('finished')", "('failed', 'expired')",
+           'actual_amount_usd'),
+]
+
+# بازه‌های گزارش: (کلید callback، عنوان، تعداد روز با امروز؛ None = از ابتدای ماه)
+REPORT_RANGES: List[Tuple[str, str, Optional[int]]] = [
+    ('7', '7 روز اخیر', 7),
+    ('30', '30 روز اخیر', 30),
+    ('90', '90 روز اخیر', 90),
+    ('mtd', 'از ابتدای ماه', None),
+]
+
+# اختلاف کمتر از این در جمع‌های اعشاری (دلار) خطای گرد کردن است نه drift
+_TOLERANCE = 1e-6
+
+# حذف ردیف هنگام انتقال به بایگانی (archive.py) شمارنده‌ها را کم نمی‌کند: آمارها کل تاریخچه‌اند
+_UNLESS_FROZEN = "WHEN NOT EXISTS (SELECT 1 FROM stat_freeze)"
+
+
+def _delta(counter: Counter, row: str) -> str:
+    return f"CASE WHEN {counter.where.format(row=row)} THEN {counter.value.format(row=row)} ELSE 0 END"
+
+
+def _source(conn, table: str) -> str:
+    """جدول برای محاسبه از نو: اگر بایگانی attach شده، view هر دو فایل با همان نام جدول"""
+    view = f"{table}_all"
+    if conn.execute("SELECT 1 FROM temp.sqlite_master WHERE type = 'view' AND name = ?", (view,)).fetchone():
+        return f"{view} AS {table}"
+    return table
+
+
+@contextmanager
+def frozen(conn):
+    """حذف‌های داخل این بلوک (همان تراکنش) stat_counters و payment_daily را تغییر نمی‌دهند"""
+    conn.execute("INSERT OR IGNORE INTO stat_freeze (id) VALUES (1)")
+    try:
+        yield
+    finally:
+        conn.execute("DELETE FROM stat_freeze")
+
+
+def _by_table(counters: Iterable[Counter]) -> Dict[str, List[Counter]]:
+    tables: Dict[str, List[Counter]] = {}
+    for counter in counters:
+        tables.setdefault(counter.table, []).append(counter)
+    return tables
+
+
+class StatsDB:
+    """عملیات دیتابیس شمارنده‌ها"""
+
+    @staticmethod
+    def init_tables(conn):
+        """جدول stat_counters، triggerهای همه جداول و مقدار اولیه (idempotent)"""
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS stat_counters (
+                name TEXT PRIMARY KEY,
+                value NUMERIC NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+        """)
+        conn.executemany("INSERT OR IGNORE INTO stat_counters (name, value) VALUES (?, 0)",
+                         [(name,) for name in COUNTER_NAMES])
+        StatsDB.create_triggers(conn)
+        StatsDB.rebuild(conn)
+
+    @staticmethod
+    def create_triggers(conn):
+        """(باز)سازی triggerهای stat_counters بدون محاسبه دوباره مقدارها"""
+        conn.execute("CREATE TABLE IF NOT EXISTS stat_freeze (id INTEGER PRIMARY KEY)")
+        for table, counters in _by_table(COUNTERS).items():
+            for event in ('insert', 'delete', 'update'):
+                conn.execute(f"DROP TRIGGER IF EXISTS stat_{table}_{event}")
+
+            def body(sign: str, row: str, group=counters) -> str:
+                return "\n".join(
+                    f"UPDATE stat_counters SET value = value {sign} ({_delta(c, row)}) WHERE name = '{c.name}';"
+                    for c in group
+                )
+
+            conn.execute(f"CREATE TRIGGER stat_{table}_insert AFTER INSERT ON {table} BEGIN\n"
+                         f"{body('+', 'NEW')}\nEND")
+            conn.execute(f"CREATE TRIGGER stat_{table}_delete AFTER DELETE ON {table} {_UNLESS_FROZEN} BEGIN\n"
+                         f"{body('-', 'OLD')}\nEND")
+
+            updated = [c for c in counters if c.columns]
+            if updated:
+                columns = sorted({col for c in updated for col in c.columns})
+                conn.execute(
+                    f"CREATE TRIGGER stat_{table}_update AFTER UPDATE OF {', '.join(columns)} ON {table} BEGIN\n"
+                    + "\n".join(
+                        f"UPDATE stat_counters SET value = value - ({_delta(c, 'OLD')}) + ({_delta(c, 'NEW')}) "
+                        f"WHERE name = '{c.name}';"
+                        for c in updated
+                    )
+                    + "\nEND"
+                )
+
+    @staticmethod
+    def init_rollups(conn):
+        """جدول payment_daily، triggerهای درگاه‌ها و محاسبه اولیه از روی تراکنش‌های موجود (idempotent)"""
+        StatsDB.create_rollup_table(conn)
+        conn.execute("DELETE FROM payment_daily")
+        conn.executemany(
+            "INSERT INTO payment_daily (gateway, day, success_count, success_amount, failed_count) VALUES (?, ?, ?, ?, ?)",
+            [key + values for key, values in StatsDB.compute_rollups(conn).items()]
+        )
+
+    @staticmethod
+    def create_rollup_table(conn):
+        """جدول خالی payment_daily و triggerهای آن (بدون محاسبه اولیه؛ ارزان و مناسب راه‌اندازی)"""
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS payment_daily (
+                gateway TEXT NOT NULL,
+                day TEXT NOT NULL,
+                success_count INTEGER NOT NULL DEFAULT 0,
+                success_amount NUMERIC NOT NULL DEFAULT 0,
+                failed_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (gateway, day)
+            ) WITHOUT ROWID
+        """)
+        StatsDB.create_rollup_triggers(conn)
+
+    @staticmethod
+    def create_rollup_triggers(conn):
+        """(باز)سازی triggerهای payment_daily بدون محاسبه دوباره"""
+        conn.execute("CREATE TABLE IF NOT EXISTS stat_freeze (id INTEGER PRIMARY KEY)")
+        for r in ROLLUPS:
+            def add(row: str, sign: str) -> str:
+                # سهم یک ردیف در روز خودش؛ ردیفی که به وضعیت نهایی نرسیده چیزی اضافه نمی‌کند
+                return f"""
+                    INSERT INTO payment_daily (gateway, day, success_count, success_amount, failed_count)
+                    SELECT '{r.gateway}', COALESCE(date({row}.created_at), ''),
+                           {sign}({row}.{r.status} IN {r.success}),
+                           {sign}(CASE WHEN {row}.{r.status} IN {r.success} THEN COALESCE({row}.{r.amount}, 0) ELSE 0 END),
+                           {sign}({row}.{r.status} IN {r.failed})
+                    WHERE {row}.{r.status} IN {r.success} OR {row}.{r.status} IN {r.failed}
+                    ON CONFLICT (gateway, day) DO UPDATE SET
+                        success_count = success_count + excluded.success_count,
+                        success_amount = success_amount + excluded.success_amount,
+                        failed_count = failed_count + excluded.failed_count;
+                """
+
+            for event in ('insert', 'delete', 'update'):
+                conn.execute(f"DROP TRIGGER IF EXISTS rollup_{r.table}_{event}")
+            conn.execute(f"CREATE TRIGGER rollup_{r.table}_insert AFTER INSERT ON {r.table} BEGIN {add('NEW', '+')} END")
+            conn.execute(f"CREATE TRIGGER rollup_{r.table}_delete AFTER DELETE ON {r.table} {_UNLESS_FROZEN} "
+                         f"BEGIN {add('OLD', '-')} END")
+            conn.execute(f"""
+                CREATE TRIGGER rollup_{r.table}_update
+                AFTER UPDATE OF {r.status}, {r.amount}, created_at ON {r.table}
+                WHEN OLD.{r.status} IS NOT NEW.{r.status} OR OLD.{r.amount} IS NOT NEW.{r.amount}
+                  OR OLD.created_at IS NOT NEW.created_at
+                BEGIN {add('OLD', '-')} {add('NEW', '+')} END
+            """)
+
+    @staticmethod
+    def payment_totals(conn, since_day: str) -> Dict[str, Dict[str, float]]:
+        """
+        جمع هر درگاه از روز since_day (YYYY-MM-DD) تا امروز، از روی payment_daily
+        Returns {gateway: {"success_count", "success_amount", "failed_count"}}
+        """
+        gateways = [r.gateway for r in ROLLUPS]
+        totals = {g: {"success_count": 0, "success_amount": 0, "failed_count": 0} for g in gateways}
+        cursor = conn.execute(f"""
+            SELECT gateway, SUM(success_count), SUM(success_amount), SUM(failed_count)
+            FROM payment_daily
+            WHERE gateway IN ({', '.join('?' * len(gateways))}) AND day >= ?
+            GROUP BY gateway
+        """, (*gateways, since_day))
+        for gateway, success_count, success_amount, failed_count in cursor.fetchall():
+            totals[gateway] = {"success_count": success_count, "success_amount": success_amount,
+                               "failed_count": failed_count}
+        return totals
+
+    @staticmethod
+    def compute_rollups(conn) -> Dict[Tuple[str, str], Tuple[float, float, float]]:
+        """محاسبه payment_daily از روی تراکنش‌ها (یک پیمایش برای هر درگاه)"""
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        actual = {}
+        for r in ROLLUPS:
+            if r.table not in tables:
+                continue
+            cursor = conn.execute(f"""
+                SELECT COALESCE(date(created_at), ''),
+                       SUM({r.status} IN {r.success}),
+                       SUM(CASE WHEN {r.status} IN {r.success} THEN COALESCE({r.amount}, 0) ELSE 0 END),
+                       SUM({r.status} IN {r.failed})
+                FROM {_source(conn, r.table)}
+                WHERE {r.status} IN {r.success} OR {r.status} IN {r.failed}
+                GROUP BY 1
+            """)
+            actual.update(((r.gateway, row[0]), tuple(row[1:])) for row in cursor.fetchall())
+        return actual
+
+    @staticmethod
+    def rollup_drift(conn) -> List[Tuple[str, Tuple, Tuple]]:
+        """روزهایی که payment_daily با تراکنش‌ها نمی‌خواند: [("gateway day", stored, actual)]"""
+        stored = {(row[0], row[1]): tuple(row[2:]) for row in conn.execute(
+            "SELECT gateway, day, success_count, success_amount, failed_count FROM payment_daily")}
+        actual = StatsDB.compute_rollups(conn)
+        zero = (0, 0, 0)
+        drift = []
+        for key in sorted(set(stored) | set(actual), key=lambda k: k):
+            a, b = stored.get(key, zero), actual.get(key, zero)
+            if any(abs((x or 0) - (y or 0)) > _TOLERANCE for x, y in zip(a, b)):
+                drift.append((f"{key[0]} {key[1]}", a, b))
+        return drift
+
+    @staticmethod
+    def rebuild_rollups(conn) -> List[Tuple[str, Tuple, Tuple]]:
+        drift = StatsDB.rollup_drift(conn)
+        if drift:
+            conn.execute("DELETE FROM payment_daily")
+            conn.executemany(
+                "INSERT INTO payment_daily (gateway, day, success_count, success_amount, failed_count) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [key + values for key, values in StatsDB.compute_rollups(conn).items()]
+            )
+        return drift
+
+    @staticmethod
+    def get(conn, *names: str) -> Dict[str, float]:
+        """مقدار شمارنده‌ها (بدون نام: همه) در یک query روی کلید اصلی"""
+        names = names or COUNTER_NAMES
+        cursor = conn.execute(
+            f"SELECT name, value FROM stat_counters WHERE name IN ({', '.join('?' * len(names))})", names
+        )
+        values = {name: 0 for name in names}
+        values.update((row[0], row[1]) for row in cursor.fetchall())
+        return values
+
+    @staticmethod
+    def compute(conn) -> Dict[str, float]:
+        """محاسبه همه شمارنده‌ها از روی جداول (یک پیمایش برای هر جدول)؛ جدول ناموجود = صفر"""
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        actual = {}
+        for table, counters in _by_table(COUNTERS).items():
+            if table not in tables:
+                actual.update((c.name, 0) for c in counters)
+                continue
+            row = conn.execute(
+                "SELECT " + ", ".join(f"COALESCE(SUM({_delta(c, table)}), 0)" for c in counters)
+                + f" FROM {_source(conn, table)}"
+            ).fetchone()
+            actual.update(zip((c.name for c in counters), row))
+        return actual
+
+    @staticmethod
+    def drift(conn) -> List[Tuple[str, float, float]]:
+        """شمارنده‌هایی که با جداول نمی‌خوانند: [(name, stored, actual)]"""
+        stored = StatsDB.get(conn)
+        return [(name, stored[name], value) for name, value in StatsDB.compute(conn).items()
+                if abs((stored[name] or 0) - value) > _TOLERANCE]
+
+    @staticmethod
+    def rebuild(conn) -> List[Tuple[str, float, float]]:
+        """نوشتن مقدار واقعی به جای شمارنده‌های ناهمخوان؛ Returns همان drift"""
+        drift = StatsDB.drift(conn)
+        conn.executemany("UPDATE stat_counters SET value = ? WHERE name = ?",
+                         [(actual, name) for name, _, actual in drift])
+        return drift
+
+
+def report_since(range_key: str) -> str:
+    """اولین روز بازه گزارش (UTC، مثل created_at)"""
+    days = {key: days for key, _, days in REPORT_RANGES}[range_key]
+    today = datetime.now(timezone.utc).date()
+    return (today.replace(day=1) if days is None else today - timedelta(days=days - 1)).isoformat()
+
+
+def get_counters(db, *names: str) -> Dict[str, float]:
+    with db.get_connection() as conn:
+        return StatsDB.get(conn, *names)
+
+
+def check_counters(db) -> List[Tuple[str, Any, Any]]:
+    """اختلاف شمارنده‌ها و ردیف‌های payment_daily با جداول"""
+    with db.get_connection() as conn:
+        return StatsDB.drift(conn) + StatsDB.rollup_drift(conn)
+
+
+def rebuild_counters(db) -> List[Tuple[str, Any, Any]]:
+    """محاسبه دوباره زیر قفل نوشتن تا تغییر همزمان بین شمارش و نوشتن جا نیفتد"""
+    with db.get_connection() as conn:
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        drift = StatsDB.rebuild(conn) + StatsDB.rebuild_rollups(conn)
+    if drift:
+        logger.warning(f"{len(drift)} شمارنده آمار اصلاح شد: {', '.join(name for name, _, _ in drift)}")
+    return drift
+
+
+def _check(path: str, repair: bool) -> int:
+    from database import Database
+
+    db = Database(path, pool_size=1)
+    # ردیف‌های بایگانی‌شده هم در آمار کل حساب می‌شوند
+    from archive import default_path
+    if os.path.exists(default_path(path)):
+        db.attach_archive(default_path(path))
+    drift = rebuild_counters(db) if repair else check_counters(db)
+    for name, stored, actual in drift:
+        print(f"{'🔧' if repair else '❌'} {name}: {stored} ذخیره شده، {actual} واقعی")
+    print(f"{len(drift)} شمارنده ناهمخوان" + (" (اصلاح شد)" if repair and drift else ""))
+    db.close()
+    return 0 if repair or not drift else 1
+
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) > 2 and sys.argv[1] == 'check':
+        sys.exit(_check(sys.argv[2], '--repair' in sys.argv[3:]))
+    print("usage: python stats.py check <db> [--repair]")
+    sys.exit(2)
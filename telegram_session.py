@@ -0,0 +1,114 @@
+# telegram_session.py
+"""
+session مشترک HTTP برای همه درخواست‌های Bot API
+✅ تغییر مهم: همه فراخوانی‌های telebot (send_message, edit_message_text, ...) از یک session با
+connection pool و keep-alive استفاده می‌کنند؛ دیگر هر thread/درخواست اتصال TCP/TLS جدید باز نمی‌کند.
+proxy_url از config روی همین session اعمال می‌شود.
+
+اجرای مستقیم فایل (python telegram_session.py) تاخیر هر فراخوانی را با یک سرور محلی
+شبیه Bot API، قبل و بعد از pool اندازه می‌گیرد.
+"""
+
+import logging
+from typing import Optional, Dict, Any
+
+import requests
+from requests.adapters import HTTPAdapter
+from telebot import apihelper
+
+logger = logging.getLogger(__name__)
+
+
+def configure_session(pool_size: int = 16, proxy_url: Optional[str] = None,
+                      connect_timeout: int = 30, read_timeout: int = 60) -> requests.Session:
+    """ساخت session مشترک و تنظیم apihelper برای استفاده از آن"""
+    session = requests.Session()
+    # همه درخواست‌ها به یک host می‌روند؛ pool_maxsize تعداد اتصالات باز همزمان است
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=0)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    # apihelper برای هر thread از همین session استفاده می‌کند (به جای ساختن session جدید)
+    apihelper.session = session
+    apihelper.SESSION_TIME_TO_LIVE = None
+    apihelper.CONNECT_TIMEOUT = connect_timeout
+    apihelper.READ_TIMEOUT = read_timeout
+    if proxy_url:
+        apihelper.proxy = {'http': proxy_url, 'https': proxy_url}
+
+    logger.info(f"✅ session تلگرام با pool_size={pool_size}{' و proxy' if proxy_url else ''} تنظیم شد")
+    return session
+
+
+# ===== BENCHMARK =====
+
+def _percentiles(samples) -> Dict[str, float]:
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    return {'p50': pick(0.50), 'p95': pick(0.95), 'p99': pick(0.99)}
+
+
+def _benchmark(calls: int = 2000, threads: int = 8, handshake_ms: float = 20.0) -> Dict[str, Any]:
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    import telebot
+
+    class FakeBotAPI(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive
+        disable_nagle_algorithm = True  # هدر و بدنه جدا نوشته می‌شوند؛ بدون این delayed ACK غالب می‌شود
+
+        def setup(self):
+            # شبیه‌سازی هزینه TCP/TLS handshake برای هر اتصال جدید تا api.telegram.org
+            time.sleep(handshake_ms / 1000)
+            super().setup()
+
+        def _reply(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                self.rfile.read(length)
+            body = b'{"ok":true,"result":true}'
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = do_POST = _reply
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeBotAPI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    apihelper.API_URL = f"http://127.0.0.1:{server.server_address[1]}/bot{{0}}/{{1}}"
+    bot = telebot.TeleBot('0:benchmark', threaded=False)
+
+    def run() -> Dict[str, float]:
+        def one(_):
+            start = time.perf_counter()
+            bot.answer_callback_query('1')
+            return time.perf_counter() - start
+        with ThreadPoolExecutor(threads) as pool:
+            return _percentiles(list(pool.map(one, range(calls))))
+
+    # قبل: مثل thread-per-request در Flask، هر فراخوانی session (و اتصال) جدید دارد
+    apihelper.session = None
+    apihelper.SESSION_TIME_TO_LIVE = 0
+    before = run()
+
+    configure_session(pool_size=threads)
+    after = run()
+
+    server.shutdown()
+    return {'before': before, 'after': after}
+
+
+if __name__ == '__main__':
+    results = _benchmark()
+    print("(handshake شبیه‌سازی‌شده: 20ms برای هر اتصال جدید)")
+    print(f"{'':<8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, p in results.items():
+        print(f"{name:<8}{p['p50']:>10.3f}{p['p95']:>10.3f}{p['p99']:>10.3f}")
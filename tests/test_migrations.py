@@ -0,0 +1,102 @@
+# tests/test_migrations.py
+"""
+اتمی بودن migrationها: خطای وسط یک مرحله نباید schema نیمه‌کاره بدون ثبت نسخه جا بگذارد
+اجرا: python -m unittest discover tests  (یا pytest)
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('BOT_TOKEN', '0:migration-check')
+os.environ.setdefault('ADMIN_IDS', '1')
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+class MigrationAtomicityTest(unittest.TestCase):
+    def setUp(self):
+        import migrations
+        self.migrations = migrations
+        self.original = list(migrations.MIGRATIONS)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'shop.db')
+
+    def tearDown(self):
+        self.migrations.MIGRATIONS[:] = self.original
+        self.tmp.cleanup()
+
+    def _interrupt(self, version):
+        """مرحله version کارش را انجام می‌دهد و بعد (قبل از ثبت نسخه) خطا می‌دهد"""
+        def apply(conn, step=self.original[[m.version for m in self.original].index(version)]):
+            step.apply(conn)
+            raise RuntimeError('interrupted')
+
+        self.migrations.MIGRATIONS[:] = [m._replace(apply=apply) if m.version == version else m
+                                         for m in self.original]
+
+    def test_interrupted_migration_rolls_back_and_reruns(self):
+        from database import Database
+
+        self._interrupt(10)
+        with self.assertRaises(RuntimeError):
+            Database(self.path, pool_size=1)
+
+        import sqlite3
+        conn = sqlite3.connect(self.path)
+        applied = {row[0] for row in conn.execute("SELECT version FROM schema_version")}
+        self.assertNotIn(10, applied)
+        self.assertIn(9, applied)
+        # ALTERهای مرحله 10 همراه آن rollback شده‌اند
+        self.assertNotIn('product_id', _columns(conn, 'orders'))
+        self.assertIsNone(conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'accounts'").fetchone())
+        conn.close()
+
+        self.migrations.MIGRATIONS[:] = self.original
+        db = Database(self.path, pool_size=1)
+        self.migrations.run_background(db)
+        self.assertTrue(self.migrations.is_current(db))
+        with db.get_connection() as conn:
+            self.assertTrue({'product_id', 'account_id'} <= _columns(conn, 'orders'))
+        db.close()
+
+    def test_partial_schema_from_older_run_resumes(self):
+        # schema نیمه‌کاره از نسخه‌ای که ADD COLUMN را بیرون از تراکنش اجرا می‌کرد
+        from database import Database
+
+        self._interrupt(19)
+        with self.assertRaises(RuntimeError):
+            Database(self.path, pool_size=1)
+
+        import sqlite3
+        conn = sqlite3.connect(self.path)
+        conn.execute("ALTER TABLE broadcasts ADD COLUMN audience TEXT NOT NULL DEFAULT 'users'")
+        conn.commit()
+        conn.close()
+
+        self.migrations.MIGRATIONS[:] = self.original
+        db = Database(self.path, pool_size=1)
+        with db.get_connection() as conn:
+            self.assertIn(19, {row[0] for row in conn.execute("SELECT version FROM schema_version")})
+        db.close()
+
+    def test_payment_totals_before_background_backfill(self):
+        # /stats نباید تا تمام شدن migration پس‌زمینه 14 خطای «no such table» بدهد
+        from database import Database
+        from stats import StatsDB
+
+        db = Database(self.path, pool_size=1)
+        self.assertIn(14, [m.version for m in self.migrations.pending(db, background=True)])
+        with db.get_connection() as conn:
+            totals = StatsDB.payment_totals(conn, '2000-01-01')
+        self.assertEqual(totals['zibal']['success_count'], 0)
+        db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+# tests/test_query_plans.py
+"""
+بررسی plan همه queryهای کد (db_indexes.check_query_plans) به صورت تست
+اجرا: python -m unittest discover tests  (یا pytest)
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# config.py بدون این دو مقدار import نمی‌شود؛ تست به تلگرام وصل نمی‌شود
+os.environ.setdefault('BOT_TOKEN', '0:query-plan-check')
+os.environ.setdefault('ADMIN_IDS', '1')
+
+
+class QueryPlanTest(unittest.TestCase):
+    def test_all_queries_use_indexes(self):
+        from db_indexes import check_query_plans
+        self.assertEqual(check_query_plans(), 0)
+
+    def test_full_index_scan_is_rejected(self):
+        import sqlite3
+        from db_indexes import bad_plan_steps
+
+        conn = sqlite3.connect(':memory:')
+        conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, a INTEGER, b INTEGER)")
+        conn.execute("CREATE INDEX idx_t_a ON t (a)")
+        self.assertEqual(bad_plan_steps(conn, "SELECT id FROM t WHERE a = 1"), [])
+        self.assertTrue(bad_plan_steps(conn, "SELECT COUNT(a) FROM t"))  # SCAN ... COVERING INDEX
+        self.assertTrue(bad_plan_steps(conn, "SELECT * FROM t ORDER BY b"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+# tests/test_webhook_reply.py
+"""
+ReplyCapture: فراخوانی نگه داشته‌شده یا در پاسخ webhook می‌رود یا واقعاً ارسال می‌شود، هیچ‌وقت گم نمی‌شود
+اجرا: python -m unittest discover tests  (یا pytest)
+"""
+
+import os
+import sys
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import webhook_reply
+from webhook_reply import ReplyCapture, replyable
+
+URL = 'https://api.telegram.org/bot0:test/answerCallbackQuery'
+
+
+@replyable
+def _handler():
+    webhook_reply._request_sender('post', URL, params={'callback_query_id': '1'})
+
+
+def _worker(capture, started, release):
+    with capture.activate():
+        _handler()
+        started.set()
+        release.wait(5)
+
+
+class _LateEvent(threading.Event):
+    """wait با timeout تمام می‌شود، ولی قبل از برگشتن اجازه می‌دهد handler کارش را تمام کند"""
+
+    def __init__(self, on_timeout):
+        super().__init__()
+        self.on_timeout = on_timeout
+
+    def wait(self, timeout=None):
+        self.on_timeout()
+        return False
+
+
+class ReplyCaptureRaceTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(webhook_reply, '_send')
+        self.send = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _start(self, capture):
+        started, release = threading.Event(), threading.Event()
+        worker = threading.Thread(target=_worker, args=(capture, started, release))
+        worker.start()
+        self.assertTrue(started.wait(5))
+        return worker, release
+
+    def test_handler_finishing_after_timeout_is_claimed(self):
+        capture = ReplyCapture()
+        worker, release = None, None
+
+        def finish_handler():
+            release.set()
+            worker.join(5)
+
+        capture.done = _LateEvent(finish_handler)
+        worker, release = self._start(capture)
+
+        body = capture.wait_for_reply(0.001)
+        self.assertEqual(body, {'method': 'answerCallbackQuery', 'callback_query_id': '1'})
+        self.assertFalse(capture.abandoned)
+        self.send.assert_not_called()
+
+    def test_abandoned_call_is_flushed(self):
+        capture = ReplyCapture()
+        worker, release = self._start(capture)
+
+        self.assertIsNone(capture.wait_for_reply(0.001))
+        self.assertTrue(capture.abandoned)
+        release.set()
+        worker.join(5)
+        self.send.assert_called_once()
+        self.assertEqual(self.send.call_args.args, ('post', URL))
+
+    def test_finished_handler_reply(self):
+        capture = ReplyCapture()
+        worker, release = self._start(capture)
+        release.set()
+        worker.join(5)
+
+        self.assertEqual(capture.wait_for_reply(1)['method'], 'answerCallbackQuery')
+        self.send.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
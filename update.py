@@ -6,6 +6,10 @@ Bot Maintenance Mode - Webhook Version
 """
 
 import os
+import signal
+import sqlite3
+import sys
+import time
 import logging
 import telebot
 from telebot import types
@@ -14,6 +18,8 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import SecretStr
 from datetime import datetime
 
+from write_behind import WriteBehind
+
 # ===== تنظیمات =====
 class Settings(BaseSettings):
     bot_token: SecretStr
@@ -75,13 +81,55 @@ ADMIN_PANEL_MESSAGE = """
 
 ━━━━━━━━━━━━━━━━━━━━━
 
-برای فعال‌سازی مجدد، Start Command را به `python bot.py` تغییر دهید.
+برای فعال‌سازی مجدد، Start Command را به `python bot.py` تغییر دهید؛
+بعد با `/broadcast_waitlist <پیام>` به {} کاربر لیست انتظار خبر دهید.
 """
 
 # ===== آمار =====
 blocked_users = set()
 start_time = datetime.now()
 
+# ===== لیست انتظار =====
+# کاربران در دیتابیس ربات اصلی ثبت می‌شوند تا بعد از پایان تعمیر بتوان به آن‌ها خبر داد؛
+# با commit گروهی (write_behind) تا هر پیام یک fsync جدا نباشد
+DATABASE_PATH = os.getenv('DATABASE_PATH', 'shop.db')
+waitlist = WriteBehind(DATABASE_PATH)
+waitlist.write("""
+    CREATE TABLE IF NOT EXISTS maintenance_waitlist (
+        user_id INTEGER PRIMARY KEY,
+        first_seen REAL NOT NULL,
+        last_seen REAL NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 1
+    )
+""")
+waitlist.start()
+
+def remember_user(user_id: int):
+    """ثبت کاربر در آمار و لیست انتظار"""
+    blocked_users.add(user_id)
+    now = time.time()
+    waitlist.write("""
+        INSERT INTO maintenance_waitlist (user_id, first_seen, last_seen) VALUES (?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET last_seen = excluded.last_seen, attempts = attempts + 1
+    """, (user_id, now, now))
+
+def waitlist_count() -> int:
+    """تعداد گیرنده‌های /broadcast_waitlist از خود جدول (همان شرط BroadcastDB.count_recipients)؛
+    blocked_users فقط کاربران همین اجرا را دارد، نه کسانی که قبل از restart ثبت شده‌اند"""
+    waitlist.flush()
+    conn = sqlite3.connect(DATABASE_PATH, timeout=5)
+    try:
+        try:
+            return conn.execute("""
+                SELECT COUNT(*) FROM maintenance_waitlist w
+                WHERE NOT EXISTS (SELECT 1 FROM blocked_chats b WHERE b.chat_id = w.user_id)
+            """).fetchone()[0]
+        except sqlite3.OperationalError:
+            # blocked_chats را migrationهای ربات اصلی می‌سازند
+            return conn.execute("SELECT COUNT(*) FROM maintenance_waitlist").fetchone()[0]
+    finally:
+        conn.close()
+
 # ===== Flask App =====
 app = Flask(__name__)
 
@@ -92,7 +140,7 @@ def handle_start(message):
     user_id = message.from_user.id
     user_name = message.from_user.first_name or message.from_user.username or "دوست عزیز"
     
-    blocked_users.add(user_id)
+    remember_user(user_id)
     
     logger.info(f"🚫 کاربر {user_name} ({user_id}) سعی در استفاده کرد")
     
@@ -132,7 +180,8 @@ def handle_admin(message):
         message.chat.id,
         ADMIN_PANEL_MESSAGE.format(
             start_time.strftime("%Y-%m-%d %H:%M:%S"),
-            len(blocked_users)
+            len(blocked_users),
+            waitlist_count()
         ),
         reply_markup=markup
     )
@@ -142,7 +191,7 @@ def handle_all_messages(message):
     user_id = message.from_user.id
     user_name = message.from_user.first_name or message.from_user.username or "دوست عزیز"
     
-    blocked_users.add(user_id)
+    remember_user(user_id)
     
     logger.info(f"🚫 پیام از {user_name} ({user_id}): {message.text[:50] if message.text else 'N/A'}")
     
@@ -295,6 +344,9 @@ if __name__ == '__main__':
         # تنظیم webhook
         setup_webhook()
         
+        # SIGTERM مثل خروج عادی: atexit لیست انتظار را flush می‌کند
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        
         # اجرای Flask
         port = int(os.getenv('PORT', 8080))
         logger.info(f"🚀 Flask server starting on port {port}")
@@ -0,0 +1,115 @@
+# update_dedup.py
+"""
+حذف updateهای تکراری webhook بر اساس update_id
+✅ تغییر مهم: وقتی تلگرام یک update را دوباره می‌فرستد (timeout یا 500)، قبل از parse کامل Update
+تشخیص داده می‌شود و بدون پردازش 200 برمی‌گردد.
+پنجره زمانی در جدول processed_updates (migration processed_updates) ذخیره می‌شود تا بعد از restart هم
+تکراری‌ها شناخته شوند. مسیر webhook فقط حافظه را بررسی می‌کند؛ ثبت در جدول از طریق صف write-behind
+(commit گروهی) انجام می‌شود و در crash حداکثر چند update_id آخر فراموش می‌شود.
+"""
+
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+# تلگرام update_id را اولین فیلد JSON می‌فرستد
+_UPDATE_ID_RE = re.compile(r'"update_id"\s*:\s*(\d+)')
+
+
+def extract_update_id(json_string: str) -> Optional[int]:
+    """خواندن update_id بدون ساختن شیء Update"""
+    match = _UPDATE_ID_RE.search(json_string, 0, 64)
+    if match:
+        return int(match.group(1))
+    try:
+        return int(json.loads(json_string)['update_id'])
+    except Exception:
+        return None
+
+
+class UpdateDeduplicator:
+    """مجموعه محدود update_idهای دیده‌شده در یک پنجره زمانی"""
+
+    PRUNE_EVERY = 1000  # هر چند insert یکبار جدول پاکسازی شود
+
+    def __init__(self, db, writer=None, window_seconds: int = 86400, max_size: int = 100000):
+        from write_behind import writer_for
+
+        self.window = window_seconds
+        self.max_size = max_size
+        self.writer = writer or writer_for(db)
+        self._seen: "OrderedDict[int, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inserts = 0
+        self.duplicates = 0
+        self._load(db)
+
+    def _load(self, db):
+        cutoff = time.time() - self.window
+        with db.get_connection() as conn:
+            rows = conn.execute("""
+                SELECT update_id, seen_at FROM processed_updates
+                WHERE seen_at >= ?
+                ORDER BY seen_at DESC
+                LIMIT ?
+            """, (cutoff, self.max_size)).fetchall()
+        for update_id, seen_at in reversed(rows):
+            self._seen[update_id] = seen_at
+        logger.info(f"✅ {len(self._seen)} update_id از پنجره قبلی بارگذاری شد")
+
+    def check_and_mark(self, update_id: int) -> bool:
+        """Returns True اگر update جدید است (و آن را علامت می‌زند)، False اگر تکراری است"""
+        now = time.time()
+        with self._lock:
+            if update_id in self._seen:
+                self.duplicates += 1
+                return False
+            self._seen[update_id] = now
+            self._evict(now)
+            self._inserts += 1
+            prune = self._inserts % self.PRUNE_EVERY == 0
+        # صف write-behind به ترتیب commit می‌کند (forget بعدی همین update_id را درست پاک می‌کند)؛
+        # ذخیره نشدن فقط تشخیص بعد از restart را ضعیف می‌کند
+        self.writer.write("INSERT OR REPLACE INTO processed_updates (update_id, seen_at) VALUES (?, ?)",
+                          (update_id, now))
+        if prune:
+            self._prune_table()
+        return True
+
+    def forget(self, update_id: Optional[int]):
+        """برداشتن علامت (مثلاً وقتی صف پر بود و تلگرام باید دوباره بفرستد)"""
+        if update_id is None:
+            return
+        with self._lock:
+            self._seen.pop(update_id, None)
+        self.writer.write("DELETE FROM processed_updates WHERE update_id = ?", (update_id,))
+
+    def _evict(self, now: float):
+        cutoff = now - self.window
+        while self._seen:
+            seen_at = next(iter(self._seen.values()))
+            if seen_at >= cutoff and len(self._seen) <= self.max_size:
+                break
+            self._seen.popitem(last=False)
+
+    def _prune_table(self):
+        # update_idها صعودی‌اند؛ حذف بر اساس کلید اصلی بدون scan انجام می‌شود
+        with self._lock:
+            if not self._seen:
+                return
+            oldest_id = min(self._seen)
+        self.writer.write("DELETE FROM processed_updates WHERE update_id < ?", (oldest_id,))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'tracked': len(self._seen),
+                'window_seconds': self.window,
+                'duplicates': self.duplicates,
+            }
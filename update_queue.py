@@ -0,0 +1,137 @@
+# update_queue.py
+"""
+صف ورودی updateهای webhook با تعداد محدود worker
+✅ تغییر مهم: webhook دیگر منتظر handlerها نمی‌ماند؛ update در صف گذاشته می‌شود و فوراً 200 برمی‌گردد.
+✅ ترتیب updateهای یک چت حفظ می‌شود: هر چت همیشه به یک worker ثابت (بر اساس chat_id) می‌رسد.
+"""
+
+import logging
+import queue
+import threading
+import time
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def update_chat_id(update) -> Optional[int]:
+    """chat_id مربوط به update (برای حفظ ترتیب پیام‌های یک چت)"""
+    if update.message:
+        return update.message.chat.id
+    if update.callback_query:
+        call = update.callback_query
+        if call.message:
+            return call.message.chat.id
+        return call.from_user.id
+    return None
+
+
+class UpdateQueue:
+    """صف محدود + pool از workerها که bot.process_new_updates را صدا می‌زنند"""
+
+    def __init__(self, bot, workers: int = 4, max_size: int = 1000, overflow: str = 'reject'):
+        if overflow not in ('reject', 'shed'):
+            raise ValueError(f"overflow نامعتبر: {overflow}")
+        self.bot = bot
+        self.workers = max(1, workers)
+        self.overflow = overflow
+        # هر worker صف مخصوص خودش را دارد تا ترتیب هر چت حفظ شود
+        per_worker = max(1, max_size // self.workers)
+        self._queues: List[queue.Queue] = [queue.Queue(maxsize=per_worker) for _ in range(self.workers)]
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._started = False
+        self.max_size = per_worker * self.workers
+
+        # آمار
+        self.accepted = 0
+        self.rejected = 0
+        self.shed = 0
+        self.processed = 0
+        self.failed = 0
+        self.busy_workers = 0
+        self.max_depth_seen = 0
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, args=(i,), name=f"update-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+        logger.info(f"✅ صف updateها با {self.workers} worker و ظرفیت {self.max_size} راه‌اندازی شد")
+
+    def submit(self, update, reply=None) -> bool:
+        """
+        افزودن update به صف.
+        reply: ReplyCapture اختیاری (webhook_reply) که worker هنگام پردازش فعال می‌کند.
+        Returns False اگر صف پر باشد و update پذیرفته نشد (webhook باید 503 بدهد).
+        در حالت shed، update دور ریخته می‌شود ولی True برمی‌گردد تا تلگرام دوباره نفرستد.
+        """
+        chat_id = update_chat_id(update)
+        index = (chat_id if chat_id is not None else update.update_id) % self.workers
+        try:
+            self._queues[index].put_nowait((time.monotonic(), update, reply))
+        except queue.Full:
+            with self._lock:
+                if self.overflow == 'shed':
+                    self.shed += 1
+                else:
+                    self.rejected += 1
+            logger.warning(f"⚠️ صف worker {index} پر است (update {update.update_id}, حالت {self.overflow})")
+            return self.overflow == 'shed'
+
+        with self._lock:
+            self.accepted += 1
+            depth = self.depth()
+            if depth > self.max_depth_seen:
+                self.max_depth_seen = depth
+        return True
+
+    def depth(self) -> int:
+        return sum(q.qsize() for q in self._queues)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'busy_workers': self.busy_workers,
+                'capacity': self.max_size,
+                'depth': self.depth(),
+                'depth_per_worker': [q.qsize() for q in self._queues],
+                'max_depth_seen': self.max_depth_seen,
+                'overflow': self.overflow,
+                'accepted': self.accepted,
+                'rejected': self.rejected,
+                'shed': self.shed,
+                'processed': self.processed,
+                'failed': self.failed,
+            }
+
+    def _worker(self, index: int):
+        q = self._queues[index]
+        while True:
+            enqueued_at, update, reply = q.get()
+            with self._lock:
+                self.busy_workers += 1
+            try:
+                waited = time.monotonic() - enqueued_at
+                if waited > 5:
+                    logger.warning(f"⏳ update {update.update_id} بعد از {waited:.1f} ثانیه در صف پردازش شد")
+                if reply is not None:
+                    with reply.activate():
+                        self.bot.process_new_updates([update])
+                else:
+                    self.bot.process_new_updates([update])
+                with self._lock:
+                    self.processed += 1
+            except Exception as e:
+                with self._lock:
+                    self.failed += 1
+                logger.error(f"Error processing update {update.update_id}: {e}", exc_info=True)
+            finally:
+                with self._lock:
+                    self.busy_workers -= 1
+                q.task_done()
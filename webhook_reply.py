@@ -0,0 +1,235 @@
+# webhook_reply.py
+"""
+پاسخ مستقیم در بدنه webhook برای handlerهای تک‌فراخوانی
+✅ تغییر مهم: تلگرام اجازه می‌دهد پاسخ HTTP همان webhook یک فراخوانی Bot API باشد.
+وقتی handler (مثلاً show_products یا admin_menu) دقیقاً یک فراخوانی قابل انتقال انجام دهد،
+آن فراخوانی به جای درخواست HTTP جداگانه در پاسخ webhook برگردانده می‌شود.
+اگر handler فراخوانی دوم داشته باشد، اولی فوراً (به ترتیب) واقعاً ارسال می‌شود و بقیه عادی می‌روند.
+
+محدودیت: نتیجه فراخوانی منتقل‌شده True فرض می‌شود و خطای آن به handler نمی‌رسد؛
+به همین دلیل فقط متدهایی که خروجی bool دارند منتقل می‌شوند (sendMessage نه)، و فقط داخل handlerهایی که
+با @replyable علامت خورده‌اند — handlerی که روی خطا fallback دارد (edit → send در back_to_main و
+show_account_types، «message is not modified» در broadcast) نباید علامت بخورد.
+
+اجرای مستقیم فایل (python webhook_reply.py) تاخیر قبل و بعد را با سرور محلی اندازه می‌گیرد.
+"""
+
+import functools
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Tuple
+
+from telebot import apihelper
+
+logger = logging.getLogger(__name__)
+
+# متدهایی که نتیجه‌شان bool است و می‌توانند در پاسخ webhook بروند
+REPLYABLE_METHODS = frozenset({
+    'answerCallbackQuery',
+    'editMessageText',
+    'editMessageReplyMarkup',
+    'deleteMessage',
+})
+
+_local = threading.local()
+
+
+class _FakeResponse:
+    """پاسخ ساختگی برای apihelper._check_result"""
+    status_code = 200
+    text = '{"ok":true,"result":true}'
+
+    def json(self):
+        return {'ok': True, 'result': True}
+
+
+class ReplyCapture:
+    """فراخوانی نگه داشته‌شده یک update؛ بین worker و thread درخواست webhook مشترک است"""
+
+    __slots__ = ('call', 'passthrough', 'claimed', 'abandoned', 'done', '_lock')
+
+    def __init__(self):
+        self.call: Optional[Tuple[str, str, Dict[str, Any]]] = None  # (api_method, url, kwargs)
+        self.passthrough = False  # بعد از فراخوانی دوم همه چیز عادی ارسال می‌شود
+        self.claimed = False      # thread webhook فراخوانی را برداشت
+        self.abandoned = False    # thread webhook دیگر منتظر نیست
+        self.done = threading.Event()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def activate(self):
+        """در thread worker دور process_new_updates"""
+        _local.capture = self
+        try:
+            yield
+        finally:
+            _local.capture = None
+            with self._lock:
+                abandoned = self.abandoned
+                self.done.set()
+            if abandoned:
+                self.flush()
+
+    def flush(self):
+        """ارسال واقعی فراخوانی نگه داشته‌شده (اگر هنوز برداشته نشده)"""
+        with self._lock:
+            if self.call is None or self.claimed:
+                return
+            _, url, kwargs = self.call
+            self.call = None
+        try:
+            _send('post', url, **kwargs)
+        except Exception as e:
+            logger.error(f"خطا در ارسال فراخوانی نگه داشته‌شده: {e}")
+
+    def wait_for_reply(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        در thread webhook: منتظر پایان handler می‌ماند.
+        Returns بدنه JSON پاسخ webhook یا None (پاسخ خالی)
+        """
+        self.done.wait(timeout)
+        # تصمیم فقط زیر قفل: ممکن است handler بین پایان wait و گرفتن قفل تمام شده باشد و چون
+        # abandoned هنوز False بود flush نکرده باشد؛ در آن صورت فراخوانی باید همین‌جا برداشته شود
+        with self._lock:
+            if not self.done.is_set():
+                self.abandoned = True
+                return None
+            if self.call is None:
+                return None
+            self.claimed = True
+            api_method, _, kwargs = self.call
+        body = {'method': api_method}
+        for key, value in (kwargs.get('params') or {}).items():
+            if key == 'reply_markup' and isinstance(value, str):
+                value = json.loads(value)  # telebot آن را قبلاً به رشته JSON تبدیل کرده
+            body[key] = value
+        return body
+
+
+def replyable(handler):
+    """handlerی که از نتیجه/خطای فراخوانی‌های Bot API خود استفاده نمی‌کند؛ فقط این‌ها در پاسخ webhook می‌روند"""
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        _local.replyable = True
+        try:
+            return handler(*args, **kwargs)
+        finally:
+            _local.replyable = False
+    return wrapper
+
+
+def _send(method, url, **kwargs):
+    return apihelper._get_req_session().request(method, url, **kwargs)
+
+
+def _request_sender(method, url, **kwargs):
+    capture: Optional[ReplyCapture] = getattr(_local, 'capture', None)
+    if capture is not None and not capture.passthrough and getattr(_local, 'replyable', False):
+        api_method = url.rsplit('/', 1)[-1]
+        if capture.call is None and api_method in REPLYABLE_METHODS and not kwargs.get('files'):
+            capture.call = (api_method, url, kwargs)
+            return _FakeResponse()
+        # بیش از یک فراخوانی: ترتیب حفظ می‌شود، اولی همین حالا ارسال می‌شود
+        capture.passthrough = True
+        capture.flush()
+    return _send(method, url, **kwargs)
+
+
+def install():
+    """ثبت request sender در telebot (session مشترک telegram_session همچنان استفاده می‌شود)"""
+    apihelper.CUSTOM_REQUEST_SENDER = _request_sender
+
+
+# ===== BENCHMARK =====
+
+def _benchmark(clicks: int = 200, rtt_ms: float = 40.0) -> Dict[str, Any]:
+    import time
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    import telebot
+    from telebot import types
+
+    requests_seen = []
+
+    class FakeBotAPI(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                self.rfile.read(length)
+            time.sleep(rtt_ms / 1000)  # شبیه‌سازی رفت و برگشت تا api.telegram.org
+            requests_seen.append(self.path)
+            body = b'{"ok":true,"result":true}'
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = do_POST
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeBotAPI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    apihelper.API_URL = f"http://127.0.0.1:{server.server_address[1]}/bot{{0}}/{{1}}"
+
+    bot = telebot.TeleBot('0:benchmark', threaded=False)
+
+    # مثل admin_menu در bot.py: یک edit_message_text
+    @bot.callback_query_handler(func=lambda call: True)
+    @replyable
+    def admin_menu(call):
+        markup = types.InlineKeyboardMarkup()
+        markup.add(types.InlineKeyboardButton("🛡️ مدیریت اکانت سفارشی", callback_data="admin_account_maker"))
+        bot.edit_message_text("🔧 پنل ادمین", call.message.chat.id, call.message.message_id, reply_markup=markup)
+
+    update = types.Update.de_json(json.dumps({
+        'update_id': 1,
+        'callback_query': {
+            'id': '1', 'chat_instance': '1', 'data': 'admin_menu',
+            'from': {'id': 1, 'is_bot': False, 'first_name': 'b'},
+            'message': {'message_id': 5, 'date': 0, 'chat': {'id': 1, 'type': 'private'}, 'text': 'x'},
+        },
+    }))
+
+    def percentiles(samples):
+        ordered = sorted(samples)
+        return {q: ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+                for q, p in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))}
+
+    results = {}
+    for name, reply in (('before', False), ('after', True)):
+        requests_seen.clear()
+        apihelper.CUSTOM_REQUEST_SENDER = _request_sender if reply else None
+        samples = []
+        for _ in range(clicks):
+            # زمان از رسیدن update تا آماده شدن پاسخ webhook (که کار کلیک را انجام می‌دهد)
+            start = time.perf_counter()
+            capture = ReplyCapture() if reply else None
+            if capture:
+                with capture.activate():
+                    bot.process_new_updates([update])
+                body = capture.wait_for_reply(1.0)
+                assert body and body['method'] == 'editMessageText'
+            else:
+                bot.process_new_updates([update])
+            samples.append(time.perf_counter() - start)
+        results[name] = dict(percentiles(samples), outbound_requests=len(requests_seen))
+
+    apihelper.CUSTOM_REQUEST_SENDER = None
+    server.shutdown()
+    return results
+
+
+if __name__ == '__main__':
+    results = _benchmark()
+    print("(رفت و برگشت شبیه‌سازی‌شده تا Bot API: 40ms)")
+    print(f"{'':<8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'requests':>10}")
+    for name, r in results.items():
+        print(f"{name:<8}{r['p50']:>10.3f}{r['p95']:>10.3f}{r['p99']:>10.3f}{r['outbound_requests']:>10}")
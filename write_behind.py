@@ -0,0 +1,302 @@
+# write_behind.py
+"""
+صف نوشتن با commit گروهی (group commit) برای insertهای غیرحیاتی
+✅ تغییر مهم: هر ذخیره پیام پشتیبانی، رویداد audit و ثبت کاربر در حالت تعمیر
+یک commit جدا (و یک fsync) روی مسیر درخواست بود. حالا این نوشتن‌ها در صف قرار می‌گیرند و
+یک thread جدا هر interval_ms میلی‌ثانیه یا هر max_rows ردیف همه را در یک تراکنش commit می‌کند.
+
+- durable=True: اتصال نویسنده با synchronous=FULL (هر batch یک fsync کامل)؛
+  durable=False: synchronous=NORMAL (در WAL فقط قطع برق می‌تواند آخرین batchها را از بین ببرد).
+- در هر دو حالت ردیف‌هایی که هنوز در صف‌اند (حداکثر interval_ms) با kill -9 از دست می‌روند؛
+  stop() (با atexit ثبت می‌شود) صف را کامل flush می‌کند.
+- فقط برای نوشتن‌های append-only و غیرمالی. موجودی، سفارش و پرداخت همچنان همزمان
+  (Database.get_connection) نوشته می‌شوند.
+
+اجرای مستقیم فایل (python write_behind.py) بنچمارک commit تکی در برابر commit گروهی را اجرا می‌کند.
+"""
+
+import atexit
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from database import apply_pragmas
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class WriteBehind:
+    """صف نوشتن با یک اتصال اختصاصی و commit گروهی"""
+
+    def __init__(self, path: str, interval_ms: int = 50, max_rows: int = 200, durable: bool = False,
+                 pragma_profile: str = 'default', max_pending: int = 10000):
+        if path == ':memory:':
+            raise ValueError("WriteBehind به فایل دیتابیس نیاز دارد (:memory: بین اتصال‌ها مشترک نیست)")
+        self.path = path
+        self.interval = interval_ms / 1000
+        self.max_rows = max(1, max_rows)
+        self.durable = durable
+        self.pragma_profile = pragma_profile
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_pending)
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+        self._lock = threading.Lock()
+
+        # آمار
+        self.queued = 0
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+        self.batches = 0
+        self.batch_max = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10.0, check_same_thread=False)
+        apply_pragmas(conn, self.pragma_profile)
+        conn.execute(f"PRAGMA synchronous = {'FULL' if self.durable else 'NORMAL'}")
+        return conn
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    # ===== API =====
+
+    def write(self, sql: str, params: tuple = ()) -> bool:
+        """
+        قرار دادن یک INSERT/UPDATE در صف. Returns False اگر صف تا یک ثانیه پر ماند و ردیف دور ریخته شد.
+        بعد از stop() نوشتن همزمان انجام می‌شود.
+        """
+        if self._stopped or self._thread is None:
+            self._write_now(sql, params)
+            return True
+        try:
+            self._queue.put((sql, params), timeout=1.0)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            logger.error(f"صف write-behind پر است؛ نوشتن دور ریخته شد: {sql.split(None, 3)[:3]}")
+            return False
+        with self._lock:
+            self.queued += 1
+        return True
+
+    def audit(self, event: str, actor_id: Optional[int] = None, target_id: Optional[int] = None,
+              details: Optional[Dict[str, Any]] = None) -> bool:
+        """ثبت رویداد در audit_events"""
+        return self.write(
+            "INSERT INTO audit_events (event, actor_id, target_id, details, created_at) VALUES (?, ?, ?, ?, ?)",
+            (event, actor_id, target_id, json.dumps(details, ensure_ascii=False) if details else None, time.time())
+        )
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """صبر تا همه نوشتن‌های قبلی commit شوند"""
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def stop(self, timeout: float = 10.0):
+        """flush نهایی و توقف thread (در shutdown)"""
+        if self._stopped:
+            return
+        self._stopped = True
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                logger.error("write-behind در زمان مقرر flush نشد")
+                return
+        logger.info(f"✅ write-behind متوقف شد ({self.written} ردیف در {self.batches} commit)")
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'pending': self._queue.qsize(),
+                'queued': self.queued,
+                'written': self.written,
+                'failed': self.failed,
+                'dropped': self.dropped,
+                'batches': self.batches,
+                'batch_avg': (self.written / self.batches) if self.batches else 0.0,
+                'batch_max': self.batch_max,
+                'durable': self.durable,
+            }
+
+    # ===== داخلی =====
+
+    def _write_now(self, sql: str, params: tuple):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(sql, params)
+        finally:
+            conn.close()
+
+    def _run(self):
+        conn = self._connect()
+        try:
+            while True:
+                item = self._queue.get()
+                rows, events, stop = [], [], False
+                deadline = time.monotonic() + self.interval
+                while True:
+                    if item is _STOP:
+                        stop = True
+                    elif isinstance(item, threading.Event):
+                        events.append(item)
+                    else:
+                        rows.append(item)
+                    # flush/stop منتظر پر شدن batch نمی‌ماند؛ بقیه چیزهایی که در صف است همراهش می‌رود
+                    if len(rows) >= self.max_rows:
+                        break
+                    try:
+                        if events or stop:
+                            item = self._queue.get_nowait()
+                        else:
+                            remaining = deadline - time.monotonic()
+                            if remaining <= 0:
+                                break
+                            item = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                if rows:
+                    self._commit(conn, rows)
+                for event in events:
+                    event.set()
+                if stop:
+                    # هر چیزی که بعد از STOP رسیده هم نوشته می‌شود
+                    rest, events = [], []
+                    while True:
+                        try:
+                            item = self._queue.get_nowait()
+                        except queue.Empty:
+                            break
+                        if isinstance(item, threading.Event):
+                            events.append(item)
+                        elif item is not _STOP:
+                            rest.append(item)
+                    if rest:
+                        self._commit(conn, rest)
+                    for event in events:
+                        event.set()
+                    return
+        finally:
+            conn.close()
+
+    def _commit(self, conn: sqlite3.Connection, rows):
+        try:
+            with conn:
+                for sql, params in rows:
+                    conn.execute(sql, params)
+            written, failed = len(rows), 0
+        except sqlite3.Error as e:
+            # یک ردیف خراب نباید کل batch را از بین ببرد: تک‌تک دوباره
+            logger.warning(f"batch write-behind ناموفق ({e})؛ نوشتن تک‌به‌تک {len(rows)} ردیف")
+            written = failed = 0
+            for sql, params in rows:
+                try:
+                    with conn:
+                        conn.execute(sql, params)
+                    written += 1
+                except sqlite3.Error as row_error:
+                    failed += 1
+                    logger.error(f"خطا در write-behind: {row_error} — {' '.join(sql.split())[:80]}")
+        with self._lock:
+            self.written += written
+            self.failed += failed
+            self.batches += 1
+            self.batch_max = max(self.batch_max, len(rows))
+
+
+_writers: Dict[str, WriteBehind] = {}
+_writers_lock = threading.Lock()
+
+
+def writer_for(db, **options) -> WriteBehind:
+    """صف نوشتن مربوط به فایل دیتابیس db؛ اولین فراخوانی (در bot.py) تنظیمات را تعیین می‌کند"""
+    path = db if isinstance(db, str) else db.path
+    with _writers_lock:
+        writer = _writers.get(path)
+        if writer is None:
+            if not isinstance(db, str):
+                options.setdefault('pragma_profile', db.pool.pragma_profile)
+            writer = _writers[path] = WriteBehind(path, **options)
+            writer.start()
+        return writer
+
+
+# ===== BENCHMARK =====
+
+def _benchmark(rows: int = 2000, threads: int = 8):
+    import os
+    import tempfile
+
+    sql = "INSERT INTO bench (user_id, message_text, created_at) VALUES (?, ?, ?)"
+
+    def run(name, write):
+        start = time.perf_counter()
+        latencies = []
+
+        def worker(offset):
+            for i in range(offset, rows, threads):
+                t = time.perf_counter()
+                write(i)
+                latencies.append(time.perf_counter() - t)
+
+        pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        elapsed = time.perf_counter() - start
+        latencies.sort()
+        print(f"{name:<22}{rows / elapsed:>10.0f}{latencies[len(latencies) // 2] * 1000:>10.3f}"
+              f"{latencies[int(len(latencies) * 0.99)] * 1000:>10.3f}")
+
+    print(f"({rows} insert، {threads} thread، پروفایل durable)")
+    print(f"{'':<22}{'rows/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        setup = sqlite3.connect(path)
+        apply_pragmas(setup, 'durable')
+        setup.execute("CREATE TABLE bench (id INTEGER PRIMARY KEY, user_id INTEGER, message_text TEXT, created_at REAL)")
+        setup.commit()
+        setup.close()
+
+        local = threading.local()
+
+        def commit_each(i):
+            conn = getattr(local, 'conn', None)
+            if conn is None:
+                conn = local.conn = sqlite3.connect(path, timeout=30)
+                apply_pragmas(conn, 'durable')
+            conn.execute(sql, (i, 'سلام', time.time()))
+            conn.commit()
+
+        run('commit per row', commit_each)
+
+        for durable in (True, False):
+            writer = WriteBehind(path, durable=durable, pragma_profile='durable')
+            writer.start()
+            run(f"write-behind durable={durable}", lambda i: writer.write(sql, (i, 'سلام', time.time())))
+            writer.stop()
+            s = writer.stats()
+            print(f"{'':<22}{s['batches']} commit، میانگین {s['batch_avg']:.0f} ردیف در هر commit")
+
+
+if __name__ == '__main__':
+    _benchmark()